@@ -0,0 +1,63 @@
+"""Tests of tetris_ai, the bot's placements and the actions that get the tetrominoe there."""
+import random
+import unittest
+
+from tetris_engine import LEFT, RIGHT, DOWN, TICK, CLOCKWISE, ANTICLOCKWISE, LAND, BAG, PLAYING, GameEngine
+from tetris_ai import AIPlayer
+
+MOVES = (LEFT, RIGHT, DOWN, TICK, CLOCKWISE, ANTICLOCKWISE)
+
+
+class PlacementsTest(unittest.TestCase):
+    def test_actions(self):
+        """
+        Each placement's actions, played through the engine, land the
+        tetrominoe where the placement says, on ragged boards with holes and
+        overhangs, from wherever the tetrominoe has been moved to.
+        """
+        rng = random.Random(1)
+        for max_x, max_y in ((10, 22), (4, 8), (13, 16)):
+            engine = GameEngine(max_x, max_y, mode=BAG)
+            player = AIPlayer(engine, lookahead=False)
+            landed = []
+            engine.subscribe(
+                lambda event, *args: event == LAND and landed.append((args[0].rotation, args[0].x, args[0].y))
+            )
+            for seed in range(3):
+                engine.new_game(seed)
+                while engine.state == PLAYING and engine.pieces < 60:
+                    for _ in range(rng.randint(0, 3)):
+                        engine.step(rng.choice(MOVES))
+                    if engine.state != PLAYING:
+                        break
+                    snapshot = engine.snapshot()
+                    shape = engine.shape
+                    placements = player.placements(
+                        snapshot.rows, type(shape), shape.rotation, shape.x, shape.y
+                    )
+                    self.assertTrue(placements)
+                    for placement in placements:
+                        engine.restore(snapshot)
+                        del landed[:]
+                        for action in placement.actions:
+                            engine.step(action)
+                        self.assertEqual(landed, [placement[:3]], placement)
+                    engine.restore(snapshot)
+                    # a bad placement now and then, so there are holes to slide under
+                    placement = None if rng.random() < 0.3 else player.choose()
+                    placement = placement or rng.choice(placements)
+                    for action in placement.actions:
+                        engine.step(action)
+
+    def test_lookahead_cache(self):
+        """The evaluations are cached with lookahead, when they come up again, and not without."""
+        for lookahead in (True, False):
+            engine = GameEngine()
+            player = AIPlayer(engine, lookahead=lookahead)
+            player.play_game(max_pieces=20, seed=1)
+            self.assertEqual(player.cache.hits > 0, lookahead)
+            self.assertEqual(len(player.cache) > 0, lookahead)
+
+
+if __name__ == "__main__":
+    unittest.main()
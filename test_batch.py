@@ -0,0 +1,86 @@
+"""Tests of tetris_batch, against the features of one board at a time counted a block at a time."""
+import random
+import unittest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from tetris_engine import MAXX, MAXY, SHAPES, BitBoard
+
+if np is not None:
+    import tetris_batch
+
+
+def random_boards(rng, n, max_x=MAXX, max_y=MAXY):
+    """BitBoards with ragged stacks, with holes in them."""
+    boards = []
+    for _ in range(n):
+        board = BitBoard(max_x, max_y)
+        height = rng.randint(0, max_y - 4)
+        for y in range(len(board.rows) - height, len(board.rows)):
+            board.rows[y] = rng.getrandbits(max_x) & board.full_row
+        boards.append(board)
+    return boards
+
+
+def count_features(rows, max_x):
+    """:return: (heights, holes, bumpiness) of a board, counted a block at a time."""
+    heights = []
+    holes = 0
+    for x in range(max_x):
+        column = [row >> x & 1 for row in rows]
+        top = column.index(1) if 1 in column else len(rows)
+        heights.append(len(rows) - top)
+        holes += column[top:].count(0)
+    bumpiness = sum(abs(left - right) for left, right in zip(heights, heights[1:]))
+    return heights, holes, bumpiness
+
+
+@unittest.skipIf(np is None, "needs NumPy")
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.boards = random_boards(random.Random(3), 50)
+        self.rows = tetris_batch.from_bitboards(self.boards)
+        self.cells = tetris_batch.unpack(self.rows)
+
+    def test_pack_unpack(self):
+        self.assertEqual(self.cells.shape, (50, MAXY, MAXX))
+        self.assertTrue((tetris_batch.pack(self.cells) == self.rows).all())
+
+    def test_evaluate(self):
+        features = tetris_batch.evaluate(self.cells)
+        for i, board in enumerate(self.boards):
+            rows = board.rows[board.HIDDEN:]
+            heights, holes, bumpiness = count_features(rows, MAXX)
+            self.assertEqual(list(features.heights[i]), heights)
+            self.assertEqual(features.holes[i], holes)
+            self.assertEqual(features.bumpiness[i], bumpiness)
+            self.assertEqual(features.complete_rows[i], sum(1 for row in rows if row == board.full_row))
+
+    def test_place(self):
+        """Each legal placement is four more blocks, resting on the stack or the floor."""
+        for shape_cls in SHAPES:
+            boards, legal = tetris_batch.place(self.cells, shape_cls)
+            for i, r, x in zip(*np.nonzero(legal)):
+                added = boards[i, r, x].astype(int) - self.cells[i]
+                self.assertEqual(added.min(), 0)
+                ys, xs = np.nonzero(added)
+                self.assertEqual(len(ys), 4)
+                resting = [
+                    y + 1 == MAXY or self.cells[i, y + 1, cx]
+                    for y, cx in zip(ys, xs)
+                ]
+                self.assertTrue(any(resting), (shape_cls.__name__, i, r, x))
+
+    def test_evaluate_placements(self):
+        results = tetris_batch.evaluate_placements(self.cells[:5])
+        self.assertEqual(set(results), set(SHAPES))
+        for shape_cls, (features, legal) in results.items():
+            self.assertEqual(features.holes.shape, legal.shape)
+            self.assertEqual(legal.shape, (5, len(tetris_batch.orientations(shape_cls)), MAXX))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,235 @@
+"""Tests of tetris_engine, the rules of the game without a display."""
+import random
+import unittest
+
+from tetris_engine import (
+    LEFT, DROP, CLOCKWISE, PAUSE, BAG, PLAYING, PAUSED, RESTORE, PREVIEW, SPAWN, SCORE, LEVEL, STATE, UNIFORM, SHAPES,
+    BitBoard, CachedFeatures, Coord, GameEngine, PieceSequence, column_tops
+)
+from tetris_ai import AIPlayer
+from tetris_testing import NUDGES, play, state
+
+
+class SnapshotTest(unittest.TestCase):
+    def test_restore(self):
+        """A restored game carries on as it did the first time."""
+        rng = random.Random(1)
+        engine = GameEngine(mode=BAG)
+        engine.new_game(1)
+        play(engine, rng, 30)
+        snapshot = engine.snapshot()
+        before = state(engine)
+        after = play(engine, random.Random(2), 100)
+        self.assertGreater(len(after), 200)
+
+        engine.restore(snapshot)
+        self.assertEqual(state(engine), before)
+        self.assertEqual(play(engine, random.Random(2), 100), after)
+
+    def test_restore_in_another_engine(self):
+        engine = GameEngine()
+        engine.new_game(2)
+        play(engine, random.Random(3), 30)
+        snapshot = engine.snapshot()
+        after = play(engine, random.Random(4), 100)
+        self.assertGreater(len(after), 200)
+
+        other = GameEngine(mode=BAG)
+        other.new_game(99)
+        other.restore(snapshot)
+        board = other.board
+        self.assertEqual(board.tops, column_tops(board.rows, board.max_x))
+        self.assertEqual(play(other, random.Random(4), 100), after)
+
+    def test_snapshot_unchanged_by_play(self):
+        engine = GameEngine()
+        engine.new_game(5)
+        play(engine, random.Random(5), 30)
+        snapshot = engine.snapshot()
+        rows = list(snapshot.rows)
+        play(engine, random.Random(6), 100)
+        self.assertNotEqual(list(engine.board.rows), rows)
+        self.assertEqual(list(snapshot.rows), rows)
+
+    def test_rows_shared(self):
+        """Snapshots taken while the same tetrominoe is in play share their rows."""
+        engine = GameEngine()
+        engine.new_game(6)
+        engine.step(DROP)
+        first = engine.snapshot()
+        engine.step(LEFT)
+        engine.step(CLOCKWISE)
+        self.assertIs(engine.snapshot().rows, first.rows)
+        engine.step(DROP)
+        self.assertIsNot(engine.snapshot().rows, first.rows)
+
+    def test_restore_events(self):
+        engine = GameEngine()
+        engine.new_game(7)
+        engine.step(PAUSE)
+        snapshot = engine.snapshot()
+        engine.step(PAUSE)
+        engine.step(DROP)
+        events = []
+        engine.subscribe(lambda event, *args: events.append(event))
+        engine.restore(snapshot)
+        self.assertEqual(events, [RESTORE, PREVIEW, SPAWN, SCORE, LEVEL, STATE])
+        self.assertEqual(engine.state, PAUSED)
+
+
+class BitBoardTest(unittest.TestCase):
+    def test_land_above_the_hidden_rows(self):
+        """Blocks landed above the hidden rows are lost, and the tops stay in the board."""
+        board = BitBoard(4, 6)
+        board.check_for_complete_row([Coord(1, -board.HIDDEN - 2), Coord(1, -board.HIDDEN - 1), Coord(1, -1)])
+        self.assertEqual(board.tops, column_tops(board.rows, board.max_x))
+        self.assertEqual(board.tops[1], board.HIDDEN - 1)
+        self.assertTrue(board.is_game_over())
+
+        # the board filled to above the hidden rows, and cleared, leaves the hidden rows at the bottom
+        board = BitBoard(4, 6)
+        board.check_for_complete_row([Coord(x, y) for x in range(4) for y in range(-board.HIDDEN - 3, 6)])
+        self.assertEqual(board.tops, [6] * 4)
+        self.assertEqual(board.tops, column_tops(board.rows, board.max_x))
+
+
+class PieceSequenceTest(unittest.TestCase):
+    def test_same_on_every_version(self):
+        """A seed deals the same tetrominoes on Python 2 and 3, so replays play the same."""
+        self.assertEqual(list(PieceSequence(5).pieces(0, 14)), [1, 2, 4, 2, 5, 0, 0, 0, 0, 0, 0, 2, 0, 1])
+        self.assertEqual(list(PieceSequence(5, BAG).pieces(0, 14)), [6, 0, 3, 5, 4, 2, 1, 3, 0, 5, 4, 2, 1, 6])
+
+    def test_bag(self):
+        """Each seven is a shuffled bag of all seven, across blocks too."""
+        sequence = PieceSequence(3, BAG)
+        pieces = sequence.pieces(0, PieceSequence.BLOCK * 3)
+        bags = set()
+        for start in range(0, len(pieces), len(SHAPES)):
+            bag = tuple(pieces[start:start + len(SHAPES)])
+            self.assertEqual(sorted(bag), list(range(len(SHAPES))))
+            bags.add(bag)
+        self.assertGreater(len(bags), 100)
+
+    def test_uniform(self):
+        pieces = PieceSequence(4).pieces(0, 7000)
+        for kind in range(len(SHAPES)):
+            self.assertTrue(800 < pieces.count(kind) < 1200, (kind, pieces.count(kind)))
+
+    def test_random_access(self):
+        """Any tetrominoe can be found without the ones before it."""
+        for mode in (UNIFORM, BAG):
+            pieces = PieceSequence(6, mode).pieces(0, PieceSequence.BLOCK * 3)
+            sequence = PieceSequence(6, mode)
+            rng = random.Random(6)
+            for i in [rng.randrange(len(pieces)) for _ in range(200)]:
+                self.assertEqual(sequence[i], pieces[i])
+            start = PieceSequence.BLOCK - 3
+            self.assertEqual(sequence.pieces(start, 10), pieces[start:start + 10])
+
+    def test_seeds(self):
+        self.assertEqual(PieceSequence(7).pieces(0, 50), PieceSequence(7).pieces(0, 50))
+        self.assertNotEqual(PieceSequence(7).pieces(0, 50), PieceSequence(8).pieces(0, 50))
+        self.assertEqual(PieceSequence(2 ** 64 - 1, BAG).pieces(0, 50), PieceSequence(2 ** 64 - 1, BAG).pieces(0, 50))
+
+    def test_split(self):
+        sequence = PieceSequence(9, BAG)
+        parts = sequence.split(4)
+        self.assertEqual([part.mode for part in parts], [BAG] * 4)
+        dealt = set(tuple(part.pieces(0, 50)) for part in parts + [sequence])
+        self.assertEqual(len(dealt), 5)
+        self.assertEqual([part.seed for part in sequence.split(4)], [part.seed for part in parts])
+
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, PieceSequence, 1, "tetris")
+
+    def test_engine_deals_the_sequence(self):
+        engine = GameEngine(mode=BAG)
+        engine.new_game(10)
+        expected = [SHAPES[kind] for kind in PieceSequence(10, BAG).pieces(0, 30)]
+        empty = (0,) * len(engine.board.rows)
+        dealt = []
+        while len(dealt) < 30:
+            dealt.append(type(engine.shape))
+            # an empty board, so the game isn't over
+            engine.restore(engine.snapshot()._replace(rows=empty))
+            engine.step(DROP)
+        self.assertEqual(dealt, expected)
+
+
+def count_features(rows, max_x):
+    """The features of a board, counted a block at a time, to check FeatureCache with."""
+    cells = [[row >> x & 1 for x in range(max_x)] for row in rows]
+    heights = []
+    holes = 0
+    for x in range(max_x):
+        column = [cell[x] for cell in cells]
+        top = column.index(1) if 1 in column else len(rows)
+        heights.append(len(rows) - top)
+        holes += column[top:].count(0)
+    transitions = 0
+    for cell in cells:
+        if any(cell):
+            walled = [1] + cell + [1]
+            transitions += sum(1 for left, right in zip(walled, walled[1:]) if left != right)
+    wells = 0
+    if max_x > 1:
+        # the walls are higher than any column
+        walled = [float("inf")] + heights + [float("inf")]
+        for x in range(max_x):
+            wells += max(min(walled[x], walled[x + 2]) - heights[x], 0)
+    bumpiness = sum(abs(left - right) for left, right in zip(heights, heights[1:]))
+    return CachedFeatures(tuple(heights), sum(heights), holes, transitions, wells, bumpiness)
+
+
+class FeatureCacheTest(unittest.TestCase):
+    def check(self, board):
+        self.assertEqual(board.features.vector(), count_features(board.rows, board.max_x))
+
+    def test_random_play(self):
+        """
+        The features kept up to date match those counted from scratch after
+        every landing, clear and garbage, on boards of many sizes.
+        """
+        rng = random.Random(1)
+        for max_x, max_y in ((10, 22), (4, 8), (17, 30), (64, 12)):
+            engine = GameEngine(max_x, max_y, features=True)
+            for seed in range(5):
+                engine.new_game(seed)
+                player = AIPlayer(engine, lookahead=False)
+                while engine.state == PLAYING and engine.pieces < 150:
+                    if rng.random() < 0.5:
+                        placement = player.choose()
+                        actions = placement.actions if placement else [DROP]
+                    else:
+                        actions = [rng.choice(NUDGES + (DROP,))]
+                    # the garbage is added when the tetrominoe lands
+                    if rng.random() < 0.03:
+                        engine.add_garbage(rng.randint(1, 3), rng.randrange(max_x))
+                    for action in actions:
+                        engine.step(action)
+                        self.check(engine.board)
+
+    def test_copy(self):
+        """A copy of a board has its own features."""
+        engine = GameEngine(features=True)
+        engine.new_game(2)
+        play(engine, random.Random(2), 20)
+        board = engine.board
+        copy = board.copy()
+        before = board.features.vector()
+        copy.check_for_complete_row(engine.shape.coords)
+        self.assertEqual(board.features.vector(), before)
+        self.check(board)
+        self.check(copy)
+
+    def test_restore(self):
+        engine = GameEngine(features=True)
+        engine.new_game(3)
+        snapshot = engine.snapshot()
+        play(engine, random.Random(3), 40)
+        engine.restore(snapshot)
+        self.check(engine.board)
+
+
+if __name__ == "__main__":
+    unittest.main()
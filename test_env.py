@@ -0,0 +1,58 @@
+"""Tests of tetris_env, the observations of many games stepped at once."""
+import random
+import unittest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from tetris_engine import SHAPES
+
+if np is not None:
+    from tetris_env import ACTIONS, VectorEnv
+
+
+@unittest.skipIf(np is None, "needs NumPy")
+class VectorEnvTest(unittest.TestCase):
+    def check(self, env):
+        """The observation arrays are the state of each engine."""
+        buffers = env.buffers
+        for i, engine in enumerate(env.engines):
+            board = engine.board
+            rows = board.rows[board.HIDDEN:]
+            self.assertEqual(buffers["board"][i].tolist(),
+                             [[row >> x & 1 for x in range(board.max_x)] for row in rows])
+            piece = [[0] * board.max_x for _ in rows]
+            for c in (engine.shape.coords if engine.shape else []):
+                if c.y >= 0:
+                    piece[c.y][c.x] = 1
+            self.assertEqual(buffers["piece"][i].tolist(), piece)
+            self.assertEqual(SHAPES[buffers["shape"][i]], type(engine.shape))
+            self.assertEqual(SHAPES[buffers["next"][i]], engine.next_shape)
+            self.assertEqual((buffers["score"][i], buffers["level"][i]), (engine.score, engine.level))
+
+    def test_random_actions(self):
+        rng = random.Random(1)
+        for max_x, max_y, gravity in ((10, 22, 1), (6, 10, 3), (13, 8, 0)):
+            env = VectorEnv(5, seed=1, max_x=max_x, max_y=max_y, gravity=gravity)
+            env.reset()
+            self.check(env)
+            games = 0
+            for _ in range(300):
+                scores = [engine.score for engine in env.engines]
+                obs, rewards, dones, infos = env.step(np.array([rng.randrange(len(ACTIONS)) for _ in scores]))
+                for i, engine in enumerate(env.engines):
+                    if dones[i]:
+                        games += 1
+                        self.assertEqual(engine.pieces, 1)
+                        self.assertEqual(rewards[i], infos["final_score"][i] - scores[i])
+                    else:
+                        self.assertEqual(rewards[i], engine.score - scores[i])
+                self.check(env)
+            # games ended, and were started again in their slots
+            self.assertGreater(games, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
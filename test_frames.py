@@ -0,0 +1,103 @@
+"""Tests of tetris_frames, games drawn as text and images."""
+import io
+import struct
+import unittest
+import zlib
+
+from tetris_engine import LEFT, RIGHT, TICK, DROP, GAME_OVER, ZShape, GameEngine
+from tetris_frames import PANEL, PNG_SIGNATURE, RGB, SHAPE_INDEX, FrameExporter
+
+MAX_X = 8
+MAX_Y = 8
+
+# The frame of play(): the board, the next tetrominoe beside it, and the status.
+BOARD = [
+    b"........|",
+    b"....Z...| I",
+    b"...ZZ...| I",
+    b"...Z....| I",
+    b"........| I",
+    b".Z.....Z|",
+    b"ZZ.TTTZZ|",
+    b"Z...T.Z.|",
+]
+ASCII = b"\n".join(line.ljust(MAX_X + PANEL) for line in BOARD) + b"\nscore 0 level 0 pieces 4\n\n"
+
+
+class FrameExporterTest(unittest.TestCase):
+    def play(self, format, **kwargs):
+        """
+        Three tetrominoes landed, and a Z falling.
+        :return: The exporter.
+        """
+        engine = GameEngine(MAX_X, MAX_Y)
+        exporter = FrameExporter(engine, format=format, **kwargs)
+        engine.new_game(1)
+        for action in (DROP, LEFT, LEFT, LEFT, DROP, RIGHT, RIGHT, RIGHT, DROP, TICK, TICK, TICK, TICK):
+            engine.step(action)
+        return exporter
+
+    def test_ascii(self):
+        exporter = self.play("ascii")
+        self.assertEqual(exporter.frame(), ASCII)
+
+        # garbage rows are drawn as #, with their gap
+        exporter.engine.add_garbage(1, 2)
+        exporter.engine.step(DROP)
+        lines = exporter.frame().split(b"\n")
+        self.assertEqual(lines[MAX_Y - 1], b"##.#####|".ljust(MAX_X + PANEL))
+        self.assertEqual(lines[MAX_Y - 2], BOARD[MAX_Y - 1].ljust(MAX_X + PANEL))
+
+    def test_ppm(self):
+        scale = 3
+        frame = self.play("ppm", scale=scale).frame()
+        width, height = (MAX_X + PANEL) * scale, MAX_Y * scale
+        header = "P6\n{0} {1}\n255\n".format(width, height).encode("ascii")
+        self.assertTrue(frame.startswith(header))
+        pixels = frame[len(header):]
+        self.assertEqual(len(pixels), width * height * 3)
+
+        def pixel(x, y):
+            offset = (y * width + x) * 3
+            return struct.unpack("BBB", pixels[offset:offset + 3])
+        # the top left of the Z falling, and its outline
+        self.assertEqual(pixel(4 * scale, 1 * scale), RGB[ZShape.COLOUR])
+        self.assertEqual(pixel(5 * scale - 1, 1 * scale), (0, 0, 0))
+
+    def test_png(self):
+        scale = 2
+        frame = self.play("png", scale=scale).frame()
+        self.assertTrue(frame.startswith(PNG_SIGNATURE))
+        chunks = {}
+        offset = len(PNG_SIGNATURE)
+        while offset < len(frame):
+            length, kind = struct.unpack(">I4s", frame[offset:offset + 8])
+            data = frame[offset + 8:offset + 8 + length]
+            crc = struct.unpack(">I", frame[offset + 8 + length:offset + 12 + length])[0]
+            self.assertEqual(crc, zlib.crc32(kind + data) & 0xffffffff)
+            chunks[kind] = data
+            offset += 12 + length
+        self.assertEqual(sorted(chunks), [b"IDAT", b"IEND", b"IHDR", b"PLTE"])
+        width, height, depth, colour_type = struct.unpack(">IIBB", chunks[b"IHDR"][:10])
+        self.assertEqual((width, height, depth, colour_type), ((MAX_X + PANEL) * scale, MAX_Y * scale, 8, 3))
+        # a filter byte and a palette index a pixel, for each line
+        pixels = zlib.decompress(chunks[b"IDAT"])
+        self.assertEqual(len(pixels), height * (1 + width))
+        self.assertEqual(bytearray(pixels)[1 * scale * (1 + width) + 1 + 4 * scale], SHAPE_INDEX[ZShape])
+
+    def test_write(self):
+        """A frame for every tetrominoe, and one at game over."""
+        out = io.BytesIO()
+        engine = GameEngine(MAX_X, MAX_Y)
+        exporter = FrameExporter(engine, out, every="piece")
+        engine.new_game(1)
+        while engine.state != GAME_OVER:
+            engine.step(DROP)
+        self.assertEqual(exporter.frames, engine.pieces)
+        frames = out.getvalue().split(b"\n\n")[:-1]
+        self.assertEqual(len(frames), exporter.frames)
+        self.assertTrue(frames[-1].endswith("pieces {0}".format(engine.pieces).encode("ascii")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+"""Tests of tetris_input, key presses and held keys on a fake clock."""
+import unittest
+
+from tetris_engine import LEFT, RIGHT, DOWN, CLOCKWISE
+from tetris_input import InputQueue, MAX_REPEATS
+from tetris_testing import Clock
+
+
+class InputQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.queue = InputQueue(das=170, arr=50, clock=self.clock)
+
+    def press(self, action, ms):
+        self.clock.now = ms / 1000.0
+        self.queue.press(action, ms)
+
+    def release(self, action, ms):
+        self.clock.now = ms / 1000.0
+        self.queue.release(action, ms)
+
+    def at(self, ms):
+        """:return: The actions polled at ms."""
+        self.clock.now = ms / 1000.0
+        return self.queue.poll()
+
+    def test_press(self):
+        """A key press is applied at the next poll, once."""
+        self.press(CLOCKWISE, 1)
+        self.press(LEFT, 2)
+        self.assertEqual(self.at(16), [CLOCKWISE, LEFT])
+        self.assertEqual(self.at(32), [])
+
+    def test_das(self):
+        """A held move key doesn't repeat until DAS, then once every ARR."""
+        self.press(LEFT, 0)
+        self.assertEqual(self.at(0), [LEFT])
+        self.assertEqual(self.at(100), [])
+        self.assertEqual(self.at(169), [])
+        self.assertEqual(self.at(170), [LEFT])
+        self.assertEqual(self.at(200), [])
+        self.assertEqual(self.at(221), [LEFT])
+        # a late poll gets the repeats that are due
+        self.assertEqual(self.at(321), [LEFT, LEFT])
+        self.release(LEFT, 330)
+        self.assertEqual(self.at(400), [])
+
+    def test_max_repeats(self):
+        self.press(DOWN, 0)
+        self.at(0)
+        self.assertEqual(self.at(10000), [DOWN] * MAX_REPEATS)
+        # and starts again from then
+        self.assertEqual(self.at(10049), [])
+        self.assertEqual(self.at(10050), [DOWN])
+
+    def test_arr_0(self):
+        queue = InputQueue(das=100, arr=0, clock=self.clock)
+        queue.press(RIGHT, 0)
+        self.assertEqual(queue.poll(), [RIGHT])
+        self.clock.now = 0.1
+        self.assertEqual(queue.poll(), [RIGHT] * MAX_REPEATS)
+
+    def test_x11_repeats(self):
+        """The operating system's repeats, a release and press at the same time on X11, are ignored."""
+        self.press(LEFT, 0)
+        self.assertEqual(self.at(0), [LEFT])
+        for ms in range(30, 170, 30):
+            self.release(LEFT, ms)
+            self.press(LEFT, ms)
+            self.assertEqual(self.at(ms + 1), [])
+        self.assertEqual(self.at(170), [LEFT])
+
+    def test_repeats_without_releases(self):
+        """Elsewhere the repeats are presses alone."""
+        self.press(DOWN, 0)
+        self.press(DOWN, 30)
+        self.press(DOWN, 60)
+        self.assertEqual(self.at(60), [DOWN])
+
+    def test_press_again(self):
+        """A key released and pressed again is two presses."""
+        self.press(CLOCKWISE, 0)
+        self.at(0)
+        self.release(CLOCKWISE, 50)
+        self.press(CLOCKWISE, 80)
+        self.assertEqual(self.at(90), [CLOCKWISE])
+
+    def test_last_direction_wins(self):
+        """Of left and right, only the last pressed repeats, and releasing it goes back to the other after DAS."""
+        self.press(LEFT, 0)
+        self.at(0)
+        self.assertEqual(self.at(200), [LEFT])
+        self.press(RIGHT, 210)
+        self.assertEqual(self.at(210), [RIGHT])
+        # left is still held, but only right repeats
+        self.assertEqual(self.at(379), [])
+        self.assertEqual(self.at(381), [RIGHT])
+        self.release(RIGHT, 400)
+        self.assertEqual(self.at(400), [])
+        self.assertEqual(self.at(569), [])
+        self.assertEqual(self.at(571), [LEFT])
+
+    def test_clear(self):
+        self.press(LEFT, 0)
+        self.queue.clear()
+        self.assertEqual(self.at(500), [])
+        self.assertEqual(self.queue.pressed_at, [])
+
+    def test_pressed_at(self):
+        """The times the key presses were queued, for their latency."""
+        self.press(LEFT, 4)
+        self.press(CLOCKWISE, 10)
+        self.at(16)
+        self.assertEqual(self.queue.pressed_at, [0.004, 0.010])
+        # repeats aren't key presses
+        self.assertEqual(self.at(300), [LEFT] * 3)
+        self.assertEqual(self.queue.pressed_at, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+"""Tests of tetris_replay, recording games and playing them back."""
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from tetris_engine import ACTION, UNIFORM, BAG, PLAYING, GameEngine
+from tetris_replay import HEADER, TRAILER, Recorder, Replay, read_varint, write_varint, zigzag, unzigzag
+from tetris_testing import MOVES, state
+
+
+class VarintTest(unittest.TestCase):
+    def test_round_trip(self):
+        values = [0, 1, 0x7f, 0x80, 300, 2 ** 32, 2 ** 64 - 1, 2 ** 100]
+        out = bytearray()
+        for value in values:
+            write_varint(out, value)
+        data = bytes(out)
+        offset = 0
+        for value in values:
+            read, offset = read_varint(data, offset)
+            self.assertEqual(read, value)
+        self.assertEqual(offset, len(data))
+
+    def test_zigzag(self):
+        for value in range(-300, 300):
+            self.assertGreaterEqual(zigzag(value), 0)
+            self.assertEqual(unzigzag(zigzag(value)), value)
+
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "game.ttr")
+        self.replays = []
+
+    def tearDown(self):
+        for replay in self.replays:
+            replay.close()
+        shutil.rmtree(self.dir)
+
+    def open(self, path):
+        replay = Replay(path)
+        self.replays.append(replay)
+        return replay
+
+    def record(self, seed, mode, pieces=120):
+        """
+        Record a game of random moves, with the times between them.
+        :return: The state at the start of each tetrominoe, and at the end.
+        """
+        rng = random.Random(seed)
+        now = [0.0]
+        engine = GameEngine(mode=mode)
+        recorder = Recorder(engine, self.path, keyframe_interval=8, clock=lambda: now[0])
+        states = {}
+
+        def engine_event(event, *args):
+            if event == ACTION and engine.pieces not in states:
+                states[engine.pieces] = state(engine)
+        engine.subscribe(engine_event)
+
+        engine.new_game(seed)
+        while engine.state == PLAYING and engine.pieces < pieces:
+            now[0] += rng.choice((0.001, 0.014, 0.016, 0.5, 3.0))
+            engine.step(rng.choice(MOVES))
+        recorder.close()
+        return states, state(engine)
+
+    def test_play(self):
+        for seed, mode in ((1, UNIFORM), (2, BAG)):
+            states, final = self.record(seed, mode)
+            replay = self.open(self.path)
+            self.assertEqual(replay.seed, seed)
+            self.assertEqual(state(replay.play()), final)
+
+    def test_seek(self):
+        states, final = self.record(3, BAG)
+        replay = self.open(self.path)
+        self.assertTrue(replay.keyframes)
+        for piece in sorted(states):
+            engine = replay.seek(piece)
+            self.assertEqual(state(engine), states[piece], piece)
+        self.assertEqual(state(replay.seek(10 ** 6)), final)
+
+    def test_actions(self):
+        self.record(4, BAG, pieces=20)
+        replay = self.open(self.path)
+        times = [time_ms for time_ms, action in replay.actions()]
+        self.assertEqual(times, sorted(times))
+        self.assertTrue(all(action in MOVES for time_ms, action in replay.actions()))
+
+    def test_without_index(self):
+        """A file that is still being written is scanned for its keyframes."""
+        states, final = self.record(5, BAG)
+        with open(self.path, "rb") as f:
+            data = f.read()
+        index = TRAILER.unpack_from(data, len(data) - TRAILER.size)[0]
+        path = os.path.join(self.dir, "partial.ttr")
+        with open(path, "wb") as f:
+            f.write(data[:index - 1])
+        replay = self.open(path)
+        self.assertEqual(replay.keyframes, self.open(self.path).keyframes)
+        piece = max(states) - 1
+        self.assertEqual(state(replay.seek(piece)), states[piece])
+
+    def test_not_a_replay(self):
+        with open(self.path, "wb") as f:
+            f.write(b"\0" * HEADER.size)
+        self.assertRaises(ValueError, Replay, self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
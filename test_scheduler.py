@@ -0,0 +1,80 @@
+"""Tests of tetris_scheduler, the gravity ticks on a fake clock."""
+import unittest
+
+from tetris_scheduler import TickScheduler
+from tetris_testing import Clock
+
+
+class TickSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.delay = 500
+        self.scheduler = TickScheduler(lambda: self.delay, clock=self.clock, max_catch_up=5)
+        self.scheduler.start()
+
+    def at(self, seconds):
+        """:return: The ticks due at seconds."""
+        self.clock.now = seconds
+        return self.scheduler.due()
+
+    def test_on_time(self):
+        self.assertEqual(self.scheduler.wait_ms(), 500)
+        self.assertEqual(self.at(0.499), 0)
+        self.assertEqual(self.at(0.5), 1)
+        self.assertEqual(self.at(0.5), 0)
+        self.assertEqual(self.scheduler.wait_ms(), 500)
+
+    def test_no_drift(self):
+        """A late tick doesn't make the ones after it late, the wait is shortened."""
+        self.assertEqual(self.at(0.6), 1)
+        self.assertEqual(self.scheduler.wait_ms(), 400)
+        self.assertEqual(self.at(1.0), 1)
+
+    def test_catch_up(self):
+        """A late callback gets every tick that is due, in one go."""
+        self.assertEqual(self.at(1.6), 3)
+        self.assertEqual(self.scheduler.wait_ms(), 400)
+        self.assertEqual(self.at(2.0), 1)
+
+    def test_max_catch_up(self):
+        """More than max_catch_up late are dropped, and the ticks start again from now."""
+        self.assertEqual(self.at(60.0), 5)
+        self.assertEqual(self.scheduler.wait_ms(), 500)
+        self.assertEqual(self.at(60.4), 0)
+        self.assertEqual(self.at(60.5), 1)
+
+    def test_delay_changes(self):
+        """The delay is read for each tick, as the level changes it."""
+        self.assertEqual(self.at(0.5), 1)
+        self.delay = 100
+        self.assertEqual(self.at(1.0), 1)
+        self.assertEqual(self.at(1.31), 3)
+
+    def test_pause(self):
+        """The time left at pause() is kept, however long the pause."""
+        self.clock.now = 0.2
+        self.scheduler.pause()
+        self.assertEqual(self.scheduler.remaining, 0.3)
+        self.clock.now = 100.0
+        self.scheduler.resume()
+        self.assertIsNone(self.scheduler.remaining)
+        self.assertEqual(self.scheduler.wait_ms(), 300)
+        self.assertEqual(self.at(100.29), 0)
+        self.assertEqual(self.at(100.3), 1)
+
+    def test_pause_when_due(self):
+        self.clock.now = 0.7
+        self.scheduler.pause()
+        self.assertEqual(self.scheduler.remaining, 0.0)
+        self.clock.now = 5.0
+        self.scheduler.resume()
+        self.assertEqual(self.at(5.0), 1)
+
+    def test_resume_without_pause(self):
+        self.clock.now = 0.2
+        self.scheduler.resume()
+        self.assertEqual(self.scheduler.wait_ms(), 300)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+"""Tests of tetris_server, clients playing, watching and in versus over TCP on one event loop."""
+import json
+import sys
+import unittest
+
+from tetris_engine import LEFT, DROP, PLAYING, SquareShape, GameEngine
+from tetris_stream import Decoder
+
+if sys.version_info >= (3,):
+    import asyncio
+    from tetris_server import GARBAGE_LINES, MAX_LINE, GameServer
+
+    class Client(asyncio.Protocol):
+        """A client, that keeps the messages it is sent, or feeds a Decoder once it is watching."""
+        def __init__(self):
+            self.transport = None
+            self.data = b""
+            self.decoder = None
+            self.closed = False
+
+        def connection_made(self, transport):
+            self.transport = transport
+
+        def data_received(self, data):
+            if self.decoder:
+                self.decoder.feed(data)
+            else:
+                self.data += data
+
+        def connection_lost(self, exc):
+            self.closed = True
+
+        def send(self, message):
+            self.transport.write(json.dumps(message).encode("utf-8") + b"\n")
+
+
+@unittest.skipIf(sys.version_info < (3,), "needs Python 3, for asyncio")
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.server = GameServer(seed=1, loop=self.loop)
+        self.listener = self.loop.run_until_complete(self.server.listen())
+        self.port = self.listener.sockets[0].getsockname()[1]
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.transport.close()
+        self.run_until(lambda: not self.server.sessions)
+        self.listener.close()
+        self.loop.run_until_complete(self.listener.wait_closed())
+        self.loop.close()
+
+    def run_until(self, done, timeout=5):
+        deadline = self.loop.time() + timeout
+        while not done():
+            self.assertLess(self.loop.time(), deadline, "timed out")
+            self.loop.run_until_complete(asyncio.sleep(0.001))
+
+    def connect(self):
+        transport, client = self.loop.run_until_complete(
+            self.loop.create_connection(Client, "127.0.0.1", self.port)
+        )
+        self.clients.append(client)
+        return client
+
+    def receive(self, client):
+        """:return: The next message sent to client."""
+        self.run_until(lambda: b"\n" in client.data)
+        line, client.data = client.data.split(b"\n", 1)
+        return json.loads(line.decode("utf-8"))
+
+    def receive_until(self, client, key):
+        """:return: The next message sent to client with key in it."""
+        while True:
+            message = self.receive(client)
+            if key in message:
+                return message
+
+    def engine(self, client):
+        """:return: The server's engine of the game client is playing."""
+        address = client.transport.get_extra_info("sockname")
+        for session in self.server.sessions.values():
+            if session.transport.get_extra_info("peername") == address:
+                return session.engine
+
+    def test_play(self):
+        """A game sent over the socket is the game the engine plays with its seed."""
+        client = self.connect()
+        client.send({"new_game": {"seed": 5}})
+        game = self.receive(client)["game"]
+        state = self.receive(client)
+        self.assertEqual((state["state"], state["score"], state["pieces"]), (PLAYING, 0, 1))
+
+        engine = GameEngine()
+        engine.new_game(5)
+        for action in (LEFT, DROP, DROP):
+            client.send({"action": action})
+            engine.step(action)
+        # there may be ticks in between, but no tetrominoe lands in them
+        state = self.receive(client)
+        while state.get("pieces") != engine.pieces:
+            state = self.receive(client)
+        self.assertEqual(state["rows"], list(engine.board.rows[engine.board.HIDDEN:]))
+        self.assertEqual(state["next"], engine.next_shape.__name__)
+        self.assertIn(game, self.server.sessions)
+
+    def test_bad_messages(self):
+        client = self.connect()
+        client.send({"new_game": {"seed": 5}})
+        self.receive_until(client, "state")
+        for line in (b"[" * 3000, b"[]", b"{", b'{"action": "tick"}', b'{"new_game": {"seed": -1}}'):
+            client.transport.write(line + b"\n")
+            self.assertIn("error", self.receive(client))
+        # and the game carries on
+        client.send({"action": DROP})
+        self.assertEqual(self.receive_until(client, "pieces")["pieces"], 2)
+
+        # a line that is too long is refused, even with a newline after it
+        client.transport.write(b'{"action": "left"}\n' + b" " * (MAX_LINE + 1) + b"\n")
+        self.assertEqual(self.receive(client), {"error": "message too long"})
+        self.run_until(lambda: client.closed)
+
+    def test_watch(self):
+        player = self.connect()
+        player.send({"new_game": {"seed": 6}})
+        game = self.receive(player)["game"]
+        player.send({"action": DROP})
+        self.receive_until(player, "rows")
+
+        spectator = self.connect()
+        spectator.send({"watch": game})
+        self.assertEqual(self.receive(spectator), {"watching": game})
+        spectator.decoder = Decoder()
+        spectator.decoder.feed(spectator.data)
+        engine = self.engine(player)
+        for _ in range(5):
+            player.send({"action": DROP})
+            self.receive_until(player, "rows")
+            self.run_until(lambda: spectator.decoder.engine.pieces == engine.pieces)
+            self.assertEqual(list(spectator.decoder.engine.board.rows), list(engine.board.rows))
+            self.assertEqual(spectator.decoder.engine.score, engine.score)
+
+        # until the player disconnects
+        player.transport.close()
+        self.run_until(lambda: spectator.closed)
+
+    def test_versus(self):
+        first = self.connect()
+        first.send({"versus": "room"})
+        self.assertEqual(self.receive(first), {"waiting": "room"})
+        # the game played before isn't played while waiting
+        first.send({"action": LEFT})
+        self.assertEqual(self.receive(first), {"error": "waiting for an opponent"})
+
+        second = self.connect()
+        second.send({"versus": "room"})
+        games = [self.receive(client)["game"] for client in (first, second)]
+        self.assertNotEqual(games[0], games[1])
+        engines = [self.engine(client) for client in (first, second)]
+        self.assertEqual(engines[0].seed, engines[1].seed)
+
+        # the first clears two rows with a square, on the bottom rows full but for its landing
+        engine = engines[0]
+        engine.restore(engine.snapshot()._replace(shape=SquareShape))
+        distance = engine.shape.drop_distance()
+        # rows[0] is the top of the blocks hidden above the board
+        landing = [(x, y + distance + engine.board.HIDDEN) for x, y in engine.shape.coords]
+        rows = list(engine.board.rows)
+        for y in set(y for x, y in landing):
+            rows[y] = engine.board.full_row & ~sum(1 << x for x, landed_y in landing if landed_y == y)
+        engine.restore(engine.snapshot()._replace(rows=tuple(rows)))
+        first.send({"action": DROP})
+        lines = GARBAGE_LINES[2]
+        self.assertEqual(self.receive_until(second, "garbage")["garbage"], lines)
+
+        # which the second's board gets when its tetrominoe lands
+        second.send({"action": DROP})
+        rows = self.receive_until(second, "rows")["rows"]
+        max_x = engines[1].board.max_x
+        self.assertEqual([bin(row).count("1") for row in rows[-lines:]], [max_x - 1] * lines)
+
+        # and the last one playing wins
+        first.transport.close()
+        self.assertEqual(self.receive_until(second, "result"), {"result": "win"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+"""Tests of tetris_stats, the ring buffers of timings and their summaries."""
+import unittest
+
+from tetris_stats import BUCKETS, RingBuffer, Stats, histogram, percentile
+
+
+class StatsTest(unittest.TestCase):
+    def test_ring_buffer(self):
+        buf = RingBuffer(4)
+        for value in range(6):
+            buf.add(value)
+        self.assertEqual(len(buf), 4)
+        self.assertEqual(buf.count, 6)
+        self.assertEqual(buf.values(), [2, 3, 4, 5])
+
+    def test_percentile(self):
+        values = list(range(101))
+        self.assertEqual([percentile(values, p) for p in (0, 50, 99, 100)], [0, 50, 99, 100])
+        self.assertIsNone(percentile([], 50))
+
+    def test_histogram(self):
+        # a bucket has the values up to and including its bound
+        values = [0.0005, 0.001, 0.0011, 0.003, 0.016, 0.0161, 1.0]
+        self.assertEqual(histogram(values), [2, 1, 1, 0, 1, 1, 0, 1])
+        self.assertEqual(len(histogram([])), len(BUCKETS) + 1)
+
+    def test_timed(self):
+        stats = Stats()
+        sections = []
+        stats.hooks.append(lambda name, start, end: sections.append((name, end >= start)))
+
+        def double(x):
+            sections.append(stats.section)
+            return 2 * x
+        self.assertEqual(stats.timed("double", double)(4), 8)
+        self.assertEqual(sections, ["double", ("double", True)])
+        self.assertIsNone(stats.section)
+        self.assertEqual(stats.buffers["double"].count, 1)
+
+    def test_report(self):
+        stats = Stats()
+        for ms in (0.5, 0.5, 3, 20):
+            stats.add("tick", ms / 1000.0)
+        stats.add("canvas_items", 200)
+        summary = stats.summary()
+        self.assertEqual(summary["tick"]["histogram"], [2, 0, 1, 0, 0, 1, 0, 0])
+        self.assertNotIn("histogram", summary["canvas_items"])
+        self.assertEqual(stats.report(), "canvas_items: 200\ntick: 3.00/20.00/20.00 ms")
+        lines = stats.histograms().split("\n")
+        self.assertEqual(lines[0].split(), ["1", "2", "4", "8", "16", "33", "66", ">", "ms"])
+        self.assertEqual(lines[1].split(), ["tick", "50", ".", "25", ".", ".", "25", ".", "."])
+        self.assertEqual(Stats().histograms(), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+"""Tests of tetris_stream, a game encoded for spectators and decoded again."""
+import random
+import unittest
+
+from tetris_engine import DROP, UNIFORM, BAG, PLAYING, GAME_OVER, GARBAGE, GameEngine
+from tetris_stream import Encoder, Decoder, Broadcast
+from tetris_testing import MOVES, state
+
+
+class StreamTest(unittest.TestCase):
+    def play(self, engine, broadcast, rng, steps, watch):
+        """
+        Random moves, with garbage and snapshots restored, publishing a
+        frame after each, and calling watch() after each frame.
+        """
+        snapshot = None
+        for _ in range(steps):
+            if engine.state == GAME_OVER:
+                engine.new_game(rng.randrange(1000))
+            engine.step(rng.choice(MOVES))
+            if rng.random() < 0.02:
+                engine.add_garbage(rng.randint(1, 3), rng.randrange(engine.board.max_x))
+            if rng.random() < 0.01:
+                snapshot = engine.snapshot()
+            elif snapshot and rng.random() < 0.005:
+                engine.restore(snapshot)
+            broadcast.publish()
+            watch()
+
+    def test_round_trip(self):
+        for seed, mode in ((1, UNIFORM), (2, BAG)):
+            rng = random.Random(seed)
+            engine = GameEngine(mode=mode)
+            broadcast = Broadcast(Encoder(engine, keyframe_interval=4))
+            engine.new_game(seed)
+            decoder = Decoder()
+            broadcast.subscribe(decoder.feed)
+
+            def watch():
+                self.assertEqual(state(decoder.engine), state(engine))
+            self.play(engine, broadcast, rng, 2000, watch)
+
+    def test_partial_feeds(self):
+        """Frames split anywhere are applied once the rest of them comes."""
+        rng = random.Random(3)
+        engine = GameEngine(max_x=7, max_y=14)
+        broadcast = Broadcast(Encoder(engine))
+        engine.new_game(3)
+        decoder = Decoder()
+        received = []
+        broadcast.subscribe(received.append)
+
+        def watch():
+            data = b"".join(received)
+            del received[:]
+            while data:
+                split = rng.randint(0, len(data))
+                decoder.feed(data[:split])
+                data = data[split:]
+            self.assertEqual(state(decoder.engine), state(engine))
+        self.play(engine, broadcast, rng, 2000, watch)
+
+    def test_late_and_slow_subscribers(self):
+        rng = random.Random(4)
+        engine = GameEngine()
+        broadcast = Broadcast(Encoder(engine), max_pending=256)
+        engine.new_game(4)
+        self.play(engine, broadcast, rng, 300, lambda: None)
+
+        late = Decoder()
+        broadcast.subscribe(late.feed)
+        self.assertEqual(state(late.engine), state(engine))
+
+        slow = Decoder()
+        subscriber = broadcast.subscribe(slow.feed)
+        subscriber.pause()
+        self.play(engine, broadcast, rng, 500, lambda: None)
+        self.assertLessEqual(subscriber.pending_bytes, 256 + 1024)
+        subscriber.resume()
+        self.assertEqual(state(slow.engine), state(engine))
+        self.assertEqual(state(late.engine), state(engine))
+
+    def test_garbage_events(self):
+        """The decoder's engine emits the garbage, for a GUI to draw it."""
+        engine = GameEngine()
+        broadcast = Broadcast(Encoder(engine))
+        engine.new_game(5)
+        decoder = Decoder()
+        broadcast.subscribe(decoder.feed)
+        events = []
+        decoder.engine.subscribe(lambda event, *args: events.append((event,) + args))
+        engine.add_garbage(2, 3)
+        engine.step(DROP)
+        broadcast.publish()
+        self.assertIn((GARBAGE, 2, 3), events)
+        self.assertEqual(state(decoder.engine), state(engine))
+        self.assertEqual(decoder.engine.state, PLAYING)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+"""Tests of tetris_telemetry, the metrics of each game and the log they are written to."""
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from tetris_engine import DROP, PAUSE, PLAYING, GAME_OVER, BAG, NO_OF_LEVELS, GameEngine
+from tetris_ai import AIPlayer
+from tetris_telemetry import CLEAR_SIZES, COLUMNS, GameTelemetry, TelemetryLog, flatten, read_columns
+from tetris_testing import Clock
+
+
+class TelemetryTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def play(self, log, games=3):
+        """
+        Play games with the bot, half a second a tetrominoe, pausing for
+        100s in each, then a game dropped straight to the top.
+        :return: The engine's (score, pieces landed, level) of each game.
+        """
+        clock = Clock()
+        engine = GameEngine(mode=BAG)
+        telemetry = GameTelemetry(engine, log, clock=clock)
+        player = AIPlayer(engine, lookahead=False)
+        games_played = []
+        for seed in range(games):
+            engine.new_game(seed)
+            while engine.state == PLAYING and engine.pieces < 60:
+                player.play_piece()
+                clock.now += 0.5
+                if engine.pieces == 20:
+                    engine.step(PAUSE)
+                    clock.now += 100
+                    engine.step(PAUSE)
+            # the tetrominoe in play hasn't landed yet
+            games_played.append((engine.score, engine.pieces - 1, engine.level))
+        engine.new_game(games)
+        while engine.state == PLAYING:
+            engine.step(DROP)
+            clock.now += 0.1
+        telemetry.close()
+        return games_played
+
+    def test_jsonl(self):
+        path = os.path.join(self.dir, "games.jsonl")
+        log = TelemetryLog(path, interval=60)
+        games = self.play(log)
+        log.close()
+        self.assertEqual(log.records, 4)
+        with io.open(path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([(r["score"], r["pieces"], r["level"]) for r in records[:3]], games)
+        self.assertEqual([r["over"] for r in records], [False, False, False, True])
+        self.assertEqual([r["seed"] for r in records], [0, 1, 2, 3])
+        self.assertEqual(records[0]["mode"], BAG)
+        for record in records[:3]:
+            # the pause isn't counted
+            self.assertAlmostEqual(record["seconds"], record["pieces"] * 0.5)
+            self.assertAlmostEqual(sum(record["level_seconds"]), record["seconds"])
+            self.assertEqual(len(record["lines"]), CLEAR_SIZES)
+            self.assertEqual(len(record["level_seconds"]), NO_OF_LEVELS + 1)
+        over = records[3]
+        self.assertEqual(over["peak_height"], 22)
+        self.assertGreater(over["pieces"], 0)
+
+    def test_columns(self):
+        jsonl = os.path.join(self.dir, "games.jsonl")
+        columns = os.path.join(self.dir, "games.bin")
+        # a small max_pending, so more than one block is written
+        logs = [TelemetryLog(jsonl, interval=60), TelemetryLog(columns, "columns", interval=60, max_pending=2)]
+        for log in logs:
+            self.play(log)
+            log.close()
+        # appending again doesn't write the header again
+        log = TelemetryLog(columns, "columns", interval=60)
+        self.play(log, games=1)
+        log.close()
+
+        with io.open(jsonl, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        read = read_columns(columns)
+        self.assertEqual(sorted(read), sorted(COLUMNS))
+        self.assertEqual(len(read["score"]), 6)
+        for i, record in enumerate(records):
+            for name, value in flatten(record):
+                # the games are played again, all but the time they started
+                if name != "time":
+                    self.assertAlmostEqual(read[name][i], value, msg=name)
+        self.assertEqual(read["seed"][4:], [0.0, 1.0])
+
+    def test_not_a_log(self):
+        path = os.path.join(self.dir, "games.jsonl")
+        with io.open(path, "wb") as f:
+            f.write(b"{}\n")
+        self.assertRaises(ValueError, read_columns, path)
+        self.assertRaises(ValueError, TelemetryLog, path, "csv")
+
+    def test_restore(self):
+        """A game put back to a snapshot carries on in the same record, to the end of the game."""
+        records = []
+
+        class Log(object):
+            append = records.append
+        engine = GameEngine()
+        GameTelemetry(engine, Log(), clock=Clock())
+        engine.new_game(1)
+        engine.step(DROP)
+        snapshot = engine.snapshot()
+        for _ in range(3):
+            engine.step(DROP)
+        engine.restore(snapshot)
+        self.assertEqual(records, [])
+        landed = 0
+        while engine.state != GAME_OVER:
+            if engine.shape:
+                landed += 1
+            engine.step(DROP)
+        self.assertEqual(len(records), 1)
+        record = records[0]
+        self.assertTrue(record["over"])
+        self.assertEqual(record["restores"], 1)
+        self.assertEqual(record["pieces"], 1 + landed)
+        self.assertEqual(record["score"], engine.score)
+
+        # a snapshot of the game, after it was logged, is a new record
+        engine.restore(snapshot)
+        engine.new_game(2)
+        self.assertEqual(len(records), 2)
+        self.assertEqual((records[1]["seed"], records[1]["restores"], records[1]["pieces"]), (1, 1, 1))
+
+        # as is a snapshot of another game
+        engine.step(DROP)
+        engine.restore(snapshot)
+        self.assertEqual([record["seed"] for record in records], [1, 1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+"""Tetris AI - a bot that plays Tetris Tk by searching every placement.
+
+For the tetrominoe in play the bot finds every placement it can reach with
+the same moves, rotations and wall kicks as the game itself: rotate and move
+along the spawn row, drop, and then slide under overhangs and drop again.
+Each placement is scored by an evaluator, a function of the Features of the
+board after the tetrominoe has landed and the complete rows are deleted. With
+lookahead, the best few placements are scored again by the best placement
+of the next tetrominoe after them, the one shown in the preview panel. The
+rows those two delete count together, in the Features of the board after
+the second, so any evaluator gets the credit for them.
+
+Boards are hashed by their rows and the rows deleted, and evaluated
+positions are kept in a bounded cache with the least recently used evicted.
+With lookahead, the boards after the next tetrominoe are evaluated again
+when it is in play, and are found in the cache: about one in six
+evaluations, for seed 1. Without lookahead boards hardly ever come up again,
+so the cache isn't used.
+
+The chosen placement is played through GameEngine.step(), with the same
+actions as a player's key presses.
+
+    python tetris_ai.py --games 10 --seed 1
+"""
+from __future__ import print_function
+
+import time
+from collections import namedtuple, OrderedDict
+
+from tetris_engine import (
+    MAXX, MAXY, LEFT, RIGHT, DOWN, DROP, CLOCKWISE, ANTICLOCKWISE, PLAYING, UNIFORM, BAG, BitBoard, FeatureCache,
+    GameEngine
+)
+
+# Features of a board, used to evaluate a placement.
+Features = namedtuple("Features", ['lines', 'heights', 'aggregate_height', 'holes', 'bumpiness', 'max_height'])
+
+# A placement of a tetrominoe, where it lands and the actions to get it there.
+Placement = namedtuple("Placement", ['rotation', 'x', 'y', 'actions'])
+
+
+def weighted_evaluator(features):
+    """
+    The default evaluator, a weighted sum of the features. Higher is better.
+    """
+    return (0.760666 * features.lines
+            - 0.510066 * features.aggregate_height
+            - 0.35663 * features.holes
+            - 0.184483 * features.bumpiness)
+
+
+class LRUCache(object):
+    """
+    A dict with a maximum size, that evicts the least recently used key.
+    """
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, default=None):
+        try:
+            value = self.data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.data[key] = value
+        return value
+
+    def put(self, key, value):
+        self.data.pop(key, None)
+        self.data[key] = value
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def clear(self):
+        self.data.clear()
+
+
+def board_features(rows, max_x, lines):
+    """
+    :param rows: Row bit masks, as BitBoard.rows, after complete rows are deleted.
+    :param max_x: Width of the board.
+    :param lines: Number of rows deleted.
+    :return: Features of the board.
+    """
+    heights = [0] * max_x
+    holes = 0
+    seen = 0
+    for y, row in enumerate(rows):
+        if row:
+            new = row & ~seen
+            while new:
+                bit = new & -new
+                heights[bit.bit_length() - 1] = len(rows) - y
+                new ^= bit
+            seen |= row
+            holes += bin(seen & ~row).count("1")
+        elif seen:
+            holes += bin(seen).count("1")
+
+    bumpiness = 0
+    for left, right in zip(heights, heights[1:]):
+        bumpiness += abs(left - right)
+
+    return Features(lines, heights, sum(heights), holes, bumpiness, max(heights))
+
+
+class AIPlayer(object):
+    """
+    The bot. choose() searches for the best placement of the tetrominoe in
+    play, and play_piece() plays it.
+    """
+    def __init__(self, engine, evaluator=weighted_evaluator, lookahead=True, beam=4, cache_size=100000):
+        """
+        :param engine: The GameEngine to play.
+        :param evaluator: Function of Features, higher is better.
+        :param lookahead: Also search the placements of the next tetrominoe.
+        :param beam: How many of the best placements to search the next
+                     tetrominoe after, when looking ahead.
+        :param cache_size: Maximum number of evaluated positions to keep,
+                           with lookahead.
+        """
+        self.engine = engine
+        self.evaluator = evaluator
+        self.lookahead = lookahead
+        self.beam = beam
+        self.cache = LRUCache(cache_size)   # (rows, lines) -> value
+
+        board = engine.board
+        self.scratch = BitBoard(board.max_x, board.max_y)
+
+    def spawn(self, shape_cls):
+        """Where a tetrominoe is spawned, as (rotation, x, y)"""
+        board = self.engine.board
+        middle = shape_cls.COORDS[0]
+        return 0, middle.x + board.max_x // 2 - 1, middle.y - shape_cls.HEIGHT
+
+    def placements(self, rows, shape_cls, rotation, x, y):
+        """
+        Every placement of a tetrominoe that can be reached from where it is.
+        :param rows: Row bit masks, as BitBoard.rows.
+        :param shape_cls: The Shape subclass of the tetrominoe.
+        :param rotation, x, y: Where the tetrominoe is now.
+        :return: List of Placement.
+        """
+        board = self.scratch
+        board.set_rows(rows)
+        orientations = shape_cls.ORIENTATIONS
+        count = len(orientations)
+        hidden = board.HIDDEN
+
+        # Rotate and move along the current row, as Shape.rotate/move do.
+        start = (rotation, x)
+        paths = {start: []}
+        todo = [start]
+        for state in todo:
+            r, sx = state
+            path = paths[state]
+            for d_x, action in ((-1, LEFT), (1, RIGHT)):
+                moved = (r, sx + d_x)
+                if moved not in paths and board.fits(orientations[r], sx + d_x, y):
+                    paths[moved] = path + [action]
+                    todo.append(moved)
+            if count > 1:
+                for clockwise, action in ((True, CLOCKWISE), (False, ANTICLOCKWISE)):
+                    nr = (r + (1 if clockwise else -1)) % count
+                    for k_x, k_y in shape_cls.KICKS:
+                        if board.fits(orientations[nr], sx + k_x, y + k_y):
+                            rotated = (nr, sx + k_x)
+                            if rotated not in paths:
+                                paths[rotated] = path + [action]
+                                todo.append(rotated)
+                            break
+
+        # Drop each one, using the column tops when the way down is clear.
+        tops = board.tops
+        result = []
+        landed = set()
+        for (r, sx), path in paths.items():
+            orientation = orientations[r]
+            land_y = min(
+                tops[sx + c.x] - hidden - 1 - c.y for c in orientation.cells
+            )
+            if land_y < y:
+                land_y = y
+                while board.fits(orientation, sx, land_y + 1):
+                    land_y += 1
+            if (r, sx, land_y) not in landed:
+                landed.add((r, sx, land_y))
+                result.append(Placement(r, sx, land_y, path + [DROP]))
+
+        # Then slide under any overhangs, and drop again.
+        for placement in list(result):
+            r, sx, land_y = placement.rotation, placement.x, placement.y
+            orientation = orientations[r]
+            for d_x, action in ((-1, LEFT), (1, RIGHT)):
+                tx = sx + d_x
+                slides = 1
+                while board.fits(orientation, tx, land_y):
+                    ty = land_y
+                    while board.fits(orientation, tx, ty + 1):
+                        ty += 1
+                    if (r, tx, ty) not in landed:
+                        landed.add((r, tx, ty))
+                        actions = placement.actions[:-1] + [DOWN] * (land_y - y) + [action] * slides + [DROP]
+                        result.append(Placement(r, tx, ty, actions))
+                    if ty != land_y:
+                        break
+                    tx += d_x
+                    slides += 1
+        return result
+
+    def land(self, rows, shape_cls, placement):
+        """
+        :return: (rows, lines), the rows as a tuple after the tetrominoe has
+                 landed and the complete rows are deleted, and how many were.
+                 rows is None if the game would be over.
+        """
+        board = self.engine.board
+        orientation = shape_cls.ORIENTATIONS[placement.rotation]
+        hidden = board.HIDDEN
+        left = placement.x + orientation.min_x
+
+        rows = list(rows)
+        for d_y, mask in orientation.masks:
+            y = placement.y + d_y + hidden
+            if y < 0:
+                return None, 0
+            rows[y] |= mask << left
+
+        full_row = board.full_row
+        kept = [row for row in rows if row != full_row]
+        lines = len(rows) - len(kept)
+        if lines:
+            rows = [0] * lines + kept
+        if rows[hidden - 1]:
+            return None, lines
+        return tuple(rows), lines
+
+    def evaluate(self, rows, lines):
+        """The evaluator's value of a board, from the cache if it is there."""
+        if not self.lookahead:
+            return self.evaluator(board_features(rows, self.engine.board.max_x, lines))
+        key = (rows, lines)
+        value = self.cache.get(key)
+        if value is None:
+            value = self.evaluator(board_features(rows, self.engine.board.max_x, lines))
+            self.cache.put(key, value)
+        return value
+
+    def best(self, rows, shape_cls, start, next_cls=None, lines=0):
+        """
+        Search for the best placement of a tetrominoe.
+        :param lines: Rows deleted by the tetrominoe before this one, when
+                      looking ahead, which count in the evaluation as if
+                      this one had deleted them too.
+        :return: (value, placement), or (None, None) if every placement ends
+                 the game.
+        """
+        scored = []
+        for placement in self.placements(rows, shape_cls, *start):
+            landed, placed_lines = self.land(rows, shape_cls, placement)
+            if landed is not None:
+                scored.append((self.evaluate(landed, lines + placed_lines), placement, landed, placed_lines))
+
+        result = (None, None)
+        if scored:
+            scored.sort(key=lambda s: s[0], reverse=True)
+            if next_cls is not None:
+                rescored = []
+                for value, placement, landed, placed_lines in scored[:self.beam]:
+                    next_value = self.best(landed, next_cls, self.spawn(next_cls), lines=lines + placed_lines)[0]
+                    if next_value is not None:
+                        rescored.append((next_value, placement))
+                if rescored:
+                    scored = max(rescored, key=lambda s: s[0])
+                    result = scored
+                else:
+                    result = scored[0][:2]
+            else:
+                result = scored[0][:2]
+
+        return result
+
+    def choose(self):
+        """
+        :return: The best Placement of the tetrominoe in play, or None.
+        """
+        engine = self.engine
+        shape = engine.shape
+        next_cls = engine.next_shape if self.lookahead else None
+        return self.best(
+            tuple(engine.board.rows),
+            type(shape),
+            (shape.rotation, shape.x, shape.y),
+            next_cls
+        )[1]
+
+    def play_piece(self):
+        """
+        Play the best placement of the tetrominoe in play, or just drop it if
+        the game can't be saved.
+        """
+        placement = self.choose()
+        actions = placement.actions if placement else [DROP]
+        for action in actions:
+            self.engine.step(action)
+
+    def play_game(self, max_pieces=None, seed=None):
+        """
+        Play a new game, until it is over or max_pieces have been played.
+        :param seed: The game's seed, see GameEngine.new_game().
+        """
+        engine = self.engine
+        engine.new_game(seed)
+        while engine.state == PLAYING and (max_pieces is None or engine.pieces <= max_pieces):
+            self.play_piece()
+
+
+def main():
+    import argparse
+    from tetris_telemetry import FORMATS as TELEMETRY_FORMATS
+
+    parser = argparse.ArgumentParser(description="Let the bot play Tetris Tk, without a display.")
+    parser.add_argument("--games", type=int, default=1, help="number of games to play")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the tetrominoes")
+    parser.add_argument("--max-pieces", type=int, default=None, help="stop a game after this many tetrominoes")
+    parser.add_argument("--no-lookahead", action="store_true", help="don't search the next tetrominoe")
+    parser.add_argument("--bag", action="store_true", help="deal the tetrominoes from a shuffled bag of seven")
+    parser.add_argument("--check-features", action="store_true",
+                        help="keep the board's features, and check them after every landing")
+    parser.add_argument("--telemetry", metavar="FILE", default=None, help="append the metrics of every game to FILE")
+    parser.add_argument("--telemetry-format", choices=TELEMETRY_FORMATS, default="jsonl",
+                        help="format of the telemetry file")
+    args = parser.parse_args()
+
+    FeatureCache.DEBUG = args.check_features
+    engine = GameEngine(MAXX, MAXY, seed=args.seed, mode=BAG if args.bag else UNIFORM, features=args.check_features)
+    player = AIPlayer(engine, lookahead=not args.no_lookahead)
+    telemetry = None
+    if args.telemetry:
+        from tetris_telemetry import GameTelemetry, TelemetryLog
+
+        log = TelemetryLog(args.telemetry, args.telemetry_format)
+        telemetry = GameTelemetry(engine, log)
+    for game in range(args.games):
+        start = time.time()
+        player.play_game(args.max_pieces)
+        elapsed = time.time() - start
+        print("game {0}: score {1}, level {2}, pieces {3}, {4:.0f} pieces/s, cache {5} ({6} hits)".format(
+            game + 1, engine.score, engine.level, engine.pieces, engine.pieces / max(elapsed, 1e-9),
+            len(player.cache), player.cache.hits
+        ))
+    if telemetry:
+        telemetry.close()
+        log.close()
+
+
+if __name__ == "__main__":
+    main()
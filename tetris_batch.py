@@ -0,0 +1,183 @@
+"""Tetris Batch - evaluate many tetris boards at once, with NumPy.
+
+Boards are held as an (N, MAXY, MAXX) uint8 array of cells, 1 where there is
+a block, or as an (N, MAXY) array of row bit masks, the same packed form as
+tetris_engine.BitBoard, which unpack() turns into cells.
+
+Every function works on whole arrays of boards in one vectorised pass, and
+also on any extra leading dimensions, so the boards that result from every
+placement of a shape (see place()) can be evaluated the same way as the
+boards they came from.
+
+This needs NumPy, unlike the rest of the game.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from tetris_engine import MAXX, MAXY, SHAPES, Coord
+
+BatchFeatures = namedtuple("BatchFeatures", ['heights', 'holes', 'bumpiness', 'complete_rows'])
+
+
+def orientations(shape_cls):
+    """
+    The orientations of a shape, from its ORIENTATIONS table.
+    :param shape_cls: A Shape subclass, e.g. TShape.
+    :return: List of orientations, each a tuple of Coords moved so that the
+             smallest x and y are 0.
+    """
+    return [
+        tuple(Coord(c.x - o.min_x, c.y - o.min_y) for c in o.cells)
+        for o in shape_cls.ORIENTATIONS
+    ]
+
+
+def from_bitboards(boards):
+    """
+    :param boards: A list of N tetris_engine.BitBoard.
+    :return: (N, MAXY) array of the row bit masks of the visible rows.
+    """
+    return np.array([board.rows[board.HIDDEN:] for board in boards], dtype=np.uint64)
+
+
+def unpack(rows, max_x=MAXX):
+    """
+    :param rows: (..., MAXY) array of row bit masks.
+    :param max_x: Width of the boards.
+    :return: (..., MAXY, MAXX) uint8 array of cells.
+    """
+    rows = np.asarray(rows, dtype=np.uint64)
+    bits = np.arange(max_x, dtype=np.uint64)
+    return ((rows[..., None] >> bits) & np.uint64(1)).astype(np.uint8)
+
+
+def pack(cells):
+    """
+    :param cells: (..., MAXY, MAXX) array of cells.
+    :return: (..., MAXY) uint64 array of row bit masks.
+    """
+    weights = np.uint64(1) << np.arange(cells.shape[-1], dtype=np.uint64)
+    return (cells.astype(np.uint64) * weights).sum(axis=-1, dtype=np.uint64)
+
+
+def column_heights(cells):
+    """
+    :return: (..., MAXX) heights of the top block in each column, 0 if empty.
+    """
+    max_y = cells.shape[-2]
+    filled = cells.any(axis=-2)
+    top = cells.argmax(axis=-2)
+    return np.where(filled, max_y - top, 0)
+
+
+def holes(cells, heights=None):
+    """
+    :return: (...) number of empty cells below the top block of each column.
+    """
+    if heights is None:
+        heights = column_heights(cells)
+    return (heights - cells.sum(axis=-2, dtype=np.int64)).sum(axis=-1)
+
+
+def bumpiness(heights):
+    """
+    :return: (...) sum of the differences in height of neighbouring columns.
+    """
+    return np.abs(np.diff(heights, axis=-1)).sum(axis=-1)
+
+
+def complete_rows(cells):
+    """
+    :return: (...) number of complete rows.
+    """
+    return cells.all(axis=-1).sum(axis=-1)
+
+
+def evaluate(cells):
+    """
+    :param cells: (..., MAXY, MAXX) array of cells.
+    :return: BatchFeatures of the boards.
+    """
+    heights = column_heights(cells)
+    return BatchFeatures(
+        heights,
+        holes(cells, heights),
+        bumpiness(heights),
+        complete_rows(cells)
+    )
+
+
+def landing_rows(heights, shape_cls, max_y=MAXY):
+    """
+    Where a shape lands when it is dropped straight down from above the
+    board, for every orientation and every column.
+    :param heights: (N, MAXX) column heights, see column_heights().
+    :param shape_cls: A Shape subclass, e.g. TShape.
+    :param max_y: Height of the boards.
+    :return: (y, legal), (N, R, MAXX) arrays for R orientations. y is the row
+             of the top of the shape when it lands, with its left most column
+             at x. legal is False where the shape doesn't fit in the width of
+             the board at x, or lands above the top of the board.
+    """
+    n, max_x = heights.shape
+    tops = max_y - heights
+    shapes = orientations(shape_cls)
+
+    y = np.full((n, len(shapes), max_x), -1, dtype=np.int64)
+    for r, cells in enumerate(shapes):
+        width = max(c.x for c in cells) + 1
+        positions = max_x - width + 1
+        landing = None
+        for dx in range(width):
+            bottom = max(c.y for c in cells if c.x == dx)
+            column = tops[:, dx:dx + positions] - 1 - bottom
+            landing = column if landing is None else np.minimum(landing, column)
+        y[:, r, :positions] = landing
+
+    legal = y >= 0
+    y[~legal] = -1
+    return y, legal
+
+
+def place(cells, shape_cls):
+    """
+    Land a shape, dropped straight down, in every orientation and column on
+    every board.
+    :param cells: (N, MAXY, MAXX) array of cells.
+    :param shape_cls: A Shape subclass, e.g. TShape.
+    :return: (boards, legal), boards is a (N, R, MAXX, MAXY, MAXX) array of
+             the resulting cells, for R orientations, and legal is (N, R, MAXX)
+             as for landing_rows(). Boards where the placement isn't legal are
+             left unchanged.
+    """
+    n, max_y, max_x = cells.shape
+    y, legal = landing_rows(column_heights(cells), shape_cls, max_y)
+    shapes = orientations(shape_cls)
+
+    boards = np.repeat(cells[:, None, None], len(shapes) * max_x, axis=1)
+    boards = boards.reshape(n, len(shapes), max_x, max_y, max_x)
+
+    board_i, rot_i, x_i = np.nonzero(legal)
+    top = y[board_i, rot_i, x_i]
+    for r, shape in enumerate(shapes):
+        which = rot_i == r
+        for c in shape:
+            boards[board_i[which], r, x_i[which], top[which] + c.y, x_i[which] + c.x] = 1
+    return boards, legal
+
+
+def evaluate_placements(cells, shapes=SHAPES):
+    """
+    Evaluate every placement of every shape on every board.
+    :param cells: (N, MAXY, MAXX) array of cells.
+    :param shapes: The Shape subclasses to place.
+    :return: dict of shape class -> (BatchFeatures, legal), where the features
+             are (N, R, MAXX) arrays, for the boards after the shape has landed
+             in orientation R at column x, and before complete rows are deleted.
+    """
+    result = {}
+    for shape_cls in shapes:
+        boards, legal = place(cells, shape_cls)
+        result[shape_cls] = (evaluate(boards), legal)
+    return result
@@ -0,0 +1,427 @@
+#!/usr/bin/env python
+"""Tetris Bench - benchmarks of the hot paths of the game.
+
+Times the board's collision and line clear checks, moving and rotating every
+shape, the hard drop and whole games played from a scripted stream of
+actions. Everything runs headless on the GameEngine, and with --tk the same
+actions are also timed through the GameController's key callbacks on a real
+Tk canvas, which needs a display, e.g. under Xvfb:
+
+    xvfb-run python tetris_bench.py --tk
+
+Results are written as JSON, and can be compared with an earlier run. The
+comparison fails, with exit status 1, when any benchmark is slower than the
+earlier run by more than the threshold:
+
+    python tetris_bench.py --output baseline.json
+    python tetris_bench.py --compare baseline.json --threshold 0.2
+
+With --startup, the time for a new interpreter to import each module, and
+for a pool of worker processes to start, are timed too. Importing any of
+the modules must not import Tk, as worker processes don't need it and
+machines without a display may not have it, so if one does that fails too.
+A module that can't be imported, e.g. tetris_batch without NumPy, is
+skipped.
+
+Each benchmark is repeated and the fastest repeat is kept, as the slower
+ones are slowed down by something else.
+"""
+from __future__ import print_function, division
+
+import argparse
+import json
+import multiprocessing
+import platform
+import subprocess
+import sys
+import timeit
+
+from tetris_engine import (
+    MAXX, MAXY, LEFT, RIGHT, DOWN, DROP, CLOCKWISE, ANTICLOCKWISE, PLAYING, SHAPES,
+    Coord, BitBoard, FeatureCache, GameEngine
+)
+
+# Total time to aim for, for one repeat of a benchmark.
+REPEAT_TIME = 0.1
+
+# Modules timed by --startup.
+STARTUP_MODULES = (
+    "tetris_engine", "tetris_ai", "tetris_tournament", "tetris_replay", "tetris_stream", "tetris_batch", "tetris_tk"
+)
+
+# Exit status of the interpreter importing a module for --startup, when the
+# module imported Tk, and when it couldn't be imported, e.g. tetris_batch
+# without NumPy. Anything else but 0 is a failure.
+STATUS_IMPORTS_TK = 3
+STATUS_SKIPPED = 4
+STARTUP_CODE = "\n".join([
+    "import sys",
+    "try:",
+    "    import {module}",
+    "except ImportError:",
+    "    sys.exit({skipped})",
+    "sys.exit({imports_tk} if 'tkinter' in sys.modules or 'Tkinter' in sys.modules else 0)",
+])
+
+
+def stacked_board(height, holes=True, max_x=MAXX, max_y=MAXY):
+    """
+    A board with a stack of height rows, each with one gap, so none are
+    complete. With holes, the gaps are staggered.
+    """
+    board = BitBoard(max_x, max_y)
+    rows = list(board.rows)
+    for y in range(height):
+        gap = (y * 3) % max_x if holes else 0
+        rows[-1 - y] = board.full_row & ~(1 << gap)
+    board.set_rows(rows)
+    return board
+
+
+def scripted_actions(piece):
+    """The actions for a tetrominoe in the scripted games."""
+    actions = [CLOCKWISE] * (piece % 4)
+    shift = (piece * 7) % 9 - 4
+    actions += [LEFT if shift < 0 else RIGHT] * abs(shift)
+    actions.append(DROP)
+    return actions
+
+
+def play_scripted_game(step, engine, seed, max_pieces=300):
+    """Play a game with the scripted actions, through step(action)."""
+    engine.new_game(seed)
+    while engine.state == PLAYING and engine.pieces <= max_pieces:
+        for action in scripted_actions(engine.pieces):
+            step(action)
+    return engine.pieces
+
+
+def bench_check_block():
+    board = stacked_board(10)
+    coord = Coord(4, MAXY - 5)
+    return lambda: board.check_block(coord)
+
+
+def bench_fits():
+    board = stacked_board(10)
+    orientation = SHAPES[1].ORIENTATIONS[0]
+    return lambda: board.fits(orientation, 4, MAXY - 12)
+
+
+def bench_complete_row(height, clears, max_x=MAXX, max_y=MAXY, features=False):
+    """
+    Land a tetrominoe on a stack of height rows, completing clears rows.
+    The board is copied for every call, so that is timed too.
+    :param features: Keep the board's features up to date, as well.
+    """
+    board = stacked_board(height, holes=False, max_x=max_x, max_y=max_y)
+    if features:
+        board.features = FeatureCache(board)
+    # An upright I in column 0, which is the gap in every row, so make a
+    # second gap in the bottom rows that shouldn't be completed.
+    coords = [Coord(0, max_y - 1 - y) for y in range(4)]
+    rows = list(board.rows)
+    for y in range(clears, 4):
+        rows[-1 - y] &= ~2
+    board.set_rows(rows)
+    return lambda: board.copy().check_for_complete_row(coords)
+
+
+def bench_move(shape_cls):
+    shape = shape_cls(BitBoard(MAXX, MAXY), offset=Coord(4, 4))
+
+    def run():
+        shape.move(LEFT)
+        shape.move(RIGHT)
+    return run
+
+
+def bench_rotate(shape_cls):
+    shape = shape_cls(BitBoard(MAXX, MAXY), offset=Coord(4, 4))
+    return lambda: shape.rotate(clockwise=True)
+
+
+def bench_hard_drop():
+    """A hard drop of a T from the top of a board, as GameEngine.drop()."""
+    board = stacked_board(4)
+    shape_cls = SHAPES[1]
+
+    def run():
+        shape = shape_cls(board, offset=Coord(4, -shape_cls.HEIGHT))
+        shape.y += shape.drop_distance()
+    return run
+
+
+def bench_game():
+    engine = GameEngine(MAXX, MAXY)
+    return lambda: play_scripted_game(engine.step, engine, seed=1)
+
+
+def bench_snapshot():
+    engine = GameEngine(MAXX, MAXY)
+    engine.new_game(1)
+    return engine.snapshot
+
+
+def bench_restore():
+    engine = GameEngine(MAXX, MAXY)
+    engine.new_game(1)
+    snapshot = engine.snapshot()
+    return lambda: engine.restore(snapshot)
+
+
+def headless_benchmarks():
+    benchmarks = [
+        ("board.check_block", bench_check_block),
+        ("board.fits", bench_fits),
+    ]
+    for height in (4, 12, 20):
+        for clears in (0, 1, 4):
+            benchmarks.append((
+                "board.check_for_complete_row[height={0},clears={1}]".format(height, clears),
+                lambda h=height, c=clears: bench_complete_row(h, c)
+            ))
+    benchmarks.append((
+        "board.check_for_complete_row[2000x2000,height=1000,clears=1]",
+        lambda: bench_complete_row(1000, 1, 2000, 2000)
+    ))
+    for clears in (0, 1):
+        benchmarks.append((
+            "board.check_for_complete_row[height=12,clears={0},features]".format(clears),
+            lambda c=clears: bench_complete_row(12, c, features=True)
+        ))
+    for shape_cls in SHAPES:
+        benchmarks.append(("shape.move[{0}]".format(shape_cls.__name__), lambda s=shape_cls: bench_move(s)))
+        benchmarks.append(("shape.rotate[{0}]".format(shape_cls.__name__), lambda s=shape_cls: bench_rotate(s)))
+    benchmarks.append(("engine.hard_drop", bench_hard_drop))
+    benchmarks.append(("engine.snapshot", bench_snapshot))
+    benchmarks.append(("engine.restore", bench_restore))
+    benchmarks.append(("engine.scripted_game", bench_game))
+    return benchmarks
+
+
+def tk_benchmarks():
+    """
+    The same actions, through the GUI callbacks on a real Tk canvas.
+    :return: List of benchmarks, or None if there is no display.
+    """
+    try:
+        from tetris_gui import Tk, TclError
+        from tetris_tk import GameController
+    except ImportError:
+        return None
+    try:
+        root = Tk()
+    except TclError:
+        return None
+    root.withdraw()
+    controller = GameController(root)
+    controller.after_id = None
+
+    callbacks = {
+        LEFT: controller.left_callback,
+        RIGHT: controller.right_callback,
+        DOWN: controller.down_callback,
+        DROP: controller.up_callback,
+        CLOCKWISE: controller.a_callback,
+        ANTICLOCKWISE: controller.s_callback,
+    }
+
+    def step(action):
+        callbacks[action](None)
+        root.update_idletasks()
+
+    def new_game():
+        controller.engine.new_game(1)
+        return controller.engine
+
+    def bench_tk_move():
+        new_game()
+
+        def run():
+            step(LEFT)
+            step(RIGHT)
+        return run
+
+    def bench_tk_rotate():
+        new_game()
+        return lambda: step(CLOCKWISE)
+
+    def bench_tk_drop():
+        engine = new_game()
+
+        def run():
+            if engine.state != PLAYING or engine.pieces > 100:
+                new_game()
+            step(DROP)
+        return run
+
+    def bench_tk_game():
+        return lambda: play_scripted_game(step, controller.engine, seed=1)
+
+    return [
+        ("tk.move", bench_tk_move),
+        ("tk.rotate", bench_tk_rotate),
+        ("tk.hard_drop", bench_tk_drop),
+        ("tk.scripted_game", bench_tk_game),
+    ]
+
+
+def time_startup(code, repeat):
+    """
+    :param code: Python code to run in a new interpreter.
+    :return: (seconds, exit status), the fastest of repeat runs.
+    """
+    best = None
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        status = subprocess.call([sys.executable, "-c", code])
+        elapsed = timeit.default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, status
+
+
+def start_pool():
+    """Start a pool of one worker process, as a tournament does, and wait for it."""
+    from tetris_tournament import init_worker
+    context = multiprocessing.get_context("spawn") if hasattr(multiprocessing, "get_context") else multiprocessing
+    pool = context.Pool(1, init_worker, (None, 1, MAXX, MAXY))
+    pool.apply(abs, (0,))
+    pool.terminate()
+    pool.join()
+
+
+def run_startup(repeat=5):
+    """
+    Time starting Python, importing each module, and starting a worker.
+    :return: (results, list of the modules that imported Tk)
+    """
+    results = {}
+    imports_tk = []
+    for name, code in [("interpreter", "pass")] + [
+        ("import[{0}]".format(module),
+         STARTUP_CODE.format(module=module, skipped=STATUS_SKIPPED, imports_tk=STATUS_IMPORTS_TK))
+        for module in STARTUP_MODULES
+    ]:
+        seconds, status = time_startup(code, repeat)
+        if status == STATUS_SKIPPED:
+            print("{0:<55} {1:>12}".format("startup." + name, "skipped"))
+            continue
+        if status not in (0, STATUS_IMPORTS_TK):
+            print("{0:<55} {1:>12}".format("startup." + name, "failed"))
+            continue
+        if status == STATUS_IMPORTS_TK:
+            imports_tk.append(name)
+        results["startup." + name] = {"seconds": seconds, "calls": 1}
+        print("{0:<55} {1:>12.3f} ms{2}".format(
+            "startup." + name, seconds * 1e3, "  IMPORTS TK" if status == STATUS_IMPORTS_TK else ""))
+
+    timer = timeit.Timer(start_pool)
+    seconds = min(timer.repeat(repeat, 1))
+    results["startup.pool"] = {"seconds": seconds, "calls": 1}
+    print("{0:<55} {1:>12.3f} ms".format("startup.pool", seconds * 1e3))
+    return results, imports_tk
+
+
+def time_benchmark(make, repeat):
+    """
+    :param make: Function that sets up the benchmark and returns the
+                 function to time.
+    :return: (seconds per call, calls per repeat), the fastest repeat.
+    """
+    timer = timeit.Timer(make())
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= REPEAT_TIME / 10 or number >= 10**6:
+            break
+        number *= 10
+    number = max(1, int(number * REPEAT_TIME / max(elapsed, 1e-9)))
+    return min(timer.repeat(repeat, number)) / number, number
+
+
+def run(benchmarks, repeat=5, match=None):
+    results = {}
+    for name, make in benchmarks:
+        if match and match not in name:
+            continue
+        seconds, calls = time_benchmark(make, repeat)
+        results[name] = {"seconds": seconds, "calls": calls}
+        print("{0:<55} {1:>12.3f} us".format(name, seconds * 1e6))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    :return: List of the names of the benchmarks that have regressed. A
+             baseline of no time at all can't be compared with, and is
+             reported as n/a.
+    """
+    regressed = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        before = baseline[name]["seconds"]
+        if before <= 0:
+            print("{0:<55} {1:>8}".format(name, "n/a"))
+            continue
+        change = (result["seconds"] - before) / before
+        flag = ""
+        if change > threshold:
+            regressed.append(name)
+            flag = "  REGRESSED"
+        print("{0:<55} {1:>+8.1%}{2}".format(name, change, flag))
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths of Tetris Tk.")
+    parser.add_argument("--tk", action="store_true", help="also benchmark the GUI on a real Tk canvas")
+    parser.add_argument("--startup", action="store_true",
+                        help="also time importing each module in a new interpreter, and starting a worker")
+    parser.add_argument("--repeat", type=int, default=5, help="repeats of each benchmark")
+    parser.add_argument("--match", default=None, help="only run benchmarks with this in their name")
+    parser.add_argument("--output", default=None, help="write the results to this JSON file")
+    parser.add_argument("--compare", default=None, help="JSON file of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="fraction slower than the earlier run that is a regression")
+    args = parser.parse_args()
+
+    benchmarks = headless_benchmarks()
+    if args.tk:
+        gui = tk_benchmarks()
+        if gui is None:
+            print("No display, skipping the Tk benchmarks.", file=sys.stderr)
+        else:
+            benchmarks += gui
+
+    results = run(benchmarks, args.repeat, args.match)
+    imports_tk = []
+    if args.startup:
+        startup, imports_tk = run_startup(args.repeat)
+        results.update(startup)
+    report = {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    failed = False
+    if imports_tk:
+        print("Importing these imports Tk: " + ", ".join(imports_tk), file=sys.stderr)
+        failed = True
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.threshold):
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1138 @@
+"""Tetris Engine - the rules of Tetris Tk, without any GUI.
+
+The engine covers everything that happens in a game: spawning tetrominoes,
+moving, rotating and landing them, clearing complete rows, scoring, levelling
+up and game over. It doesn't know about Tk, so games can be simulated on
+machines without a display, as fast as the rules allow.
+
+A game is driven by calling GameEngine.step() with one of the actions, and
+anything that wants to show the game (e.g. the Tk GUI) subscribes to the
+events the engine emits as the game changes.
+
+    engine = GameEngine(seed=1)
+    engine.new_game()
+    while engine.state == PLAYING:
+        engine.step(DROP)
+"""
+from __future__ import print_function
+
+from array import array
+from random import Random
+from collections import namedtuple
+
+MAXX = 10
+MAXY = 22
+
+NO_OF_LEVELS = 10
+
+LEFT = "left"
+RIGHT = "right"
+DOWN = "down"
+
+direction_d = {"left": (-1, 0), "right": (1, 0), "down": (0, 1)}
+
+# Actions, in addition to the directions above.
+TICK = "tick"                   # Gravity, moves the tetrominoe down.
+DROP = "drop"                   # Hard drop to the bottom.
+CLOCKWISE = "clockwise"
+ANTICLOCKWISE = "anticlockwise"
+PAUSE = "pause"                 # Pause, or resume, the game.
+
+ACTIONS = (LEFT, RIGHT, DOWN, TICK, DROP, CLOCKWISE, ANTICLOCKWISE, PAUSE)
+
+# Game States
+READY = "READY"
+GAME_OVER = "GAME OVER"
+PAUSED = "PAUSED"
+PLAYING = "PLAYING"
+
+# How the tetrominoes are chosen, see PieceSequence.
+UNIFORM = "uniform"     # Any of the seven, each time.
+BAG = "bag"             # Each of the seven, shuffled, then again.
+MODES = (UNIFORM, BAG)
+
+# Events, emitted to subscribers as (event, *args)
+ACTION = "action"       # (action), before step() applies it
+RESET = "reset"         # ()
+PREVIEW = "preview"     # (shape class)
+SPAWN = "spawn"         # (shape)
+MOVE = "move"           # (shape, coords before the move or rotation)
+LAND = "land"           # (shape)
+CLEAR = "clear"         # (list of the rows deleted, from the bottom up)
+SCORE = "score"         # (score)
+LEVEL = "level"         # (level)
+STATE = "state"         # (state)
+RESTORE = "restore"     # (snapshot), followed by the events to draw it
+GARBAGE = "garbage"     # (number of rows, column of the gap), added at the bottom
+
+Coord = namedtuple("Coord", ['x', 'y'])
+
+# The state of a game, see GameEngine.snapshot(). The rows are a tuple of the
+# board's row bit masks, which is shared by every snapshot until it changes.
+# The tetrominoes to come are those of the PieceSequence of seed and mode.
+Snapshot = namedtuple("Snapshot", [
+    'rows', 'shape', 'x', 'y', 'rotation', 'next_shape', 'score', 'level', 'delay', 'state', 'pieces',
+    'seed', 'mode'
+])
+
+# One rotation of a shape. The blocks relative to the 'middle' block, the
+# bit mask of the blocks in each row (dy, mask) with bit 0 at min_x, the
+# bounds of the blocks, and the lowest block in each column (dx, dy).
+Orientation = namedtuple("Orientation", ['cells', 'masks', 'min_x', 'max_x', 'min_y', 'max_y', 'bottoms'])
+
+# The features of a board kept up to date by a FeatureCache, not to be
+# confused with tetris_ai.Features, an evaluator's argument, or
+# tetris_batch.BatchFeatures, arrays of the features of many boards. The
+# heights of the columns are counted from the bottom of the board's rows,
+# hidden rows included, as tetris_ai.board_features() does.
+CachedFeatures = namedtuple("CachedFeatures", [
+    'heights', 'aggregate_height', 'holes', 'row_transitions', 'wells', 'bumpiness'
+])
+
+
+def level_thresholds(first_level, no_of_levels):
+    """
+    Calculates the score at which the level will change, for n levels.
+    """
+    thresholds = []
+    for x in range(no_of_levels):
+        multiplier = 2**x
+        thresholds.append(first_level * multiplier)
+
+    return thresholds
+
+
+def column_tops(rows, max_x):
+    """
+    :param rows: Row bit masks, as BitBoard.rows.
+    :return: For each column, the index of the row of its top block, or
+             len(rows) if the column is empty.
+    """
+    tops = [len(rows)] * max_x
+    seen = 0
+    for y, row in enumerate(rows):
+        new = row & ~seen
+        while new:
+            bit = new & -new
+            tops[bit.bit_length() - 1] = y
+            new ^= bit
+        seen |= row
+    return tops
+
+
+def row_transitions(row, max_x):
+    """
+    :return: The number of times a row changes from a block to a gap, or a
+             gap to a block, with the walls counted as blocks. An empty row
+             counts 0, so the rows above the stack don't count.
+    """
+    if not row:
+        return 0
+    walled = (row << 1) | 1 | (1 << (max_x + 1))
+    return bin((walled ^ (walled >> 1)) & ((2 << max_x) - 1)).count("1")
+
+
+class FeatureCache(object):
+    """
+    The features of a BitBoard, kept up to date as blocks land and rows are
+    deleted, instead of scanning the whole board for them after every
+    landing. A tetrominoe changes at most four columns and rows, so only
+    those, and the wells and bumpiness next to them, are counted again.
+    Deleting rows moves every column top, so the heights are counted again
+    then, like BitBoard.clear_tops(), and garbage rows rebuild the lot.
+
+    The number of blocks in each column is kept, so the holes, the gaps
+    below the top of a column, are the aggregate height less the blocks.
+    A well is how far a column is below the lower of its neighbours, with
+    the walls as high as the board.
+
+    With DEBUG set, every update is checked against a board counted from
+    scratch, and an AssertionError raised if they differ.
+    """
+    DEBUG = False
+
+    def __init__(self, board):
+        """:param board: The BitBoard, whose rows, counts and tops are counted."""
+        self.rebuild(board)
+
+    def rebuild(self, board):
+        """Count the features of the board from scratch."""
+        rows = board.rows
+        max_x = board.max_x
+        self.heights = [len(rows) - y for y in board.tops]
+        self.columns = [0] * max_x
+        for row in rows:
+            while row:
+                bit = row & -row
+                self.columns[bit.bit_length() - 1] += 1
+                row ^= bit
+        self.blocks = sum(board.counts)
+        self.transitions = [row_transitions(row, max_x) for row in rows]
+        self.row_transitions = sum(self.transitions)
+        self.count_heights()
+
+    def copy(self):
+        """:return: A copy, for a copy of the board."""
+        features = FeatureCache.__new__(FeatureCache)
+        features.__dict__.update(self.__dict__)
+        for name in ("heights", "columns", "transitions", "wells"):
+            setattr(features, name, list(getattr(self, name)))
+        return features
+
+    def count_heights(self):
+        """Count the aggregate height, bumpiness and wells, from the heights."""
+        heights = self.heights
+        self.aggregate_height = sum(heights)
+        steps = [right - left for left, right in zip(heights, heights[1:])]
+        self.bumpiness = sum(abs(step) for step in steps)
+        # a column is a well as deep as the lower of the steps up to its
+        # neighbours, and the walls are a step up higher than any column
+        wall = len(self.transitions) + 1
+        lefts = [wall] + [-step for step in steps]
+        rights = steps + [wall]
+        self.wells = [max(min(left, right), 0) for left, right in zip(lefts, rights)] if steps else [0]
+        self.well_depth = sum(self.wells)
+
+    def well(self, x):
+        """:return: How deep the well in column x is, 0 if it isn't one."""
+        heights = self.heights
+        last = len(heights) - 1
+        if x == 0:
+            if not last:
+                return 0
+            low = heights[1]
+        elif x == last:
+            low = heights[x - 1]
+        else:
+            low = min(heights[x - 1], heights[x + 1])
+        return max(low - heights[x], 0)
+
+    def set_height(self, x, height):
+        """Change the height of column x, and the features that depend on it."""
+        heights = self.heights
+        old = heights[x]
+        if height == old:
+            return
+        if x > 0:
+            self.bumpiness += abs(heights[x - 1] - height) - abs(heights[x - 1] - old)
+        if x + 1 < len(heights):
+            self.bumpiness += abs(heights[x + 1] - height) - abs(heights[x + 1] - old)
+        self.aggregate_height += height - old
+        heights[x] = height
+
+        wells = self.wells
+        for w in range(max(x - 1, 0), min(x + 2, len(heights))):
+            depth = self.well(w)
+            self.well_depth += depth - wells[w]
+            wells[w] = depth
+
+    def land(self, board, blocks):
+        """
+        Count the blocks that have landed, after they are added to the rows
+        and tops of the board, but before any complete rows are deleted.
+        :param blocks: (x, y) of each block added, y an index into board.rows.
+        """
+        rows = board.rows
+        columns = self.columns
+        transitions = self.transitions
+        changed_x = set()
+        changed_y = set()
+        for x, y in blocks:
+            columns[x] += 1
+            changed_x.add(x)
+            changed_y.add(y)
+        self.blocks += len(blocks)
+        for y in changed_y:
+            count = row_transitions(rows[y], board.max_x)
+            self.row_transitions += count - transitions[y]
+            transitions[y] = count
+        height = len(rows)
+        tops = board.tops
+        for x in changed_x:
+            self.set_height(x, height - tops[x])
+
+    def delete_rows(self, board, deleted):
+        """
+        Count the board again after complete rows are deleted, once the
+        board's tops are up to date.
+        :param deleted: Index of each row deleted, from the bottom up.
+        """
+        transitions = self.transitions
+        for y in deleted:
+            self.row_transitions -= transitions[y]
+            del transitions[y]
+        transitions[0:0] = [0] * len(deleted)
+        # the rows were complete, so had a block in every column
+        self.columns = [blocks - len(deleted) for blocks in self.columns]
+        self.blocks -= len(deleted) * board.max_x
+        height = len(board.rows)
+        self.heights = [height - y for y in board.tops]
+        self.count_heights()
+
+    @property
+    def holes(self):
+        return self.aggregate_height - self.blocks
+
+    def vector(self):
+        """:return: The features, as a CachedFeatures."""
+        return CachedFeatures(
+            tuple(self.heights), self.aggregate_height, self.holes, self.row_transitions, self.well_depth,
+            self.bumpiness
+        )
+
+    def check(self, board):
+        """Raise an AssertionError if the features differ from those counted from scratch."""
+        expected = FeatureCache(board)
+        for name in ("heights", "columns", "transitions", "wells"):
+            if getattr(self, name) != getattr(expected, name):
+                raise AssertionError("board features: {0} are {1}, not {2}".format(
+                    name, getattr(self, name), getattr(expected, name)))
+        if self.vector() != expected.vector():
+            raise AssertionError("board features are {0}, not {1}".format(self.vector(), expected.vector()))
+
+
+class BitBoard(object):
+    """
+    The tetris playing area, a grid of x by y blocks, without any GUI.
+
+    The landed blocks are held in a packed form, each row is an integer bit
+    mask with bit x set if there is a block in column x. HIDDEN rows above
+    the top of the board are included, because that is where new tetrominoes
+    are spawned, so row y of the board is rows[y + HIDDEN].
+
+    The index of the top block of each column is kept in tops, so how far a
+    tetrominoe can drop is found from the columns it covers, instead of
+    moving it down a row at a time. The number of blocks in each row is kept
+    in counts, so only the rows a tetrominoe lands in are checked for being
+    complete, however wide and high the board is. An empty row is just the
+    int 0, so a mostly empty board takes little more than a list of them.
+    With features, a FeatureCache of the board is kept up to date as well.
+
+    The rows must only be changed by the methods here, as freeze() keeps
+    them as a tuple until they change.
+    """
+    HIDDEN = 4
+
+    def __init__(self, max_x=MAXX, max_y=MAXY, features=False):
+        """
+        :param max_x: Width of the board, in blocks.
+        :param max_y: Height of the board, in blocks.
+        :param features: Keep the board's features, in self.features.
+        """
+        self.max_x = max_x
+        self.max_y = max_y
+        self.full_row = (1 << max_x) - 1
+        self.features = None
+        self.reset()
+        if features:
+            self.features = FeatureCache(self)
+
+    def reset(self):
+        """
+        Reset the board by clearing all the blocks from a previous game.
+        """
+        self.rows = [0] * (self.max_y + self.HIDDEN)
+        self.counts = [0] * len(self.rows)
+        self.tops = [len(self.rows)] * self.max_x
+        self.cleared = []
+        self.frozen = None
+        if self.features is not None:
+            self.features.rebuild(self)
+
+    def copy(self):
+        """:return: A copy of the board, that can be changed without changing this one."""
+        board = BitBoard.__new__(BitBoard)
+        board.max_x = self.max_x
+        board.max_y = self.max_y
+        board.full_row = self.full_row
+        board.rows = list(self.rows)
+        board.counts = list(self.counts)
+        board.tops = list(self.tops)
+        board.cleared = []
+        board.frozen = self.frozen
+        board.features = self.features.copy() if self.features is not None else None
+        return board
+
+    def set_rows(self, rows):
+        """
+        Replace the landed blocks, e.g. with those of a saved game.
+        :param rows: Row bit masks, as self.rows.
+        """
+        self.rows = list(rows)
+        self.counts = [bin(row).count("1") for row in self.rows]
+        self.tops = column_tops(self.rows, self.max_x)
+        self.frozen = rows if isinstance(rows, tuple) else None
+        if self.features is not None:
+            self.features.rebuild(self)
+
+    def freeze(self):
+        """
+        :return: The rows as a tuple, the same one until the rows change.
+        """
+        if self.frozen is None:
+            self.frozen = tuple(self.rows)
+        return self.frozen
+
+    def is_game_over(self):
+        """
+        Check row -1, if there are any blocks then that means that no new
+        tetrominos can be generated and the game is over.
+        :return: True if blocks are found and game is over, otherwise False.
+        """
+        return self.rows[self.HIDDEN - 1] != 0
+
+    def check_for_complete_row(self, coords):
+        """
+        Land the blocks at coords, then check the rows they landed in, and
+        delete those that are complete. The rows deleted are left in
+        self.cleared, from the bottom up.
+        :param coords: The coordinates of the blocks that have landed.
+        :return: the score, calculated by the number of rows deleted.
+        """
+        rows = self.rows
+        counts = self.counts
+        tops = self.tops
+        features = self.features
+        self.frozen = None
+
+        # Add the blocks to those in the grid that have already 'landed', a
+        # row is complete when its count reaches the width of the board.
+        hidden = self.HIDDEN
+        max_x = self.max_x
+        cleared = []
+        added = []
+        for x, y in coords:
+            y += hidden
+            # blocks above the hidden rows are lost, and don't change tops,
+            # which placements and drop distances index the rows with
+            if y >= 0:
+                bit = 1 << x
+                row = rows[y]
+                if not row & bit:
+                    rows[y] = row | bit
+                    counts[y] += 1
+                    if counts[y] == max_x and y >= hidden:
+                        cleared.append(y)
+                    if features is not None:
+                        added.append((x, y))
+                if y < tops[x]:
+                    tops[x] = y
+        if features is not None:
+            features.land(self, added)
+
+        if cleared:
+            # bottom up, so deleting a row doesn't move those still to delete
+            cleared.sort(reverse=True)
+            for y in cleared:
+                del rows[y]
+                del counts[y]
+            rows[0:0] = [0] * len(cleared)
+            counts[0:0] = [0] * len(cleared)
+            self.clear_tops(cleared[-1], len(cleared))
+            if features is not None:
+                features.delete_rows(self, cleared)
+
+        if features is not None and FeatureCache.DEBUG:
+            features.check(self)
+        self.cleared = [y - hidden for y in cleared]
+        return (100 * len(cleared)) * len(cleared)
+
+    def clear_tops(self, top, deleted):
+        """
+        Update the tops of the columns after rows are deleted. A column whose
+        top block was above the deleted rows just moves down, the others had
+        their top block in the highest deleted row, as it was complete, so
+        their new top is looked for below it.
+        :param top: Index of the highest row deleted.
+        :param deleted: Number of rows deleted.
+        """
+        rows = self.rows
+        tops = self.tops
+        lost = 0
+        for x, y in enumerate(tops):
+            if y < top:
+                tops[x] = y + deleted
+            else:
+                lost |= 1 << x
+
+        y = top + deleted
+        while lost and y < len(rows):
+            found = rows[y] & lost
+            lost ^= found
+            while found:
+                bit = found & -found
+                tops[bit.bit_length() - 1] = y
+                found ^= bit
+            y += 1
+        while lost:
+            bit = lost & -lost
+            tops[bit.bit_length() - 1] = len(rows)
+            lost ^= bit
+
+    def add_garbage(self, lines, gap):
+        """
+        Push the landed blocks up, and fill the bottom rows with blocks, in
+        every column but the gap. Blocks pushed above the hidden rows are lost.
+        :param lines: Number of rows to add.
+        :param gap: Column of the gap, the same in each row.
+        """
+        rows = self.rows
+        height = len(rows)
+        lines = min(lines, height)
+        del rows[:lines]
+        rows.extend([self.full_row & ~(1 << gap)] * lines)
+        del self.counts[:lines]
+        self.counts.extend([self.max_x - 1] * lines)
+        self.frozen = None
+
+        tops = self.tops
+        if min(tops) < lines:
+            self.tops = column_tops(rows, self.max_x)
+        else:
+            for x, y in enumerate(tops):
+                if y < height or x != gap:
+                    tops[x] = y - lines
+        # blocks may have been pushed off the top, so count them all again
+        if self.features is not None:
+            self.features.rebuild(self)
+
+    def output(self):
+        for row in self.rows[self.HIDDEN:]:
+            print("".join("X" if row >> x & 1 else "." for x in range(self.max_x)))
+
+    def check_block(self, coord):
+        """
+        Check if the x, y coordinate can have a block placed there.
+        That is; if there is a 'landed' block there or it is outside the
+        board boundary, then return False, otherwise return true.
+        """
+        if coord.x < 0 or coord.x >= self.max_x or coord.y >= self.max_y:
+            return False
+        y = coord.y + self.HIDDEN
+        return y < 0 or not self.rows[y] >> coord.x & 1
+
+    def fits(self, orientation, x, y):
+        """
+        Check if a shape in the given orientation can be placed with its
+        'middle' block at x, y. It is one AND per row the shape covers.
+        :param orientation: Orientation from the shape's ORIENTATIONS table.
+        """
+        left = x + orientation.min_x
+        if left < 0 or x + orientation.max_x >= self.max_x or y + orientation.max_y >= self.max_y:
+            return False
+
+        rows = self.rows
+        y += self.HIDDEN
+        for d_y, mask in orientation.masks:
+            if y + d_y >= 0 and rows[y + d_y] & (mask << left):
+                return False
+        return True
+
+    def drop_distance(self, orientation, x, y):
+        """
+        How many rows a shape can drop before it lands, from the tops of the
+        columns it covers. If it is under an overhang, i.e. there is a block
+        above it in one of its columns, then it is moved down a row at a time.
+        :param orientation: Orientation from the shape's ORIENTATIONS table.
+        :param x, y: Where the shape's 'middle' block is.
+        """
+        tops = self.tops
+        land_y = min(tops[x + d_x] - self.HIDDEN - 1 - d_y for d_x, d_y in orientation.bottoms)
+        if land_y < y:
+            land_y = y
+            while self.fits(orientation, x, land_y + 1):
+                land_y += 1
+        return land_y - y
+
+    def check_shape(self, coords):
+        """
+        Check if all the x, y coordinates of a shape can have a block placed
+        there. The coordinates are folded into a bit mask per row, so the
+        collision check is one AND per row the shape covers.
+        """
+        masks = {}
+        for x, y in coords:
+            if x < 0 or x >= self.max_x or y >= self.max_y:
+                return False
+            masks[y] = masks.get(y, 0) | (1 << x)
+
+        for y, mask in masks.items():
+            y += self.HIDDEN
+            if y >= 0 and self.rows[y] & mask:
+                return False
+        return True
+
+
+class Shape(object):
+    """
+    Shape is the  Base class for the game pieces e.g. square, T, S, Z, L,
+    reverse L and I. Shapes are constructed of blocks.
+
+    A shape is held as the x, y of its 'middle' block, which is always the
+    index 0 block in COORDS, and an index into ORIENTATIONS, the table of
+    the blocks relative to the middle block, for each 90-degree rotation.
+    The tables are made once, by make_orientations(), for every shape.
+    """
+    COORDS = ()
+    COLOUR = None
+    HEIGHT = 0
+    WIDTH = 0
+
+    ROTATIONS = 4
+    # Wall kicks, the (dx, dy) moves tried in turn to allow a rotation.
+    KICKS = ((0, 0), (1, 0), (-1, 0))
+    ORIENTATIONS = ()
+
+    def __init__(self, board, offset=None):
+        """
+        :param board: The BitBoard the shape is on, or None for a preview.
+        :param offset: Offset (x, y) to where the shape is initially placed.
+        """
+        self.board = board
+        self.rotation = 0
+        self.x, self.y = self.COORDS[0]
+        if offset is not None:
+            self.x += offset.x
+            self.y += offset.y
+
+    @property
+    def coords(self):
+        """The coordinates of the blocks, in the same order as COORDS."""
+        x = self.x
+        y = self.y
+        return [Coord(x + c.x, y + c.y) for c in self.ORIENTATIONS[self.rotation].cells]
+
+    def move(self, direction):
+        """
+        Move the blocks in the direction indicated by adding (dx, dy) to the
+        current block coordinates
+        """
+        d_x, d_y = direction_d[direction]
+
+        if not self.board.fits(self.ORIENTATIONS[self.rotation], self.x + d_x, self.y + d_y):
+            return False
+
+        self.x += d_x
+        self.y += d_y
+        return True
+
+    def drop_distance(self):
+        """How many rows the shape can drop before it lands."""
+        return self.board.drop_distance(self.ORIENTATIONS[self.rotation], self.x, self.y)
+
+    def rotate(self, clockwise=True):
+        """
+        Rotate the blocks around the 'middle' block, 90-degrees. If the
+        rotated shape doesn't fit, then try each of the wall kicks in turn.
+        """
+        if len(self.ORIENTATIONS) == 1:
+            return False
+
+        if clockwise:
+            rotation = (self.rotation + 1) % len(self.ORIENTATIONS)
+        else:
+            rotation = (self.rotation - 1) % len(self.ORIENTATIONS)
+        orientation = self.ORIENTATIONS[rotation]
+
+        for d_x, d_y in self.KICKS:
+            if self.board.fits(orientation, self.x + d_x, self.y + d_y):
+                self.x += d_x
+                self.y += d_y
+                self.rotation = rotation
+                return True
+        return False
+
+
+class LimitedRotateShape(Shape):
+    """
+    This is a base class for the shapes like the S, Z and I that don't fully
+    rotate (which would result in the shape moving *up* one block on a 180).
+    Instead they only have two orientations and toggle between them, which
+    ever way they are rotated.
+    """
+    ROTATIONS = 2
+
+
+class SquareShape(Shape):
+    """
+      0 1 2 .
+    0 X X
+    1 X X
+    2
+    .
+    """
+    COORDS = (Coord(0, 0), Coord(0, 1), Coord(1, 0), Coord(1, 1))
+    COLOUR = "red"
+    HEIGHT = 2
+    WIDTH = 2
+
+    # The square shape doesn't rotate, at all!
+    ROTATIONS = 1
+    KICKS = ()
+
+
+class TShape(Shape):
+    """
+      0 1 2 .
+    0 X X X
+    1   X
+    2
+    .
+    """
+    COORDS = (Coord(1, 0), Coord(0, 0),  Coord(2, 0), Coord(1, 1))
+    COLOUR = "yellow"
+    HEIGHT = 2
+    WIDTH = 3
+
+
+class LShape(Shape):
+    """
+      0 1 2 .
+    0 X
+    1 X
+    2 X X
+    .
+    """
+    COORDS = (Coord(0, 1), Coord(0, 0),  Coord(0, 2), Coord(1, 2))
+    COLOUR = "orange"
+    HEIGHT = 3
+    WIDTH = 2
+
+
+class JShape(Shape):
+    """
+      0 1 2 .
+    0   X
+    1   X
+    2 X X
+    .
+    """
+    COORDS = (Coord(1, 1), Coord(1, 0),   Coord(0, 2), Coord(1, 2))
+    COLOUR = "green"
+    HEIGHT = 3
+    WIDTH = 2
+
+
+class ZShape(LimitedRotateShape):
+    """
+      0 1 2 3 .
+    0   X
+    1 X X
+    2 X
+    .
+    """
+    COORDS = (Coord(0, 1), Coord(1, 0), Coord(1, 1), Coord(0, 2))
+    COLOUR = "purple"
+    HEIGHT = 3
+    WIDTH = 2
+
+
+class SShape(LimitedRotateShape):
+    """
+      0 1 2 3 .
+    0 X
+    1 X X
+    2   X
+    .
+    """
+    COORDS = (Coord(0, 1), Coord(0, 0), Coord(1, 1), Coord(1, 2))
+    COLOUR = "cyan"
+    HEIGHT = 3
+    WIDTH = 2
+
+
+class IShape(LimitedRotateShape):
+    """
+       0 1 .
+     0 X
+     1 X
+     2 X
+     3 X
+     .
+     """
+    COORDS = (Coord(0, 1), Coord(0, 0),   Coord(0, 2), Coord(0, 3))
+    COLOUR = "blue"
+    HEIGHT = 4
+    WIDTH = 1
+
+    KICKS = ((0, 0), (1, 0), (-1, 0), (2, 0), (-2, 0))
+
+
+SHAPES = [SquareShape,
+          TShape,
+          LShape,
+          JShape,
+          ZShape,
+          SShape,
+          IShape]
+
+
+def make_orientations(shape_cls):
+    """
+    Make the table of orientations for a shape, by rotating COORDS 90-degrees
+    clockwise around the 'middle' block, ROTATIONS times.
+    :param shape_cls: A Shape subclass, e.g. TShape.
+    :return: Tuple of Orientation.
+    """
+    middle = shape_cls.COORDS[0]
+    cells = [Coord(c.x - middle.x, c.y - middle.y) for c in shape_cls.COORDS]
+
+    orientations = []
+    for _ in range(shape_cls.ROTATIONS):
+        min_x = min(c.x for c in cells)
+        masks = {}
+        bottoms = {}
+        for c in cells:
+            masks[c.y] = masks.get(c.y, 0) | (1 << (c.x - min_x))
+            bottoms[c.x] = max(bottoms.get(c.x, c.y), c.y)
+        orientations.append(Orientation(
+            tuple(cells),
+            tuple(sorted(masks.items())),
+            min_x,
+            max(c.x for c in cells),
+            min(c.y for c in cells),
+            max(c.y for c in cells),
+            tuple(sorted(bottoms.items()))
+        ))
+        # to rotate 90-degrees (x,y) = (-y, x)
+        cells = [Coord(c.y, -c.x) for c in cells]
+    return tuple(orientations)
+
+
+for _shape_cls in SHAPES:
+    _shape_cls.ORIENTATIONS = make_orientations(_shape_cls)
+del _shape_cls
+
+
+MASK64 = 2**64 - 1
+
+
+def splitmix64(x):
+    """Mix the bits of a 64 bit number, so nearby numbers are far apart."""
+    x = (x + 0x9e3779b97f4a7c15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xbf58476d1ce4e5b9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94d049bb133111eb) & MASK64
+    return x ^ (x >> 31)
+
+
+def randbelow(random, n):
+    """
+    :return: A random integer from 0 to n - 1, as Random.randrange(n) makes
+             it on Python 3. Python 2 makes it another way, so the same seed
+             would give other tetrominoes there.
+    """
+    bits = n.bit_length()
+    r = random.getrandbits(bits)
+    while r >= n:
+        r = random.getrandbits(bits)
+    return r
+
+
+class PieceSequence(object):
+    """
+    The tetrominoes of a game, as indexes into SHAPES, from a seed.
+
+    They are made BLOCK at a time, into an array('B'), so taking the next one
+    isn't a call to the random number generator. Each block has its own
+    generator, seeded from the seed and the number of the block, so any
+    tetrominoe of the game is found by making the block it is in, without
+    making those before it.
+    """
+    BLOCK = 7 * 128
+
+    def __init__(self, seed=0, mode=UNIFORM):
+        """
+        :param seed: Integer seed.
+        :param mode: UNIFORM or BAG.
+        """
+        if mode not in MODES:
+            raise ValueError("unknown mode {0!r}".format(mode))
+        self.seed = seed
+        self.mode = mode
+        self.block_no = None
+        self.block = None
+
+    def make_block(self, block_no):
+        """:return: array('B') of the tetrominoes of a block."""
+        random = Random(splitmix64((self.seed & MASK64) ^ splitmix64(block_no)))
+        kinds = len(SHAPES)
+        if self.mode == BAG:
+            block = array('B')
+            bag = list(range(kinds))
+            for _ in range(self.BLOCK // kinds):
+                # shuffled as Random.shuffle() does on Python 3
+                for i in range(kinds - 1, 0, -1):
+                    j = randbelow(random, i + 1)
+                    bag[i], bag[j] = bag[j], bag[i]
+                block.extend(bag)
+            return block
+        return array('B', [randbelow(random, kinds) for _ in range(self.BLOCK)])
+
+    def __getitem__(self, i):
+        """:return: The index into SHAPES of tetrominoe i, from 0."""
+        block_no, i = divmod(i, self.BLOCK)
+        if block_no != self.block_no:
+            self.block = self.make_block(block_no)
+            self.block_no = block_no
+        return self.block[i]
+
+    def pieces(self, start, count):
+        """:return: array('B') of count tetrominoes from start."""
+        result = array('B')
+        while count > 0:
+            self[start]     # makes the block that start is in
+            i = start % self.BLOCK
+            taken = self.block[i:i + count]
+            result.extend(taken)
+            start += len(taken)
+            count -= len(taken)
+        return result
+
+    def split(self, n):
+        """
+        :return: List of n sequences, independent of this one and of each
+                 other, e.g. one for each of n workers.
+        """
+        return [PieceSequence(splitmix64((self.seed + 0x632be59bd9b4e019 * (i + 1)) & MASK64), self.mode)
+                for i in range(n)]
+
+
+class GameEngine(object):
+    """
+    The rules of the game, stepped one action at a time. Nothing is drawn,
+    instead the changes are emitted as events to the subscribers.
+    """
+    def __init__(self, max_x=MAXX, max_y=MAXY, seed=None, mode=UNIFORM, features=False):
+        """
+        :param max_x: Width of the board, in blocks.
+        :param max_y: Height of the board, in blocks.
+        :param seed: Seed for the seeds of the games, see new_game().
+        :param mode: How the tetrominoes are chosen, UNIFORM or BAG.
+        :param features: Keep the features of the board, in board.features.
+        """
+        self.board = BitBoard(max_x, max_y, features=features)
+        self.seeds = Random(seed)
+        self.seed = None
+        self.mode = mode
+        self.sequence = None
+        self.thresholds = level_thresholds(500, NO_OF_LEVELS)
+        self.listeners = []
+        self.garbage = []
+
+        self.state = READY
+        self.score = 0
+        self.level = 0
+        self.delay = 1000    # ms
+        self.pieces = 0
+        self.next_shape = None
+        self.shape = None
+
+    def subscribe(self, listener):
+        """
+        Add a listener, called as listener(event, *args) for every event.
+        """
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    def emit(self, event, *args):
+        for listener in self.listeners:
+            listener(event, *args)
+
+    def set_state(self, state):
+        self.state = state
+        self.emit(STATE, state)
+
+    def new_game(self, seed=None):
+        """
+        Start a new game. Every game has its own seed for the random choice
+        of tetrominoes, so it can be played again, move for move.
+        :param seed: The game's seed, by default the next from self.seeds.
+        """
+        if seed is None:
+            seed = self.seeds.randint(0, 2**32 - 1)
+        self.seed = seed
+        self.sequence = PieceSequence(seed, self.mode)
+
+        self.board.reset()
+        del self.garbage[:]
+        self.delay = 1000    # ms
+        self.score = 0
+        self.level = 0
+        self.pieces = 0
+        self.emit(RESET)
+        self.emit(SCORE, self.score)
+        self.emit(LEVEL, self.level)
+        self.set_state(PLAYING)
+        self.get_preview_shape()
+        self.shape = self.get_next_shape()
+
+    def snapshot(self):
+        """
+        :return: Snapshot of the game, to restore() later. Snapshots taken
+                 while the same tetrominoe is in play share their rows.
+        """
+        shape = self.shape
+        return Snapshot(
+            self.board.freeze(),
+            type(shape) if shape else None,
+            shape.x if shape else 0,
+            shape.y if shape else 0,
+            shape.rotation if shape else 0,
+            self.next_shape,
+            self.score,
+            self.level,
+            self.delay,
+            self.state,
+            self.pieces,
+            self.seed,
+            self.mode
+        )
+
+    def restore(self, snapshot):
+        """
+        Put the game back to a snapshot, then emit RESTORE and the events
+        to draw it: PREVIEW, SPAWN, SCORE, LEVEL and STATE.
+        """
+        self.board.set_rows(snapshot.rows)
+        del self.garbage[:]
+        self.score = snapshot.score
+        self.level = snapshot.level
+        self.delay = snapshot.delay
+        self.pieces = snapshot.pieces
+        if self.seed != snapshot.seed or self.mode != snapshot.mode or self.sequence is None:
+            self.seed = snapshot.seed
+            self.mode = snapshot.mode
+            self.sequence = PieceSequence(snapshot.seed, snapshot.mode)
+        self.next_shape = snapshot.next_shape
+        self.shape = None
+        if snapshot.shape:
+            self.shape = snapshot.shape(self.board)
+            self.shape.x = snapshot.x
+            self.shape.y = snapshot.y
+            self.shape.rotation = snapshot.rotation
+
+        self.emit(RESTORE, snapshot)
+        if self.next_shape:
+            self.emit(PREVIEW, self.next_shape)
+        if self.shape:
+            self.emit(SPAWN, self.shape)
+        self.emit(SCORE, self.score)
+        self.emit(LEVEL, self.level)
+        self.set_state(snapshot.state)
+
+    def step(self, action):
+        """
+        Apply one action to the game in play.
+        :param action: One of ACTIONS.
+        :return: True if the tetrominoe moved, otherwise False.
+        """
+        if self.listeners:
+            self.emit(ACTION, action)
+
+        if action == PAUSE:
+            if self.state == PLAYING:
+                self.set_state(PAUSED)
+            elif self.state == PAUSED:
+                self.set_state(PLAYING)
+            return False
+
+        if self.state != PLAYING or not self.shape:
+            return False
+
+        if action == TICK:
+            return self.handle_move(DOWN)
+        elif action == DROP:
+            return self.drop()
+        elif action == CLOCKWISE:
+            return self.rotate(clockwise=True)
+        elif action == ANTICLOCKWISE:
+            return self.rotate(clockwise=False)
+        else:
+            return self.handle_move(action)
+
+    def handle_move(self, direction):
+        shape = self.shape
+        old_coords = shape.coords
+
+        if shape.move(direction):
+            self.emit(MOVE, shape, old_coords)
+            return True
+
+        # if you can't move then you've hit something, and if your heading
+        # down then the shape has 'landed'
+        if direction == DOWN:
+            self.land()
+        return False
+
+    def drop(self):
+        """Drop the tetrominoe to the bottom, in one move, and land it."""
+        shape = self.shape
+        distance = shape.drop_distance()
+        if distance:
+            old_coords = shape.coords
+            shape.y += distance
+            self.emit(MOVE, shape, old_coords)
+        self.land()
+        return distance > 0
+
+    def rotate(self, clockwise=True):
+        shape = self.shape
+        old_coords = shape.coords
+
+        if shape.rotate(clockwise=clockwise):
+            self.emit(MOVE, shape, old_coords)
+            return True
+        return False
+
+    def add_garbage(self, lines, gap):
+        """
+        Add rows of garbage at the bottom of the board, e.g. sent by an
+        opponent clearing rows. They are added when the tetrominoe in play
+        lands, so it isn't pushed into them. Garbage that is still to be
+        added isn't part of a snapshot.
+        :param lines: Number of rows.
+        :param gap: Column of the gap in the rows.
+        """
+        self.garbage.append((lines, gap))
+
+    def land(self):
+        self.emit(LAND, self.shape)
+        self.score += self.board.check_for_complete_row(self.shape.coords)
+        if self.board.cleared:
+            self.emit(CLEAR, self.board.cleared)
+            self.emit(SCORE, self.score)
+        for lines, gap in self.garbage:
+            self.board.add_garbage(lines, gap)
+            self.emit(GARBAGE, lines, gap)
+        del self.garbage[:]
+        self.shape = self.get_next_shape()
+
+        # If there is no more room, the game is over
+        if self.board.is_game_over():
+            self.set_state(GAME_OVER)
+        # or do we go up a level!
+        elif self.level < NO_OF_LEVELS and self.score >= self.thresholds[self.level]:
+            self.level += 1
+            self.delay -= 100
+            self.emit(LEVEL, self.level)
+
+    def get_preview_shape(self):
+        """Select the next tetrominoe, the one after those spawned so far"""
+        self.next_shape = SHAPES[self.sequence[self.pieces]]
+        self.emit(PREVIEW, self.next_shape)
+
+    def get_next_shape(self):
+        """
+        Put the next shape on the board, so it is in play, and return it.
+        Then select a new next shape.
+        """
+        this_shape = self.next_shape(
+            self.board,
+            offset=Coord(self.board.max_x // 2 - 1, 0-self.next_shape.HEIGHT)
+        )
+        self.pieces += 1
+        self.emit(SPAWN, this_shape)
+        self.get_preview_shape()
+        return this_shape
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+"""Tetris Env - many games stepped at once, for training agents.
+
+VectorEnv holds K GameEngine games, and step() applies one action to each
+of them, in the style of a Gym vector environment. The games follow the
+same rules as the GUI, and the reward is the score each game got in the
+step, from BitBoard.check_for_complete_row(). A game that is over is
+started again straight away, so there is always a game in every slot.
+
+The observations are written into arrays that are made once, and returned
+from every step, so copy them to keep them:
+
+    board   (K, MAXY, MAXX) uint8, 1 where a block has landed
+    piece   (K, MAXY, MAXX) uint8, 1 where the tetrominoe in play is
+    shape   (K,) the tetrominoe in play, as an index into SHAPES
+    next    (K,) the next tetrominoe
+    score   (K,)
+    level   (K,)
+
+Only the boards that changed in a step are unpacked, together, and only
+the blocks of the tetrominoes that moved are cleared and set, so a step
+costs little more than stepping the games. The arrays can be passed in,
+e.g. views of shared memory for the workers of a training loop.
+
+    env = VectorEnv(64, seed=1)
+    obs = env.reset()
+    while training:
+        obs, rewards, dones, infos = env.step(agent(obs))
+
+This needs NumPy, as tetris_batch does.
+"""
+from __future__ import print_function, division
+
+import time
+
+import numpy as np
+
+from tetris_engine import (
+    MAXX, MAXY, LEFT, RIGHT, DOWN, DROP, CLOCKWISE, ANTICLOCKWISE, TICK, PLAYING, GAME_OVER, UNIFORM, BAG, SHAPES,
+    GameEngine
+)
+from tetris_batch import unpack
+
+# The actions, in the order of their numbers in the action array.
+ACTIONS = (LEFT, RIGHT, CLOCKWISE, ANTICLOCKWISE, DOWN, DROP)
+
+SHAPE_INDEX = dict((shape_cls, i) for i, shape_cls in enumerate(SHAPES))
+
+
+def make_buffers(num_envs, max_x=MAXX, max_y=MAXY):
+    """:return: dict of the observation arrays, see the module docstring."""
+    return {
+        "board": np.zeros((num_envs, max_y, max_x), dtype=np.uint8),
+        "piece": np.zeros((num_envs, max_y, max_x), dtype=np.uint8),
+        "shape": np.zeros(num_envs, dtype=np.int8),
+        "next": np.zeros(num_envs, dtype=np.int8),
+        "score": np.zeros(num_envs, dtype=np.int64),
+        "level": np.zeros(num_envs, dtype=np.int32),
+    }
+
+
+class VectorEnv(object):
+    """
+    K games, stepped together.
+    """
+    def __init__(self, num_envs, seed=None, mode=UNIFORM, max_x=MAXX, max_y=MAXY, gravity=1, buffers=None):
+        """
+        :param num_envs: K, the number of games.
+        :param seed: Game n is seeded from seed + n, or None for random games.
+        :param mode: How the tetrominoes are chosen, UNIFORM or BAG.
+        :param gravity: Steps between gravity ticks, 0 for none, so only
+                        the agent moves the tetrominoes down.
+        :param buffers: dict of the observation arrays to write into, as
+                        make_buffers() makes, or None for new ones.
+        """
+        self.num_envs = num_envs
+        self.max_x = max_x
+        self.gravity = gravity
+        self.engines = [
+            GameEngine(max_x, max_y, seed=None if seed is None else seed + i, mode=mode)
+            for i in range(num_envs)
+        ]
+        self.buffers = buffers if buffers is not None else make_buffers(num_envs, max_x, max_y)
+        self.rewards = np.zeros(num_envs, dtype=np.float32)
+        self.dones = np.zeros(num_envs, dtype=bool)
+        self.infos = {
+            "final_score": np.zeros(num_envs, dtype=np.int64),
+            "final_pieces": np.zeros(num_envs, dtype=np.int64),
+        }
+        self.steps = 0
+        # what is in the buffers, to only change what has changed since.
+        self.frozen = [None] * num_envs
+        self.coords = [[] for _ in range(num_envs)]
+
+    def reset(self):
+        """Start a new game in every slot. :return: The observations."""
+        for engine in self.engines:
+            engine.new_game()
+        self.steps = 0
+        self.observe()
+        return self.buffers
+
+    def step(self, actions):
+        """
+        :param actions: (K,) array of the number of each game's action, an
+                        index into ACTIONS.
+        :return: (observations, rewards, dones, infos). For the games that
+                 ended, dones is True, infos has their final score and
+                 number of tetrominoes, and the observations are of the
+                 new game started in their place.
+        """
+        tick = self.gravity and (self.steps + 1) % self.gravity == 0
+        self.steps += 1
+        rewards = self.rewards
+        dones = self.dones
+        final_score = self.infos["final_score"]
+        final_pieces = self.infos["final_pieces"]
+        for i, (engine, action) in enumerate(zip(self.engines, np.asarray(actions).tolist())):
+            score = engine.score
+            engine.step(ACTIONS[action])
+            if tick and engine.state == PLAYING:
+                engine.step(TICK)
+            rewards[i] = engine.score - score
+            done = engine.state == GAME_OVER
+            dones[i] = done
+            if done:
+                final_score[i] = engine.score
+                final_pieces[i] = engine.pieces
+                engine.new_game()
+            else:
+                final_score[i] = 0
+                final_pieces[i] = 0
+        self.observe()
+        return self.buffers, rewards, dones, self.infos
+
+    def observe(self):
+        """Write the state of the games into the observation arrays."""
+        buffers = self.buffers
+        engines = self.engines
+
+        # The rows are a new tuple whenever they change, so the boards that
+        # haven't changed are found without looking at them.
+        changed = []
+        rows = []
+        for i, engine in enumerate(engines):
+            frozen = engine.board.freeze()
+            if frozen is not self.frozen[i]:
+                self.frozen[i] = frozen
+                changed.append(i)
+                rows.append(frozen[engine.board.HIDDEN:])
+        if changed:
+            buffers["board"][changed] = unpack(np.array(rows, dtype=np.uint64), self.max_x)
+
+        cleared = ([], [], [])
+        placed = ([], [], [])
+        for i, engine in enumerate(engines):
+            coords = engine.shape.coords if engine.shape else []
+            old_coords = self.coords[i]
+            if coords != old_coords:
+                for c in old_coords:
+                    if c.y >= 0:
+                        cleared[0].append(i)
+                        cleared[1].append(c.y)
+                        cleared[2].append(c.x)
+                for c in coords:
+                    if c.y >= 0:
+                        placed[0].append(i)
+                        placed[1].append(c.y)
+                        placed[2].append(c.x)
+                self.coords[i] = coords
+        piece = buffers["piece"]
+        if cleared[0]:
+            piece[cleared] = 0
+        if placed[0]:
+            piece[placed] = 1
+
+        buffers["shape"][:] = [SHAPE_INDEX[type(engine.shape)] if engine.shape else 0 for engine in engines]
+        buffers["next"][:] = [SHAPE_INDEX[engine.next_shape] if engine.next_shape else 0 for engine in engines]
+        buffers["score"][:] = [engine.score for engine in engines]
+        buffers["level"][:] = [engine.level for engine in engines]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Time a VectorEnv, stepped with random actions.")
+    parser.add_argument("--envs", type=int, default=64, help="number of games stepped together")
+    parser.add_argument("--steps", type=int, default=1000, help="number of steps")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the first game")
+    parser.add_argument("--gravity", type=int, default=1, help="steps between gravity ticks")
+    parser.add_argument("--bag", action="store_true", help="deal the tetrominoes in bags of all seven")
+    args = parser.parse_args()
+
+    env = VectorEnv(args.envs, seed=args.seed, mode=BAG if args.bag else UNIFORM, gravity=args.gravity)
+    actions = np.random.RandomState(args.seed).randint(len(ACTIONS), size=(args.steps, args.envs))
+    env.reset()
+    games = 0
+    start = time.time()
+    for step_actions in actions:
+        obs, rewards, dones, infos = env.step(step_actions)
+        games += int(dones.sum())
+    seconds = time.time() - start
+    print("{0} steps of {1} games: {2:.0f} game steps/s, {3} games over".format(
+        args.steps, args.envs, args.steps * args.envs / seconds, games))
+
+
+if __name__ == "__main__":
+    main()
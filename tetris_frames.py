@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+"""Tetris Frames - draw games as text or images, without Tk.
+
+A FrameExporter subscribes to a GameEngine and keeps the colour of every
+landed block, as the GUI does, from the LAND, CLEAR, GARBAGE and RESTORE
+events, since the board only knows where the blocks are. A frame is the
+board with the tetrominoe in play, the next tetrominoe beside it, and in the
+text formats the score, level and number of tetrominoes:
+
+    ascii   a character per block, the letter of the tetrominoe it came from
+    ansi    the same in colour, for a terminal, each frame drawn over the last
+    ppm     a binary PPM (P6) image, scale pixels per block
+    png     a palette PNG image, compressed with zlib
+
+The colours are those the Shape subclasses draw their blocks in, COLOUR, as
+Tk shows them. Each row of a frame is looked up in a cache of the rows
+already drawn, and only a tetrominoe's rows change from move to move, so a
+frame is mostly joining rows that are already drawn.
+
+Frames are written to a binary file or pipe, for every tetrominoe or every
+move, e.g. to make a video of a game:
+
+    python tetris_frames.py --seed 1 --format ppm --every move | ffmpeg -f image2pipe -c:v ppm -i - game.mp4
+    python tetris_frames.py --replay game.ttr --format ansi
+"""
+from __future__ import print_function, division
+
+import struct
+import sys
+import time
+import zlib
+
+from tetris_engine import (
+    ACTION, RESET, LAND, CLEAR, STATE, RESTORE, GARBAGE, GAME_OVER, PLAYING, UNIFORM, BAG, SHAPES
+)
+
+FORMATS = ("ascii", "ansi", "ppm", "png")
+EVERY = ("piece", "move")
+
+# The colours of the blocks in a frame, by their index. After the blocks of
+# each of the SHAPES are those of garbage and restored rows, then the wall
+# between the board and the next tetrominoe, and the empty space around it.
+EMPTY = 0
+GARBAGE_BLOCK = len(SHAPES) + 1
+WALL = GARBAGE_BLOCK + 1
+BLANK = WALL + 1
+COLOURS = ["black"] + [shape_cls.COLOUR for shape_cls in SHAPES] + ["grey", "grey", "black"]
+SHAPE_INDEX = dict((shape_cls, i + 1) for i, shape_cls in enumerate(SHAPES))
+
+LETTERS = {
+    "SquareShape": "O", "TShape": "T", "LShape": "L", "JShape": "J", "ZShape": "Z", "SShape": "S", "IShape": "I"
+}
+CHARS = "." + "".join(LETTERS[shape_cls.__name__] for shape_cls in SHAPES) + "#| "
+
+# The colours as Tk shows them, the X11 colours of the names.
+RGB = {
+    "black": (0, 0, 0),
+    "white": (255, 255, 255),
+    "grey": (190, 190, 190),
+    "red": (255, 0, 0),
+    "yellow": (255, 255, 0),
+    "orange": (255, 165, 0),
+    "green": (0, 255, 0),
+    "purple": (160, 32, 240),
+    "cyan": (0, 255, 255),
+    "blue": (0, 0, 255),
+}
+
+# Columns beside the board, for the next tetrominoe: the wall, a space, four
+# blocks, a space.
+PANEL = 7
+PREVIEW_X = 2
+PREVIEW_Y = 1
+
+# Most rows drawn to keep, the cache is emptied when it has more.
+CACHE_SIZE = 4096
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+
+class FrameExporter(object):
+    """
+    Draws the frames of the games played by an engine.
+    """
+    def __init__(self, engine, out=None, format="ascii", scale=8, every=None, level=1):
+        """
+        :param engine: The GameEngine to draw.
+        :param out: Binary file to write the frames to, or None to only
+                    draw them with frame().
+        :param format: One of FORMATS.
+        :param scale: Pixels per block, in the image formats.
+        :param every: When to write a frame, "piece" for every tetrominoe
+                      or "move" for every move, or None for only at game
+                      over. Frames are written before the action that
+                      follows, so each frame is of a whole step.
+        :param level: zlib compression level of the png format, 0-9.
+        """
+        if format not in FORMATS:
+            raise ValueError("format must be one of {0}, not {1}".format(", ".join(FORMATS), format))
+        if every is not None and every not in EVERY:
+            raise ValueError("every must be one of {0}, not {1}".format(", ".join(EVERY), every))
+        self.engine = engine
+        self.out = out
+        self.format = format
+        self.scale = scale
+        self.every = every
+        self.level = level
+        self.frames = 0
+        self.cache = {}
+        self.dirty = True
+        self.last_piece = None
+        self.draw_row = getattr(self, "draw_" + format)
+        self.char_table = bytearray(range(256))
+        self.char_table[:len(CHARS)] = CHARS.encode("ascii")
+        self.char_table = bytes(self.char_table)
+        self.palette = b"".join(struct.pack("BBB", *RGB[colour]) for colour in COLOURS)
+        self.set_rows(engine.board.rows, engine.board.max_x)
+        engine.subscribe(self.engine_event)
+
+    def close(self):
+        self.engine.unsubscribe(self.engine_event)
+
+    def set_rows(self, rows, max_x, colour=GARBAGE_BLOCK):
+        """
+        Colour the blocks of rows, e.g. of a restored game, whose colours
+        aren't known.
+        :param rows: Row bit masks, as BitBoard.rows.
+        """
+        self.cells = [bytearray(colour if row >> x & 1 else EMPTY for x in range(max_x)) for row in rows]
+
+    def engine_event(self, event, *args):
+        if event == ACTION:
+            engine = self.engine
+            if self.out is not None and self.every is not None and engine.state == PLAYING:
+                if self.every == "move" and self.dirty or engine.pieces != self.last_piece:
+                    self.write()
+            return
+
+        self.dirty = True
+        cells = self.cells
+        if event == LAND:
+            colour = SHAPE_INDEX[type(args[0])]
+            hidden = len(cells) - self.engine.board.max_y
+            for x, y in args[0].coords:
+                if y + hidden >= 0:
+                    cells[y + hidden][x] = colour
+        elif event == CLEAR:
+            hidden = len(cells) - self.engine.board.max_y
+            max_x = len(cells[0])
+            for y in args[0]:
+                del cells[y + hidden]
+            cells[0:0] = [bytearray(max_x) for _ in args[0]]
+        elif event == GARBAGE:
+            lines, gap = args
+            lines = min(lines, len(cells))
+            max_x = len(cells[0])
+            del cells[:lines]
+            for _ in range(lines):
+                row = bytearray([GARBAGE_BLOCK]) * max_x
+                row[gap] = EMPTY
+                cells.append(row)
+        elif event == RESET:
+            self.set_rows(self.engine.board.rows, self.engine.board.max_x)
+        elif event == RESTORE:
+            self.set_rows(args[0].rows, self.engine.board.max_x)
+        elif event == STATE and args[0] == GAME_OVER:
+            if self.out is not None:
+                self.write()
+
+    def write(self):
+        """Write a frame of the game as it is now."""
+        self.out.write(self.frame())
+        self.frames += 1
+        self.dirty = False
+        self.last_piece = self.engine.pieces
+
+    def frame_rows(self):
+        """:return: The rows of the frame, as bytearrays of colour indices."""
+        engine = self.engine
+        board = engine.board
+        max_x = board.max_x
+        cells = self.cells
+        hidden = len(cells) - board.max_y
+        panel = [bytearray([WALL]) + bytearray([BLANK]) * (PANEL - 1) for _ in range(board.max_y)]
+        rows = [row + panel_row for row, panel_row in zip(cells[hidden:], panel)]
+
+        shape = engine.shape
+        if shape is not None:
+            colour = SHAPE_INDEX[type(shape)]
+            for x, y in shape.coords:
+                if 0 <= y < len(rows):
+                    rows[y][x] = colour
+
+        if engine.next_shape is not None:
+            orientation = engine.next_shape.ORIENTATIONS[0]
+            colour = SHAPE_INDEX[engine.next_shape]
+            for d_x, d_y in orientation.cells:
+                y = PREVIEW_Y + d_y - orientation.min_y
+                if y < len(rows):
+                    rows[y][max_x + PREVIEW_X + d_x - orientation.min_x] = colour
+        return rows
+
+    def frame(self):
+        """:return: A frame of the game as it is now, as bytes in the format."""
+        rows = self.frame_rows()
+        cache = self.cache
+        if len(cache) > CACHE_SIZE:
+            cache.clear()
+        drawn = []
+        for row in rows:
+            key = bytes(row)
+            line = cache.get(key)
+            if line is None:
+                line = cache[key] = self.draw_row(key)
+            drawn.append(line)
+        return getattr(self, "frame_" + self.format)(drawn, len(rows[0]), len(rows))
+
+    def status(self):
+        engine = self.engine
+        return "score {0} level {1} pieces {2}".format(engine.score, engine.level, engine.pieces).encode("ascii")
+
+    def draw_ascii(self, row):
+        return row.translate(self.char_table)
+
+    def frame_ascii(self, drawn, width, height):
+        return b"\n".join(drawn) + b"\n" + self.status() + b"\n\n"
+
+    def draw_ansi(self, row):
+        line = []
+        last = None
+        for colour in bytearray(row):
+            if colour != last:
+                line.append("\x1b[48;2;{0};{1};{2}m".format(*RGB[COLOURS[colour]]))
+                last = colour
+            line.append("  ")
+        line.append("\x1b[0m")
+        return "".join(line).encode("ascii")
+
+    def frame_ansi(self, drawn, width, height):
+        # home the cursor, so each frame is drawn over the last one
+        return b"\x1b[H" + b"\n".join(drawn) + b"\n" + self.status() + b"\x1b[K\n"
+
+    def pixel_lines(self, row):
+        """
+        :return: The lines of pixels of a row, as colour indices. A block is
+                 drawn with a black outline on its right and bottom, as the
+                 Tk canvas outlines its rectangles.
+        """
+        scale = self.scale
+        outline = scale >= 3
+        fill = []
+        edge = []
+        for colour in bytearray(row):
+            if outline and EMPTY < colour <= GARBAGE_BLOCK:
+                fill.append(bytes(bytearray([colour])) * (scale - 1) + b"\x00")
+                edge.append(b"\x00" * scale)
+            else:
+                fill.append(bytes(bytearray([colour])) * scale)
+                edge.append(fill[-1])
+        fill = b"".join(fill)
+        edge = b"".join(edge)
+        return [fill] * (scale - 1) + [edge] if outline else [fill] * scale
+
+    def draw_png(self, row):
+        # each line of pixels starts with its filter type, 0 for none
+        return b"".join(b"\x00" + line for line in self.pixel_lines(row))
+
+    def frame_png(self, drawn, width, height):
+        scale = self.scale
+        header = struct.pack(">IIBBBBB", width * scale, height * scale, 8, 3, 0, 0, 0)
+        return b"".join((
+            PNG_SIGNATURE,
+            png_chunk(b"IHDR", header),
+            png_chunk(b"PLTE", self.palette),
+            png_chunk(b"IDAT", zlib.compress(b"".join(drawn), self.level)),
+            png_chunk(b"IEND", b""),
+        ))
+
+    def draw_ppm(self, row):
+        palette = self.palette
+        rgb = [palette[i * 3:i * 3 + 3] for i in range(len(COLOURS))]
+        return b"".join(b"".join(rgb[colour] for colour in bytearray(line)) for line in self.pixel_lines(row))
+
+    def frame_ppm(self, drawn, width, height):
+        header = "P6\n{0} {1}\n255\n".format(width * self.scale, height * self.scale).encode("ascii")
+        return header + b"".join(drawn)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Draw games of Tetris Tk as text or images, without a display.")
+    parser.add_argument("--format", choices=FORMATS, default="ascii", help="format of the frames")
+    parser.add_argument("--every", choices=EVERY, default="piece", help="write a frame for every tetrominoe or move")
+    parser.add_argument("--scale", type=int, default=8, help="pixels per block, of the images")
+    parser.add_argument("--output", default="-", help="file to write the frames to, - for stdout")
+    parser.add_argument("--replay", default=None, help="draw a recorded game, instead of the bot playing")
+    parser.add_argument("--games", type=int, default=1, help="number of games for the bot to play")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the tetrominoes")
+    parser.add_argument("--max-pieces", type=int, default=None, help="stop a game after this many tetrominoes")
+    parser.add_argument("--bag", action="store_true", help="deal the tetrominoes from a shuffled bag of seven")
+    args = parser.parse_args()
+
+    if args.output == "-":
+        out = getattr(sys.stdout, "buffer", sys.stdout)
+    else:
+        out = open(args.output, "wb")
+
+    start = time.time()
+    if args.replay:
+        from tetris_replay import Replay
+
+        replay = Replay(args.replay)
+        engine = replay.new_engine()
+        exporter = FrameExporter(engine, out, args.format, args.scale, args.every)
+        replay.play(engine)
+    else:
+        from tetris_ai import AIPlayer
+        from tetris_engine import GameEngine
+
+        engine = GameEngine(seed=args.seed, mode=BAG if args.bag else UNIFORM)
+        exporter = FrameExporter(engine, out, args.format, args.scale, args.every)
+        player = AIPlayer(engine)
+        for game in range(args.games):
+            player.play_game(args.max_pieces)
+            if engine.state != GAME_OVER:
+                exporter.write()
+    out.flush()
+    elapsed = time.time() - start
+    print("{0} frames, {1:.0f} frames/s".format(exporter.frames, exporter.frames / max(elapsed, 1e-9)),
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
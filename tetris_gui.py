@@ -0,0 +1,519 @@
+"""Tetris GUI - the Tk widgets of Tetris Tk.
+
+The boards the blocks are drawn on and the info panel, which are all that
+need Tk. Only tetris_tk.GameController imports this, when it builds the
+window, so the rest of the game, and tetris_tk itself, can be imported
+without Tk, e.g. by worker processes or on machines without a display.
+"""
+import math
+import sys
+if sys.version_info[0] > 2:
+    import tkinter.font as tkFont
+    from tkinter import *
+else:
+    import tkFont
+    from Tkinter import *
+from tetris_engine import PLAYING, Coord, BitBoard
+from tetris_scheduler import clock
+
+SCALE = 20
+OFFSET = 3
+
+
+class TBoard(Frame):
+    """
+    A Frame containing a Canvas, on which blocks can be displayed, moved and deleted, at will. A block is just a Canvas
+    rectangle. Tetrominoes are made up of blocks.
+
+    This is simplifying the Canvas object so that the blocks can be placed and manipulated by coordinated in an
+    X, Y Grid, and this class will scale them appropriately.
+
+    Deleted blocks are only hidden, and kept in a pool to be reused by add_block, so once there are enough
+    rectangles for a game no more are created.
+    """
+    POOL = "pool"
+
+    def __init__(self, parent, scale, max_x, max_y, offset):
+        """
+        Created the TBoard. It is up to the creator to Pack/Grid this.
+        :param parent: The parent TKinter object
+        :param scale: Scale e.g. scale an x by y 'block' by 'scale' pixels.
+        :param max_x: max X coordinate
+        :param max_y: max Y coordinate
+        :param offset: Offset from top left for block creation.
+        """
+        Frame.__init__(self, parent)
+        self.parent = parent
+        self.scale = scale
+        self.max_x = max_x
+        self.max_y = max_y
+        self.offset = offset
+
+        self.canvas = Canvas(
+            self,
+            height=(max_y * scale) + offset,
+            width=(max_x * scale) + offset,
+            bg="black"
+            )
+
+        self.canvas.pack()
+        self.pool = []
+
+    def add_block(self, coord, colour):
+            """
+            Add a block (rectangle of size (1 * SCALE)**2)
+            :param self: instance
+            :param coord: X, Y Coordinate point
+            :param colour: Block colour
+            :return: The Tkinter ID of the block (rectangle) on the canvas.
+            """
+            rx = (coord.x * self.scale) + self.offset
+            ry = (coord.y * self.scale) + self.offset
+
+            if self.pool:
+                block = self.pool.pop()
+                self.canvas.coords(block, rx, ry, rx + self.scale, ry + self.scale)
+                self.canvas.itemconfigure(block, fill=colour, state=NORMAL, tags=())
+                return block
+
+            return self.canvas.create_rectangle(rx, ry, rx + self.scale, ry + self.scale, fill=colour)
+
+    def add_shape(self, coords, colour):
+            """
+            Add the blocks of a shape
+            :param self: instance
+            :param coords: X, Y Coordinate points of the blocks
+            :param colour: Block colour
+            :return: The Tkinter IDs of the blocks, in the same order as coords.
+            """
+            return [self.add_block(coord, colour) for coord in coords]
+
+    def move_block(self, id, coord):
+            """
+            Move a block by relative x, y coordinate distance.
+            :param self: instance
+            :param id: Canvas id of the block (rectangle)
+            :param coord: X, Y Coordinate to move to, relative to the current block position.
+            """
+            self.canvas.move(id, coord.x * self.scale, coord.y * self.scale)
+
+    def place_block(self, id, coord):
+            """
+            Move a block to an x, y coordinate.
+            :param self: instance
+            :param id: Canvas id of the block (rectangle)
+            :param coord: X, Y Coordinate to move to.
+            """
+            rx = (coord.x * self.scale) + self.offset
+            ry = (coord.y * self.scale) + self.offset
+            self.canvas.coords(id, rx, ry, rx + self.scale, ry + self.scale)
+
+    def delete_block(self, id):
+            """
+            Delete the identified block, by hiding it and putting it in the pool.
+            :param self: instance
+            :param id: Canvas id of the block (rectangle) to delete.
+            :return:
+            """
+            self.canvas.itemconfigure(id, state=HIDDEN, tags=(self.POOL,))
+            self.pool.append(id)
+
+    def delete_blocks(self, tag):
+            """
+            Delete all the blocks with a tag, by hiding them and putting them in the pool.
+            :param self: instance
+            :param tag: Canvas tag, or tag expression, of the blocks to delete.
+            :return:
+            """
+            self.pool.extend(self.canvas.find_withtag(tag))
+            self.canvas.itemconfigure(tag, state=HIDDEN, tags=(self.POOL,))
+
+
+class TetrisBoard(TBoard):
+    """
+    The board represents the tetris playing area. A grid of x by y blocks.
+
+    The rules are in tetris_engine.BitBoard, this is only the view of the
+    blocks that have landed. Each landed block is tagged with a tag for its
+    row, so a complete row is deleted, and the rows above it are moved down,
+    with one canvas call no matter how many blocks there are. HIDDEN rows
+    above the top of the board are included, because that is where new
+    tetrominoes are spawned.
+
+    The ghost is the outline of where the tetrominoe in play would land, made
+    of its own rectangles which are never put in the pool.
+
+    Animations, e.g. of rows being cleared, are run together, once every
+    FRAME ms, while there are any. The board is changed straight away, so
+    the next tetrominoe can land while one runs, and it only changes how the
+    blocks get there. cancel_animations() ends them all at once, as they
+    would have ended. The frames are only drawn from Tk's event loop, so
+    when it isn't run, e.g. in a benchmark, starting an animation ends those
+    that are over, and the oldest beyond MAX_ANIMATIONS.
+    """
+    HIDDEN = BitBoard.HIDDEN
+    LANDED = "landed"
+    GHOST = "ghost"
+    FRAME = 16          # ms
+    ANIMATE = True
+    MAX_ANIMATIONS = 8
+
+    def __init__(self, parent, scale=20, max_x=10, max_y=20, offset=3):
+        """
+        Init and config the tetris board, default configuration:
+        Scale (block size in pixels) = 20
+        max X (in blocks) = 10
+        max Y (in blocks) = 20
+        offset (in pixels) = 3
+        """
+        TBoard.__init__(self, parent, scale, max_x, max_y, offset)
+        self.row_serial = 0
+        self.row_tags = [self.new_row_tag() for _ in range(max_y + self.HIDDEN)]
+        self.row_counts = [0] * (max_y + self.HIDDEN)
+        self.ghost_ids = []
+        self.ghost_coords = None
+        self.ghost_colour = None
+        self.animations = []
+        self.animation_id = None
+
+    def new_row_tag(self, prefix="row"):
+        """
+        Row tags are never reused, so that the tag moves with the row when
+        the rows below it are deleted.
+        """
+        self.row_serial += 1
+        return "%s%d" % (prefix, self.row_serial)
+
+    def reset(self):
+        """
+        Reset the board by clearing all the blocks from a previous game.
+        :return:
+        """
+        self.cancel_animations()
+        self.delete_blocks(self.LANDED)
+        self.row_counts = [0] * len(self.row_counts)
+        self.hide_ghost()
+
+    def animate(self, animation):
+        """Start an animation, or if ANIMATE is False, just end it."""
+        if not self.ANIMATE:
+            animation.finish()
+            return
+        now = clock()
+        running = []
+        for running_animation in self.animations:
+            if now - running_animation.start >= running_animation.DURATION:
+                running_animation.finish()
+            else:
+                running.append(running_animation)
+        while len(running) >= self.MAX_ANIMATIONS:
+            running.pop(0).finish()
+        animation.start = now
+        running.append(animation)
+        self.animations = running
+        if self.animation_id is None:
+            self.animation_id = self.after(self.FRAME, self.run_animations)
+
+    def run_animations(self):
+        """Draw a frame of each animation, as far through it as the time now."""
+        self.animation_id = None
+        now = clock()
+        running = []
+        for animation in self.animations:
+            t = min(1.0, (now - animation.start) / animation.DURATION)
+            animation.frame(t)
+            if t < 1.0:
+                running.append(animation)
+        self.animations = running
+        if running:
+            self.animation_id = self.after(self.FRAME, self.run_animations)
+
+    def cancel_animations(self):
+        if self.animation_id is not None:
+            self.after_cancel(self.animation_id)
+            self.animation_id = None
+        animations = self.animations
+        self.animations = []
+        for animation in animations:
+            animation.finish()
+
+    def show_ghost(self, coords, colour):
+        """
+        Show the ghost at coords. Only the blocks that are somewhere else
+        than last time are moved, so it costs nothing while the tetrominoe
+        falls straight down.
+        :param coords: X, Y Coordinates of the blocks of the ghost.
+        :param colour: Colour of the outline.
+        """
+        if not self.ghost_ids:
+            self.ghost_ids = [
+                self.canvas.create_rectangle(0, 0, 0, 0, fill="", outline=colour, tags=(self.GHOST,))
+                for _ in coords
+            ]
+        if self.ghost_coords is None or colour != self.ghost_colour:
+            self.canvas.itemconfigure(self.GHOST, outline=colour, state=NORMAL)
+            self.ghost_colour = colour
+
+        old_coords = self.ghost_coords or [None] * len(coords)
+        for block, old, new in zip(self.ghost_ids, old_coords, coords):
+            if old != new:
+                self.place_block(block, new)
+        self.ghost_coords = coords
+
+    def hide_ghost(self):
+        if self.ghost_coords is not None:
+            self.canvas.itemconfigure(self.GHOST, state=HIDDEN)
+            self.ghost_coords = None
+
+    def game_over_animation(self):
+        """Something cool to show the game is over, the blocks are swept away."""
+        self.animate(GameOverSweep(self))
+
+    def add_rows(self, rows, colour):
+        """
+        Add landed blocks from row bit masks, e.g. those of a restored game.
+        :param rows: Row bit masks, as BitBoard.rows, including the HIDDEN rows.
+        :param colour: Block colour, as the bit masks don't have the colours.
+        """
+        for y, row in enumerate(rows):
+            coords = [Coord(x, y - self.HIDDEN) for x in range(self.max_x) if row >> x & 1]
+            if coords:
+                self.land_blocks(self.add_shape(coords, colour), coords)
+
+    def add_garbage(self, lines, gap, colour):
+        """
+        Push the landed blocks up, and add rows of garbage at the bottom, as
+        BitBoard.add_garbage() does. The blocks pushed off the top are
+        deleted, and the rest are moved with one canvas call.
+        :param lines: Number of rows to add.
+        :param gap: Column of the gap, the same in each row.
+        :param colour: Block colour of the garbage.
+        """
+        lines = min(lines, len(self.row_tags))
+        lost = [self.row_tags[y] for y in range(lines) if self.row_counts[y]]
+        if lost:
+            self.delete_blocks("||".join(lost))
+        self.canvas.move(self.LANDED, 0, -lines * self.scale)
+        self.row_tags = self.row_tags[lines:] + [self.new_row_tag() for _ in range(lines)]
+        self.row_counts = self.row_counts[lines:] + [0] * lines
+
+        coords = [Coord(x, y) for y in range(self.max_y - lines, self.max_y) for x in range(self.max_x) if x != gap]
+        self.land_blocks(self.add_shape(coords, colour), coords)
+
+    def land_blocks(self, ids, coords):
+        """
+        Add the blocks of a shape that has landed to the board.
+        :param ids: Canvas ids of the blocks (rectangles)
+        :param coords: X, Y Coordinates of the blocks, in the same order.
+        """
+        for block, coord in zip(ids, coords):
+            y = coord.y + self.HIDDEN
+            if y >= 0:
+                self.canvas.itemconfigure(block, tags=(self.LANDED, self.row_tags[y]))
+                self.row_counts[y] += 1
+            else:
+                self.delete_block(block)
+
+    def delete_rows(self, rows):
+        """
+        Delete complete rows of blocks and move all the rows above them down,
+        animated by ClearRows. The blocks of the deleted rows are tagged with
+        one canvas call, and the rows above them with one call for each gap
+        between the deleted rows, so they are moved a tag at a time.
+        :param rows: The rows to delete.
+        """
+        deleted = sorted(y + self.HIDDEN for y in rows)
+        cleared = self.new_row_tag("cleared")
+        self.canvas.itemconfigure("||".join(self.row_tags[y] for y in deleted), tags=(cleared,))
+
+        # Rows move down by the number of deleted rows below them.
+        moves = []
+        top = 0
+        for drop, y in zip(range(len(deleted), 0, -1), deleted):
+            tags = [self.row_tags[ay] for ay in range(top, y) if self.row_counts[ay]]
+            if tags:
+                # a tag of their own, so blocks that land in the rows later aren't moved.
+                falling = self.new_row_tag("falling")
+                self.canvas.addtag_withtag(falling, "||".join(tags))
+                moves.append((falling, drop * self.scale))
+            top = y + 1
+        self.animate(ClearRows(self, cleared, moves))
+
+        kept = [y for y in range(len(self.row_tags)) if y not in deleted]
+        self.row_tags = [self.new_row_tag() for _ in deleted] + [self.row_tags[y] for y in kept]
+        self.row_counts = [0] * len(deleted) + [self.row_counts[y] for y in kept]
+
+
+class Animation(object):
+    """
+    An effect on a TetrisBoard that lasts DURATION seconds. frame() is
+    called with how far through it is, so it keeps to time however late the
+    frames are, and only changes what is due by then.
+    """
+    DURATION = 0.2
+
+    def __init__(self, board):
+        self.board = board
+        self.start = None
+
+    def frame(self, t):
+        """:param t: Fraction of the duration that has passed, 0 to 1."""
+
+    def finish(self):
+        """End the animation now, as it would have ended."""
+        self.frame(1.0)
+
+
+class ClearRows(Animation):
+    """
+    The deleted rows flash, then disappear, and the rows above slide down.
+    """
+    DURATION = 0.2
+    FLASH = 0.5     # of the duration
+    FLASH_COLOUR = "white"
+
+    def __init__(self, board, cleared, moves):
+        """
+        :param cleared: Tag of the blocks of the deleted rows.
+        :param moves: List of (tag, pixels) of the blocks to move down.
+        """
+        Animation.__init__(self, board)
+        self.cleared = cleared
+        self.moves = moves
+        self.done = 0.0
+        board.canvas.itemconfigure(cleared, fill=self.FLASH_COLOUR)
+
+    def frame(self, t):
+        if t < self.FLASH:
+            return
+        canvas = self.board.canvas
+        if self.cleared:
+            self.board.delete_blocks(self.cleared)
+            self.cleared = None
+        done = (t - self.FLASH) / (1.0 - self.FLASH)
+        for tag, pixels in self.moves:
+            dy = int(pixels * done) - int(pixels * self.done)
+            if dy:
+                canvas.move(tag, 0, dy)
+            if done >= 1.0:
+                canvas.dtag(tag, tag)
+        self.done = done
+
+
+class GameOverSweep(Animation):
+    """
+    The landed blocks disappear, a row at a time, from the top down.
+    """
+    DURATION = 1.0
+
+    def __init__(self, board):
+        Animation.__init__(self, board)
+        self.rows = [y for y, count in enumerate(board.row_counts) if count]
+        self.done = 0
+
+    def frame(self, t):
+        board = self.board
+        n = int(math.ceil(len(self.rows) * t))
+        if n > self.done:
+            rows = self.rows[self.done:n]
+            board.delete_blocks("||".join(board.row_tags[y] for y in rows))
+            for y in rows:
+                board.row_counts[y] = 0
+            self.done = n
+
+
+class InfoPanel(Frame):
+    """The info panel has a grid layout manager and displays the following game info:
+    * The score
+    * The level
+    * Preview panel - next Tetrominoe.
+    * keyboard controls
+    * Quit button
+    * New game button
+    * Status e.g. if the game is Paused"""
+
+    def __init__(self, parent, new_game_fn, quit_fn):
+        """Init the info panel e.g. do all the setup for it."""
+        Frame.__init__(self, parent, bg="grey")
+
+        self.parent = parent
+        self.score_var = StringVar()
+        self.level_var = StringVar()
+        self.state_var = StringVar()
+        self.update_score(0)
+        self.update_level(0)
+
+        my_font = tkFont.Font(root=self.parent, family="Times New Roman", size=16, weight="normal")
+        Label(self, text="Tetris TK", justify=CENTER, font=my_font, pady=5).pack(side=TOP, fill=X)
+
+        slf = LabelFrame(self, padx=5, pady=5)
+        slf.pack(side=TOP, fill=X)
+        Label(slf, text="Score:", anchor=W, justify=LEFT, width=10).grid(column=0, row=0)
+        score_lbl = Label(slf, bd=5, relief=SUNKEN, anchor=E, textvariable=self.score_var, width=10)
+        score_lbl.grid(column=1, row=0)
+
+        Label(slf, text="Level:", anchor=W, justify=LEFT, width=10).grid(column=0, row=1)
+        level_lbl = Label(slf, bd=5, relief=SUNKEN, anchor=E, textvariable=self.level_var, width=10)
+        level_lbl.grid(column=1, row=1)
+
+        self.preview = TBoard(self, scale=SCALE, max_x=4, max_y=4, offset=OFFSET)
+        self.preview.pack()
+
+        ctrl_frame = LabelFrame(self, text="Controls", padx=5, pady=5)
+        ctrl_frame.pack(side=TOP, fill=X)
+
+        Label(ctrl_frame, text="Pause:", anchor=W, justify=LEFT, width=8).grid(column=0, row=0, columnspan=2)
+        Label(ctrl_frame, text="P", width=5, relief=GROOVE).grid(column=2, row=0)
+
+        Label(ctrl_frame, text="   ").grid(column=2, row=1)  # blank line
+
+        Label(ctrl_frame, text="Drop:", anchor=W, justify=LEFT, width=8).grid(column=0, row=2, columnspan=2)
+        Label(ctrl_frame, text="^", width=5, relief=GROOVE).grid(column=3, row=2)
+
+        Label(ctrl_frame, text="Move:", anchor=W, justify=LEFT, width=8).grid(column=0, row=3, columnspan=2)
+        Label(ctrl_frame, text="<", width=5, relief=GROOVE).grid(column=2, row=3)
+        Label(ctrl_frame, text="v", width=5, relief=GROOVE).grid(column=3, row=3)
+        Label(ctrl_frame, text=">", width=5, relief=GROOVE).grid(column=4, row=3)
+
+        Label(ctrl_frame, text="Left").grid(column=2, row=4)
+        Label(ctrl_frame, text="Down").grid(column=3, row=4)
+        Label(ctrl_frame, text="Right").grid(column=4, row=4)
+
+        Label(ctrl_frame, text="Rotate:", anchor=W, justify=LEFT, width=8).grid(column=0, row=5, columnspan=2)
+        Label(ctrl_frame, text="A", width=5, relief=GROOVE).grid(column=2, row=5)
+        Label(ctrl_frame, text="S", width=5, relief=GROOVE).grid(column=4, row=5)
+
+        state_frame = LabelFrame(self, text="State", padx=5, pady=5)
+        state_frame.pack(side=TOP, fill=X)
+        Label(state_frame, textvariable=self.state_var, justify=CENTER, font=my_font).pack(side=TOP, fill=X)
+
+        btn_frame = LabelFrame(self, padx=5, pady=5)
+        btn_frame.pack(side=BOTTOM, fill=X)
+        self.new_game_bttn = Button(btn_frame, text="New Game", padx=5, pady=5, command=new_game_fn)
+        self.new_game_bttn.pack(side=BOTTOM, fill=X)
+        self.quit_bttn = Button(btn_frame, text="Quit", padx=5, pady=5, command=quit_fn)
+        self.quit_bttn.pack(side=TOP, fill=X)
+
+    def update_score(self, score):
+        self.score_var.set("{:>010d}".format(score))
+
+    def update_level(self, level):
+        self.level_var.set("{:>10d}".format(level))
+
+    def show_stats(self, text):
+        """Show the timings of the game, in a frame that is added the first time."""
+        if not hasattr(self, "stats_var"):
+            self.stats_var = StringVar()
+            stats_frame = LabelFrame(self, text="Stats (p50/p99/max)", padx=5, pady=5)
+            stats_frame.pack(side=TOP, fill=X)
+            # fixed width, so the columns of the histograms line up
+            Label(stats_frame, textvariable=self.stats_var, justify=LEFT, anchor=W, font="TkFixedFont").pack(
+                side=TOP, fill=X)
+        self.stats_var.set(text)
+
+    def update_state(self, state):
+        self.state_var.set(state)
+        if state not in PLAYING:
+            self.new_game_bttn.config(state=NORMAL)
+        else:
+            self.new_game_bttn.config(state=DISABLED)
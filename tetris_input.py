@@ -0,0 +1,140 @@
+"""Tetris Input - key presses buffered, and repeated, at the game's own rate.
+
+Held keys are repeated by the operating system, as a burst of key presses
+(and on X11 a key release before each one), which would each move the
+tetrominoe and redraw it straight away. The InputQueue keeps which keys are
+held instead, ignoring the operating system's repeats, and the game polls it
+once a frame for the actions to apply:
+
+    * a key press is one action, applied at the next poll.
+    * a move key that is held starts repeating after DAS milliseconds (the
+      delayed auto-shift), once every ARR milliseconds (the auto-repeat
+      rate). An ARR of 0 moves as far as it can at once.
+
+Only the last of left and right that was pressed is repeated, so pressing
+one while holding the other changes direction, and releasing it goes back
+to the other after DAS again.
+
+    queue = InputQueue(das=170, arr=50)
+    queue.press(LEFT, event.time)
+    ...
+    for action in queue.poll():
+        engine.step(action)
+"""
+from __future__ import division
+
+from tetris_engine import LEFT, RIGHT, DOWN
+from tetris_scheduler import clock
+
+DAS = 170   # ms
+ARR = 50    # ms
+
+# Actions that are repeated while the key is held.
+REPEATED = (LEFT, RIGHT, DOWN)
+
+# Most repeats of a key in one poll, enough to cross the board.
+MAX_REPEATS = 10
+
+
+class InputQueue(object):
+    """
+    Key presses, and held keys, waiting to be applied to the game.
+    """
+    def __init__(self, das=DAS, arr=ARR, clock=clock):
+        """
+        :param das: Milliseconds a move key is held before it repeats.
+        :param arr: Milliseconds between repeats, 0 to repeat at once.
+        :param clock: Function returning the time in seconds, monotonic.
+        """
+        self.das = das
+        self.arr = arr
+        self.clock = clock
+        self.queue = []
+        self.queued_at = []     # time each key press in the queue was queued
+        self.pressed_at = []    # time each key press in the last poll was queued
+        self.held = {}          # action -> time of the next repeat
+        self.releases = {}      # action -> event time of a release not yet applied
+        self.last_shift = None
+
+    def clear(self):
+        """Forget every key, e.g. when the window loses the focus."""
+        del self.queue[:]
+        del self.queued_at[:]
+        self.pressed_at = []
+        self.held.clear()
+        self.releases.clear()
+        self.last_shift = None
+
+    def press(self, action, event_time=None):
+        """
+        :param action: The action of the key.
+        :param event_time: Tk's event.time, to tell the operating system's
+                           repeats from a key that was released and pressed
+                           again.
+        """
+        if action in self.held:
+            release = self.releases.pop(action, None)
+            if release is None or release == event_time:
+                # a repeat, on X11 the release and press have the same time
+                return
+            del self.held[action]
+
+        now = self.clock()
+        self.queue.append(action)
+        self.queued_at.append(now)
+        if action in REPEATED:
+            self.held[action] = now + self.das / 1000.0
+            if action != DOWN:
+                self.last_shift = action
+        else:
+            # held, but not repeated, so its repeats are ignored too.
+            self.held[action] = None
+
+    def release(self, action, event_time=None):
+        """The release is applied at the next poll, unless a repeat comes first."""
+        if action in self.held:
+            self.releases[action] = event_time
+
+    def poll(self):
+        """
+        :return: List of the actions to apply now, the key presses in the
+                 order they were made, then the repeats of held keys. The
+                 times the key presses were queued are in pressed_at.
+        """
+        now = self.clock()
+        released = self.releases
+        self.releases = {}
+        for action in released:
+            del self.held[action]
+        if self.last_shift in released:
+            # back to the other way, if that is still held, after DAS again.
+            other = RIGHT if self.last_shift == LEFT else LEFT
+            if other in self.held:
+                self.held[other] = now + self.das / 1000.0
+                self.last_shift = other
+            else:
+                self.last_shift = None
+
+        actions = self.queue
+        self.queue = []
+        self.pressed_at = self.queued_at
+        self.queued_at = []
+
+        for action, next_repeat in self.held.items():
+            if next_repeat is None or now < next_repeat:
+                continue
+            if action in (LEFT, RIGHT) and action != self.last_shift:
+                continue
+            if self.arr <= 0:
+                actions.extend([action] * MAX_REPEATS)
+                self.held[action] = now
+                continue
+            repeats = 0
+            while now >= next_repeat and repeats < MAX_REPEATS:
+                repeats += 1
+                next_repeat += self.arr / 1000.0
+            if now >= next_repeat:
+                next_repeat = now + self.arr / 1000.0
+            self.held[action] = next_repeat
+            actions.extend([action] * repeats)
+        return actions
@@ -0,0 +1,368 @@
+"""Tetris Replay - record games to a compact binary file, and play them back.
+
+A game is its seed and mode, see GameEngine.new_game(), and the actions passed to
+GameEngine.step(): the key presses and the gravity ticks. The Recorder
+listens for the ACTION events and writes each one, as it happens, with the
+time since the last one. Most actions take one byte.
+
+Every KEYFRAME_INTERVAL tetrominoes the Recorder also writes a keyframe, the
+whole state of the game: the board's rows, the score, the level, the shapes
+in play and so on. A Replay reads the file through mmap, and can seek to any
+tetrominoe by starting from the keyframe before it, instead of playing the
+game from the start, so no more than KEYFRAME_INTERVAL tetrominoes are ever
+played to get there.
+
+File format, all integers little endian:
+    header      "TTKR", version (B), max_x (H), max_y (H), seed (Q), keyframe interval (H),
+                mode (B, index into MODES)
+    records     one byte of (delta << 4 | code), delta is the milliseconds
+                since the last record, if it is 15 or more then the byte has
+                15 and it is followed by a varint of (delta - 15).
+                Codes 0-7 are ACTIONS, KEYFRAME is followed by a varint length
+                and the keyframe's varints, END ends the game.
+    index       after END, the number of keyframes and (piece, offset) of each,
+                as varints.
+    trailer     offset of the index (Q), "TTKI"
+
+A file without an index, e.g. from a game that is still being recorded, is
+scanned for its keyframes instead.
+
+    recorder = Recorder(engine, "game.ttr")
+    engine.new_game()
+    ...
+    recorder.close()
+
+    replay = Replay("game.ttr")
+    engine = replay.seek(100)     # at the start of the 100th tetrominoe
+"""
+import io
+import mmap
+import operator
+import struct
+import time
+from bisect import bisect_right
+
+from tetris_engine import (
+    ACTIONS, ACTION, RESET, RESTORE, GARBAGE, STATE, GAME_OVER, SHAPES, MODES, READY, PLAYING, PAUSED, Snapshot,
+    GameEngine
+)
+
+MAGIC = b"TTKR"
+INDEX_MAGIC = b"TTKI"
+VERSION = 2
+HEADER = struct.Struct("<4sBHHQHB")
+TRAILER = struct.Struct("<Q4s")
+
+KEYFRAME = 8
+END = 9
+
+KEYFRAME_INTERVAL = 16
+
+STATES = (READY, PLAYING, PAUSED, GAME_OVER)
+
+# byte_at(data, offset) is the byte at offset of bytes or an mmap, as an int.
+# On Python 2 indexing them gives a str of the byte instead.
+if bytes is str:
+    def byte_at(data, offset):
+        return ord(data[offset])
+else:
+    byte_at = operator.getitem
+
+
+def write_varint(out, value):
+    """Append an unsigned integer to a bytearray, 7 bits at a time."""
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, offset):
+    """:return: (value, offset after it)"""
+    value = 0
+    shift = 0
+    while True:
+        byte = byte_at(data, offset)
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def zigzag(value):
+    """Signed to unsigned, so small negative numbers stay small."""
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def unzigzag(value):
+    return value // 2 if not value & 1 else -(value + 1) // 2
+
+
+class Recorder(object):
+    """
+    Records the games played by an engine. Each game is written to a file,
+    from when it starts until it is over, or the recorder is closed.
+    """
+    def __init__(self, engine, path, keyframe_interval=KEYFRAME_INTERVAL, clock=time.time):
+        """
+        :param engine: The GameEngine to record.
+        :param path: File to write, or a function of the game's seed that
+                     returns the file to write, to record more than one game.
+        :param keyframe_interval: Tetrominoes between keyframes.
+        :param clock: Function returning the time in seconds.
+        """
+        self.engine = engine
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.clock = clock
+        self.file = None
+        self.keyframes = []
+        self.offset = 0
+        self.last_time = 0
+        self.last_piece = 0
+        engine.subscribe(self.engine_event)
+
+    def engine_event(self, event, *args):
+        if event == ACTION:
+            if self.file:
+                self.write_action(args[0])
+        elif event == RESET:
+            self.start()
+        elif event == STATE and args[0] == GAME_OVER:
+            self.finish()
+        elif event in (RESTORE, GARBAGE):
+            # the game can't be played again from its actions any more.
+            self.finish()
+
+    def start(self):
+        self.finish()
+        engine = self.engine
+        path = self.path(engine.seed) if callable(self.path) else self.path
+        self.file = io.open(path, "wb")
+        self.file.write(HEADER.pack(
+            MAGIC, VERSION, engine.board.max_x, engine.board.max_y, engine.seed, self.keyframe_interval,
+            MODES.index(engine.mode)
+        ))
+        self.offset = HEADER.size
+        self.keyframes = []
+        self.start_time = self.last_time = self.clock()
+        self.last_piece = engine.pieces
+
+    def write(self, data):
+        self.file.write(data)
+        self.offset += len(data)
+
+    def record(self, code, out):
+        """Add a record to out, with the milliseconds since the last record."""
+        now = self.clock()
+        delta = max(0, int(round((now - self.last_time) * 1000)))
+        self.last_time += delta / 1000.0
+        if delta < 15:
+            out.append(delta << 4 | code)
+        else:
+            out.append(0xf0 | code)
+            write_varint(out, delta - 15)
+
+    def write_action(self, action):
+        engine = self.engine
+        out = bytearray()
+        if engine.pieces != self.last_piece:
+            self.last_piece = engine.pieces
+            if engine.pieces % self.keyframe_interval == 0:
+                self.keyframes.append((engine.pieces, self.offset))
+                self.record(KEYFRAME, out)
+                keyframe = self.keyframe(int(round((self.last_time - self.start_time) * 1000)))
+                write_varint(out, len(keyframe))
+                out += keyframe
+        self.record(ACTIONS.index(action), out)
+        self.write(bytes(out))
+
+    def keyframe(self, time_ms):
+        """The state of the game between two actions."""
+        engine = self.engine
+        shape = engine.shape
+        out = bytearray()
+        for value in (time_ms, engine.pieces, engine.score, engine.level, zigzag(engine.delay),
+                      STATES.index(engine.state), SHAPES.index(type(shape)), zigzag(shape.x),
+                      zigzag(shape.y), shape.rotation, SHAPES.index(engine.next_shape),
+                      len(engine.board.rows)):
+            write_varint(out, value)
+        for row in engine.board.rows:
+            write_varint(out, row)
+        return out
+
+    def finish(self):
+        """End the game being recorded, and write the index of keyframes."""
+        if not self.file:
+            return
+        out = bytearray()
+        self.record(END, out)
+        index = self.offset + len(out)
+        write_varint(out, len(self.keyframes))
+        for piece, offset in self.keyframes:
+            write_varint(out, piece)
+            write_varint(out, offset)
+        out += TRAILER.pack(index, INDEX_MAGIC)
+        self.write(bytes(out))
+        self.file.close()
+        self.file = None
+
+    def close(self):
+        self.finish()
+        self.engine.unsubscribe(self.engine_event)
+
+
+class Replay(object):
+    """
+    A recorded game, read through mmap.
+    """
+    def __init__(self, path):
+        with io.open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = HEADER.unpack_from(self.data, 0)[:2]
+        if magic != MAGIC:
+            raise ValueError("{0} is not a Tetris Tk replay".format(path))
+        if version != VERSION:
+            # version 1 chose the tetrominoes differently, so can't be played.
+            raise ValueError("{0} is a replay from another version of Tetris Tk".format(path))
+        magic, version, self.max_x, self.max_y, self.seed, self.keyframe_interval, mode = \
+            HEADER.unpack_from(self.data, 0)
+        self.mode = MODES[mode]
+
+        self.keyframes = self.read_index()
+        self.pieces = [piece for piece, offset in self.keyframes]
+
+    def close(self):
+        self.data.close()
+
+    def read_index(self):
+        """:return: List of (piece, offset) of the keyframes."""
+        data = self.data
+        if len(data) >= HEADER.size + TRAILER.size:
+            index, magic = TRAILER.unpack_from(data, len(data) - TRAILER.size)
+            if magic == INDEX_MAGIC:
+                count, offset = read_varint(data, index)
+                keyframes = []
+                for _ in range(count):
+                    piece, offset = read_varint(data, offset)
+                    position, offset = read_varint(data, offset)
+                    keyframes.append((piece, position))
+                return keyframes
+
+        keyframes = []
+        for offset, time_ms, code, payload in self.records():
+            if code == KEYFRAME:
+                # the number of the tetrominoe follows the time
+                piece = read_varint(data, read_varint(data, payload)[1])[0]
+                keyframes.append((piece, offset))
+        return keyframes
+
+    def records(self, offset=None, time_ms=0):
+        """
+        Iterate over the records from offset, until END or the end of the file.
+        :return: Iterator of (offset, time_ms, code, payload offset)
+        """
+        data = self.data
+        offset = HEADER.size if offset is None else offset
+        end = len(data)
+        while offset < end:
+            start = offset
+            try:
+                byte = byte_at(data, offset)
+                offset += 1
+                code = byte & 0x0f
+                delta = byte >> 4
+                if delta == 15:
+                    extra, offset = read_varint(data, offset)
+                    delta += extra
+                payload = offset
+                if code == KEYFRAME:
+                    length, payload = read_varint(data, offset)
+                    offset = payload + length
+                    if offset > end:
+                        return
+                    # keyframes have the time since the start of the game,
+                    # so records can be read from any keyframe.
+                    time_ms = read_varint(data, payload)[0]
+                else:
+                    time_ms += delta
+            except IndexError:
+                # The last record of a file that is still being written.
+                return
+            if code == END:
+                return
+            yield start, time_ms, code, payload
+
+    def actions(self):
+        """
+        :return: Iterator of (time_ms, action) of every action in the game.
+        """
+        for offset, time_ms, code, payload in self.records():
+            if code < KEYFRAME:
+                yield time_ms, ACTIONS[code]
+
+    def new_engine(self):
+        return GameEngine(self.max_x, self.max_y, mode=self.mode)
+
+    def play(self, engine=None):
+        """
+        Play the whole game again.
+        :param engine: The GameEngine to play it on, e.g. one with a GUI
+                       subscribed, or None for a new one.
+        :return: The engine, at the end of the game.
+        """
+        engine = engine or self.new_engine()
+        engine.mode = self.mode
+        engine.new_game(self.seed)
+        for offset, time_ms, code, payload in self.records():
+            if code < KEYFRAME:
+                engine.step(ACTIONS[code])
+        return engine
+
+    def restore(self, engine, payload):
+        """Put the engine in the state of the keyframe at payload."""
+        data = self.data
+        values = []
+        offset = payload
+        for _ in range(12):
+            value, offset = read_varint(data, offset)
+            values.append(value)
+        (time_ms, pieces, score, level, delay, state, shape, x, y, rotation, next_shape, count) = values
+        rows = []
+        for _ in range(count):
+            row, offset = read_varint(data, offset)
+            rows.append(row)
+
+        engine.restore(Snapshot(
+            tuple(rows), SHAPES[shape], unzigzag(x), unzigzag(y), rotation, SHAPES[next_shape], score,
+            level, unzigzag(delay), STATES[state], pieces, self.seed, self.mode
+        ))
+
+    def seek(self, piece, engine=None):
+        """
+        Play the game up to the start of a tetrominoe, from the keyframe
+        before it.
+        :param piece: The number of the tetrominoe, from 1.
+        :param engine: The GameEngine to use, or None for a new one.
+        :return: The engine, before the first action for the tetrominoe, or
+                 at the end of the game if it never got that far.
+        """
+        engine = engine or self.new_engine()
+        engine.mode = self.mode
+        i = bisect_right(self.pieces, piece) - 1
+        if i < 0:
+            engine.new_game(self.seed)
+            records = self.records()
+        else:
+            records = self.records(self.keyframes[i][1])
+            start, time_ms, code, payload = next(records)
+            self.restore(engine, payload)
+
+        for start, time_ms, code, payload in records:
+            if code < KEYFRAME:
+                if engine.pieces >= piece:
+                    break
+                engine.step(ACTIONS[code])
+        return engine
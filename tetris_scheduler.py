@@ -0,0 +1,83 @@
+"""Tetris Scheduler - gravity ticks at a fixed rate, without drift.
+
+Re-arming a timer for the full delay after each tick is done makes every
+tick late by however long the last one took, e.g. one that cleared rows. The
+TickScheduler instead keeps the time the next tick is due, on a monotonic
+clock, and adds the delay to that, not to the time now. A timer that fires
+late gets the ticks that are due, in order, and the wait for the one after
+is shortened to match.
+
+The scheduler only says when ticks are due. The caller steps the game for
+each of them, and draws once afterwards, so ticks that are caught up on are
+not each drawn.
+
+    scheduler = TickScheduler(lambda: engine.delay)
+    scheduler.start()
+    ...
+    for _ in range(scheduler.due()):
+        engine.step(TICK)
+    parent.after(scheduler.wait_ms(), ...)
+"""
+from __future__ import division
+
+import math
+import time
+
+clock = getattr(time, "monotonic", time.time)
+
+# Most ticks to catch up on at once, e.g. after the machine was suspended.
+MAX_CATCH_UP = 5
+
+
+class TickScheduler(object):
+    """
+    When the gravity ticks of a game are due.
+    """
+    def __init__(self, delay, clock=clock, max_catch_up=MAX_CATCH_UP):
+        """
+        :param delay: Function returning the milliseconds between ticks,
+                      which is read again for each tick, as it changes with
+                      the level.
+        :param clock: Function returning the time in seconds, monotonic.
+        :param max_catch_up: Most ticks due() returns. If more than that are
+                             late then the rest are dropped, and the ticks
+                             start again from now.
+        """
+        self.delay = delay
+        self.clock = clock
+        self.max_catch_up = max_catch_up
+        self.next_tick = None
+        self.remaining = None
+
+    def start(self):
+        """Start ticking, the first tick is one delay from now."""
+        self.next_tick = self.clock() + self.delay() / 1000.0
+        self.remaining = None
+
+    def due(self):
+        """
+        :return: The number of ticks due now, each is counted once.
+        """
+        now = self.clock()
+        ticks = 0
+        while now >= self.next_tick:
+            ticks += 1
+            if ticks == self.max_catch_up:
+                self.next_tick = now + self.delay() / 1000.0
+                break
+            self.next_tick += self.delay() / 1000.0
+        return ticks
+
+    def wait_ms(self):
+        """:return: Milliseconds until the next tick is due."""
+        return max(0, int(math.ceil((self.next_tick - self.clock()) * 1000)))
+
+    def pause(self):
+        """Keep the time left until the next tick."""
+        self.remaining = max(0.0, self.next_tick - self.clock())
+
+    def resume(self):
+        """The next tick is due after the time that was left at pause()."""
+        if self.remaining is not None:
+            self.next_tick = self.clock() + self.remaining
+            self.remaining = None
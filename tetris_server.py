@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""Tetris Server - headless games played over a socket, thousands at once.
+
+Each connection is a session with its own GameEngine, so the games follow
+the same rules as the GUI: the level thresholds, the score for complete
+rows and the faster drop at each level. Everything runs on one asyncio
+event loop, with no thread per game. The gravity of each game is a single
+timer on the loop, at the time its TickScheduler says the next tick is due,
+and the state a session keeps is bounded: the engine, at most MAX_LINE
+bytes of a message not yet read and at most the write buffer's high water
+mark of updates not yet sent.
+
+Messages are lines of JSON, both ways. The client sends one of:
+
+    {"new_game": {"seed": 1, "mode": "bag"}}    a game on its own, the
+                                                seed and mode are optional
+    {"versus": "room"}                          a game against the next
+                                                client to join the room
+    {"action": "left"}                          any of the actions, but
+                                                ticks are the server's
+    {"watch": 12}                               watch game 12
+
+and the server sends the state of the game after the messages it has read,
+or a tick. Updates that can't be sent yet, as the client isn't reading
+them, are replaced by the next one, so a slow client is sent the latest
+state, not every state in between. The rows are only sent when they change:
+
+    {"state": "PLAYING", "score": 0, "level": 0, "pieces": 1,
+     "rows": [0, ...], "shape": [[4, -1], ...], "next": "TShape"}
+
+The server sends {"game": 12} when a game starts, and spectators watching it
+are sent {"watching": 12} and then the game as a tetris_stream, of binary
+frames, until the game's client disconnects.
+
+A client waiting in a versus room is sent {"waiting": "room"}, and its
+actions are refused until the game starts. In versus, both games have the
+same seed, and clearing rows sends garbage rows to the opponent
+(GARBAGE_LINES), which are added at the bottom of their board when their
+tetrominoe lands. The last one playing wins.
+
+    python3 tetris_server.py --port 7000
+    python3 tetris_server.py --unix /tmp/tetris.sock
+
+This needs Python 3, for asyncio.
+"""
+from __future__ import print_function, division
+
+import argparse
+import asyncio
+import json
+from random import Random
+
+from tetris_engine import (
+    MAXX, MAXY, ACTIONS, TICK, PAUSE, PLAYING, GAME_OVER, UNIFORM, BAG, MODES, CLEAR, STATE, GameEngine
+)
+from tetris_scheduler import TickScheduler
+from tetris_telemetry import FORMATS as TELEMETRY_FORMATS, GameTelemetry, TelemetryLog
+from tetris_stream import Encoder, Broadcast
+
+# Garbage rows sent to the opponent, by the number of rows cleared at once.
+GARBAGE_LINES = (0, 0, 1, 2, 4)
+
+# Longest message, in bytes, a client that sends more is disconnected.
+MAX_LINE = 4096
+
+# Bytes of updates buffered for a client before updates are held back.
+HIGH_WATER = 64 * 1024
+
+MAX_SESSIONS = 10000
+
+# Connections waiting to be accepted, for many clients connecting at once.
+BACKLOG = 1024
+
+
+class Session(asyncio.Protocol):
+    """
+    One client's connection, and its game.
+    """
+    def __init__(self, server, id):
+        self.server = server
+        self.id = id
+        self.loop = server.loop
+        self.engine = GameEngine(server.max_x, server.max_y, mode=server.mode)
+        self.engine.subscribe(self.engine_event)
+        self.telemetry = None
+        if server.telemetry:
+            self.telemetry = GameTelemetry(self.engine, server.telemetry, clock=self.loop.time)
+        self.scheduler = TickScheduler(lambda: self.engine.delay, clock=self.loop.time)
+        self.timer = None
+        self.transport = None
+        self.buffer = b""
+        self.dirty = False
+        self.writing = True
+        self.sent_rows = None
+        self.room = None
+        self.opponent = None
+        self.gaps = None
+        self.broadcast = None
+        self.spectators = []
+        self.watching = None        # the session of the game watched
+        self.subscriber = None      # of its Broadcast
+
+    # asyncio callbacks
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if len(self.server.sessions) >= self.server.max_sessions:
+            self.send({"error": "too many games"})
+            transport.close()
+            return
+        self.server.sessions[self.id] = self
+        transport.set_write_buffer_limits(high=HIGH_WATER)
+
+    def data_received(self, data):
+        if self.subscriber:
+            return
+        lines = (self.buffer + data).split(b"\n")
+        self.buffer = lines.pop()
+        if len(self.buffer) > MAX_LINE or any(len(line) > MAX_LINE for line in lines):
+            self.send({"error": "message too long"})
+            self.transport.close()
+            return
+        for line in lines:
+            if line.strip():
+                self.handle(line)
+        self.flush()
+
+    def connection_lost(self, exc):
+        self.server.sessions.pop(self.id, None)
+        self.stop()
+        if self.telemetry:
+            self.telemetry.close()
+        if self.subscriber:
+            self.subscriber.close()
+            self.watching.spectators.remove(self)
+        if self.broadcast:
+            self.broadcast.close()
+            for spectator in self.spectators:
+                spectator.watching = spectator.subscriber = None
+                spectator.transport.close()
+        if self.room is not None:
+            self.server.leave(self)
+        opponent = self.opponent
+        if opponent:
+            self.opponent = opponent.opponent = None
+            opponent.game_over(won=True)
+        self.engine.unsubscribe(self.engine_event)
+
+    def pause_writing(self):
+        self.writing = False
+        if self.subscriber:
+            self.subscriber.pause()
+
+    def resume_writing(self):
+        self.writing = True
+        if self.subscriber:
+            self.subscriber.resume()
+        self.flush()
+
+    # messages
+
+    def handle(self, line):
+        try:
+            message = json.loads(line.decode("utf-8"))
+            if not isinstance(message, dict):
+                raise ValueError("not an object")
+        except (ValueError, RecursionError) as e:
+            # RecursionError, for arrays nested thousands deep
+            self.send({"error": "bad message: {0}".format(e)})
+            return
+
+        if "action" in message:
+            self.action(message["action"])
+        elif "new_game" in message:
+            options = message["new_game"]
+            if not isinstance(options, dict):
+                options = {}
+            seed = options.get("seed")
+            mode = options.get("mode", self.engine.mode)
+            if self.opponent or self.room is not None:
+                self.send({"error": "in a versus game"})
+            elif mode not in MODES:
+                self.send({"error": "unknown mode"})
+            elif seed is not None and (not isinstance(seed, int) or isinstance(seed, bool) or
+                                       not 0 <= seed < 2**64):
+                self.send({"error": "seed must be an integer from 0 to 2**64 - 1"})
+            else:
+                self.engine.mode = mode
+                self.new_game(seed)
+        elif "versus" in message:
+            if self.opponent or self.room is not None:
+                self.send({"error": "in a versus game"})
+            else:
+                self.stop()
+                self.server.join(self, str(message["versus"]))
+        elif "watch" in message:
+            session = self.server.sessions.get(message["watch"]) if isinstance(message["watch"], int) else None
+            if self.opponent:
+                self.send({"error": "in a versus game"})
+            elif session is None or session is self:
+                self.send({"error": "no such game"})
+            else:
+                self.watch(session)
+        else:
+            self.send({"error": "unknown message"})
+
+    def action(self, action):
+        if action not in ACTIONS or action == TICK:
+            self.send({"error": "unknown action"})
+            return
+        if self.room is not None:
+            self.send({"error": "waiting for an opponent"})
+            return
+        engine = self.engine
+        if action == PAUSE:
+            if self.opponent:
+                return
+            if engine.state == PLAYING:
+                self.stop()
+                self.scheduler.pause()
+                engine.step(PAUSE)
+            else:
+                engine.step(PAUSE)
+                self.scheduler.resume()
+                self.start()
+            return
+        engine.step(action)
+
+    def send(self, message):
+        self.transport.write(json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n")
+
+    def update(self):
+        """:return: The message with the state of the game."""
+        engine = self.engine
+        board = engine.board
+        message = {
+            "state": engine.state,
+            "score": engine.score,
+            "level": engine.level,
+            "pieces": engine.pieces,
+        }
+        rows = board.freeze()
+        if rows is not self.sent_rows:
+            self.sent_rows = rows
+            message["rows"] = rows[board.HIDDEN:]
+        if engine.shape:
+            message["shape"] = engine.shape.coords
+        if engine.next_shape:
+            message["next"] = engine.next_shape.__name__
+        if engine.garbage:
+            message["garbage"] = sum(lines for lines, gap in engine.garbage)
+        return message
+
+    def flush(self):
+        """
+        Send the state of the game, if it has changed and the client is
+        reading, and what has changed to the spectators.
+        """
+        if self.broadcast:
+            self.broadcast.publish()
+        if self.dirty and self.writing and not self.transport.is_closing():
+            self.dirty = False
+            self.send(self.update())
+
+    # the game
+
+    def engine_event(self, event, *args):
+        self.dirty = True
+        if event == CLEAR and self.opponent:
+            lines = GARBAGE_LINES[min(len(args[0]), len(GARBAGE_LINES) - 1)]
+            if lines:
+                self.opponent.garbage(lines)
+        elif event == STATE and args[0] == GAME_OVER:
+            self.stop()
+            opponent = self.opponent
+            if opponent:
+                self.opponent = opponent.opponent = None
+                self.send({"result": "lose"})
+                opponent.game_over(won=True)
+
+    def new_game(self, seed=None, opponent=None):
+        """Start a game, against the opponent's game in versus."""
+        self.stop()
+        self.opponent = opponent
+        self.sent_rows = None
+        self.engine.new_game(seed)
+        self.gaps = Random(self.engine.seed)
+        self.send({"game": self.id})
+        self.scheduler.start()
+        self.start()
+        self.flush()
+
+    def garbage(self, lines):
+        """Garbage rows sent by the opponent."""
+        if self.engine.state == PLAYING:
+            self.engine.add_garbage(lines, self.gaps.randrange(self.engine.board.max_x))
+            self.dirty = True
+            self.flush()
+
+    def game_over(self, won):
+        """The versus game has ended, before this game did."""
+        self.stop()
+        if self.engine.state != GAME_OVER:
+            self.engine.set_state(GAME_OVER)
+        if not self.transport.is_closing():
+            self.send({"result": "win" if won else "lose"})
+            self.flush()
+
+    def watch(self, session):
+        """Stop playing, and be sent session's game instead."""
+        self.stop()
+        if self.room is not None:
+            self.server.leave(self)
+        if session.broadcast is None:
+            session.broadcast = Broadcast(Encoder(session.engine))
+        session.spectators.append(self)
+        self.send({"watching": session.id})
+        self.watching = session
+        self.subscriber = session.broadcast.subscribe(self.transport.write)
+        if not self.writing:
+            self.subscriber.pause()
+
+    def start(self):
+        """Arm the gravity timer, for the next tick."""
+        if self.timer is None and self.engine.state == PLAYING:
+            self.timer = self.loop.call_at(self.scheduler.next_tick, self.tick)
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def tick(self):
+        self.timer = None
+        for _ in range(self.scheduler.due()):
+            self.engine.step(TICK)
+        self.flush()
+        self.start()
+
+
+class GameServer(object):
+    """
+    The sessions, and the versus rooms waiting for a second player.
+    """
+    def __init__(self, max_x=MAXX, max_y=MAXY, seed=None, mode=UNIFORM, max_sessions=MAX_SESSIONS, loop=None,
+                 telemetry=None):
+        """
+        :param seed: Seed for the seeds of the versus games.
+        :param mode: How the tetrominoes are chosen, unless a client asks.
+        :param max_sessions: Most clients at once, more are disconnected.
+        :param telemetry: tetris_telemetry.TelemetryLog to log the metrics
+                          of every game to, or None.
+        """
+        self.max_x = max_x
+        self.max_y = max_y
+        self.mode = mode
+        self.max_sessions = max_sessions
+        self.telemetry = telemetry
+        self.loop = loop or asyncio.get_event_loop()
+        self.seeds = Random(seed)
+        self.sessions = {}  # id -> session
+        self.next_id = 1
+        self.rooms = {}     # room -> the session waiting in it
+
+    def protocol(self):
+        session = Session(self, self.next_id)
+        self.next_id += 1
+        return session
+
+    def join(self, session, room):
+        waiting = self.rooms.pop(room, None)
+        if waiting is None:
+            session.room = room
+            self.rooms[room] = session
+            session.send({"waiting": room})
+            return
+        waiting.room = None
+        seed = self.seeds.randint(0, 2**32 - 1)
+        waiting.engine.mode = session.engine.mode = self.mode
+        waiting.new_game(seed, opponent=session)
+        session.new_game(seed, opponent=waiting)
+
+    def leave(self, session):
+        if self.rooms.get(session.room) is session:
+            del self.rooms[session.room]
+        session.room = None
+
+    def listen(self, host="127.0.0.1", port=0, path=None):
+        """
+        :param path: Path of a Unix socket to listen on, instead of TCP.
+        :return: Coroutine of the asyncio Server.
+        """
+        if path:
+            return self.loop.create_unix_server(self.protocol, path, backlog=BACKLOG)
+        return self.loop.create_server(self.protocol, host, port, backlog=BACKLOG)
+
+
+async def serve(args):
+    telemetry = TelemetryLog(args.telemetry, args.telemetry_format) if args.telemetry else None
+    server = GameServer(
+        args.width, args.height, seed=args.seed, mode=BAG if args.bag else UNIFORM,
+        max_sessions=args.max_sessions, loop=asyncio.get_running_loop(), telemetry=telemetry
+    )
+    listener = await server.listen(args.host, args.port, args.unix)
+    for sock in listener.sockets:
+        print("Listening on", sock.getsockname())
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        if telemetry:
+            telemetry.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve headless Tetris games over a socket.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=7000, help="TCP port to listen on")
+    parser.add_argument("--unix", default=None, help="listen on this Unix socket instead")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the seeds of the versus games")
+    parser.add_argument("--bag", action="store_true", help="deal the tetrominoes in bags of all seven")
+    parser.add_argument("--width", type=int, default=MAXX, help="width of the board")
+    parser.add_argument("--height", type=int, default=MAXY, help="height of the board")
+    parser.add_argument("--max-sessions", type=int, default=MAX_SESSIONS, help="most clients at once")
+    parser.add_argument("--telemetry", metavar="FILE", default=None, help="append the metrics of every game to FILE")
+    parser.add_argument("--telemetry-format", choices=TELEMETRY_FORMATS, default="jsonl",
+                        help="format of the telemetry file")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Tetris Stats - opt-in timing of a game as it is played.
+
+Stats.instrument() replaces a method of an object with one that times it,
+so only what has been instrumented is timed, and when nothing is there is
+nothing to pay. Each named measurement keeps its last SIZE values in a ring
+buffer, which is never resized, and is summarised as percentiles, and the
+timings as a histogram of BUCKETS too.
+
+    stats = Stats()
+    stats.instrument(engine.board, "check_for_complete_row")
+    ...
+    print(stats.report())
+    print(stats.histograms())
+    stats.dump("stats.json")
+
+For profilers, stats.section is the name of the instrumented method that is
+running, or None, e.g. for a sampling profiler to label its samples with, and
+each function in stats.hooks is called as hook(name, start, end) after an
+instrumented method returns.
+"""
+from __future__ import print_function, division
+
+import time
+from bisect import bisect_left
+
+SIZE = 1024
+
+PERCENTILES = (50, 90, 99)
+
+# The upper bounds of the buckets of the histograms, in seconds, up to one
+# frame at 60 Hz, two and four, then a bucket for the rest.
+BUCKETS = (0.001, 0.002, 0.004, 0.008, 0.016, 0.033, 0.066)
+
+clock = getattr(time, "perf_counter", time.time)
+
+
+class RingBuffer(object):
+    """
+    The last size values added.
+    """
+    def __init__(self, size=SIZE):
+        self.size = size
+        self.data = [0.0] * size
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def add(self, value):
+        self.data[self.count % self.size] = value
+        self.count += 1
+
+    def values(self):
+        """:return: The values, oldest first."""
+        if self.count <= self.size:
+            return self.data[:self.count]
+        i = self.count % self.size
+        return self.data[i:] + self.data[:i]
+
+
+def percentile(values, p):
+    """
+    :param values: Sorted list of values.
+    :param p: Percentile, 0 to 100.
+    :return: The nearest ranked value.
+    """
+    if not values:
+        return None
+    i = int(round(p / 100.0 * (len(values) - 1)))
+    return values[i]
+
+
+def histogram(values, buckets=BUCKETS):
+    """
+    :param buckets: Sorted upper bounds of the buckets.
+    :return: List of the number of values in each bucket, and then of those
+             more than the last bound.
+    """
+    counts = [0] * (len(buckets) + 1)
+    for value in values:
+        counts[bisect_left(buckets, value)] += 1
+    return counts
+
+
+class Stats(object):
+    """
+    Named measurements, each in a RingBuffer.
+    """
+    def __init__(self, size=SIZE):
+        self.size = size
+        self.buffers = {}
+        self.hooks = []
+        self.section = None
+
+    def add(self, name, value):
+        buf = self.buffers.get(name)
+        if buf is None:
+            buf = self.buffers[name] = RingBuffer(self.size)
+        buf.add(value)
+
+    def timed(self, name, fn, after=None):
+        """
+        :param name: Name of the measurement.
+        :param fn: Function to time.
+        :param after: Function called after fn, and timed with it, e.g. to
+                      include drawing what fn changed.
+        :return: A function that calls fn and adds the seconds it took.
+        """
+        def timed_fn(*args, **kwargs):
+            outer = self.section
+            self.section = name
+            start = clock()
+            try:
+                result = fn(*args, **kwargs)
+                if after:
+                    after()
+            finally:
+                end = clock()
+                self.section = outer
+                self.add(name, end - start)
+                for hook in self.hooks:
+                    hook(name, start, end)
+            return result
+        return timed_fn
+
+    def instrument(self, obj, method, name=None, after=None):
+        """
+        Time a method of an object, from now on.
+        :param name: Name of the measurement, by default the method's.
+        """
+        setattr(obj, method, self.timed(name or method, getattr(obj, method), after))
+
+    def summary(self):
+        """
+        :return: dict of name -> dict of the count, mean, min, max and
+                 percentiles of the values in the buffer, and of timings
+                 their histogram.
+        """
+        result = {}
+        for name, buf in self.buffers.items():
+            values = sorted(buf.values())
+            if not values:
+                continue
+            summary = {
+                "count": buf.count,
+                "mean": sum(values) / len(values),
+                "min": values[0],
+                "max": values[-1],
+            }
+            for p in PERCENTILES:
+                summary["p{0}".format(p)] = percentile(values, p)
+            if isinstance(values[-1], float):
+                summary["histogram"] = histogram(values)
+            result[name] = summary
+        return result
+
+    def report(self):
+        """
+        :return: The summary as lines of text. Timings are p50/p99/max in
+                 milliseconds, counts are the last one.
+        """
+        lines = []
+        for name, summary in sorted(self.summary().items()):
+            if isinstance(summary["max"], float):
+                lines.append("{0}: {1:.2f}/{2:.2f}/{3:.2f} ms".format(
+                    name, summary["p50"] * 1000, summary["p99"] * 1000, summary["max"] * 1000))
+            else:
+                lines.append("{0}: {1}".format(name, self.buffers[name].values()[-1]))
+        return "\n".join(lines)
+
+    def histograms(self):
+        """
+        :return: The histogram of each timing as a line of text, the percent
+                 of the values in each bucket, under a line of the buckets'
+                 bounds in milliseconds.
+        """
+        summaries = sorted((name, summary) for name, summary in self.summary().items() if "histogram" in summary)
+        if not summaries:
+            return ""
+        width = max(len(name) for name, summary in summaries)
+        bounds = ["{0:g}".format(bound * 1000) for bound in BUCKETS] + [">"]
+        lines = [" " * width + "".join("{0:>4}".format(bound) for bound in bounds) + " ms"]
+        for name, summary in summaries:
+            counts = summary["histogram"]
+            total = sum(counts)
+            lines.append(name.ljust(width) + "".join(
+                "{0:>4}".format(int(round(100.0 * count / total)) if count else ".") for count in counts
+            ))
+        return "\n".join(lines)
+
+    def dump(self, path):
+        """Write the summary and the values in each buffer to a JSON file."""
+        import json
+        with open(path, "w") as f:
+            json.dump({
+                "summary": self.summary(),
+                "buckets": BUCKETS,
+                "values": dict((name, buf.values()) for name, buf in self.buffers.items()),
+            }, f, indent=2, sort_keys=True)
@@ -0,0 +1,386 @@
+"""Tetris Stream - a game as a compact stream of what changes, for spectators.
+
+Sending the whole board to every spectator whenever anything moves is mostly
+sending the same rows again. The Encoder listens for the engine's events
+instead, the same ones the GameController draws the board from, and writes
+each as a record of a few bytes: a move is the distance moved and the
+rotation, a landing is one byte, the rows cleared are their numbers. The
+Decoder applies the records to a GameEngine of its own, which is not
+stepped, just changed, and emits the same events for it, so anything that
+draws a game, e.g. a GameController, can draw the game being watched.
+
+Each frame of the stream is the records of whatever happened since the last
+frame, or a keyframe: the whole state of the game. A keyframe is sent when
+a spectator starts watching, and every KEYFRAME_INTERVAL tetrominoes, and
+replaces the frame of changes it would have been sent with.
+
+A Broadcast sends one game's frames to many subscribers. Frames are encoded
+once, and the same bytes are sent to everyone. A subscriber that can't take
+any more, e.g. a socket whose buffer is full, has its frames queued, and if
+it falls more than max_pending bytes behind they are dropped, and it is sent
+a keyframe of the game as it is now, instead.
+
+    broadcast = Broadcast(Encoder(engine))
+    subscriber = broadcast.subscribe(transport.write)
+    ...
+    engine.step(action)
+    broadcast.publish()
+
+    decoder = Decoder(controller.engine)
+    decoder.feed(data)
+
+Stream format, a sequence of frames:
+    frame       varint length, then records
+    record      one byte of (code | argument << 4), then the code's varints
+    KEYFRAME    max_x, max_y, pieces, score, level, zigzag delay, state,
+                shape + 1 (0 for none), zigzag x, zigzag y, rotation,
+                next shape + 1, has seed, zigzag seed, mode, number of rows,
+                then the rows
+    SPAWN       shape, zigzag x, zigzag y, rotation
+    MOVE        argument is the rotation, then zigzag dx, zigzag dy
+    CLEAR       number of rows, then the rows
+    GARBAGE     lines, gap
+    PREVIEW     shape
+    SCORE       score
+    LEVEL       level, zigzag delay
+    STATE       state
+    RESET       has seed, zigzag seed, mode
+    LAND        nothing
+"""
+from collections import deque
+
+from tetris_engine import (
+    RESET, PREVIEW, SPAWN, MOVE, LAND, CLEAR, SCORE, LEVEL, STATE, GARBAGE, RESTORE, SHAPES, MODES,
+    BitBoard, Snapshot, GameEngine, PieceSequence
+)
+from tetris_replay import STATES, byte_at, write_varint, read_varint, zigzag, unzigzag
+
+KEYFRAME = "keyframe"
+
+# The record codes are the indexes of these.
+RECORDS = (KEYFRAME, RESET, PREVIEW, SPAWN, MOVE, LAND, CLEAR, SCORE, LEVEL, STATE, GARBAGE)
+CODES = dict((record, code) for code, record in enumerate(RECORDS))
+
+KEYFRAME_INTERVAL = 64
+
+# Bytes a subscriber can fall behind before it is sent a keyframe instead.
+MAX_PENDING = 16 * 1024
+
+
+def frame(records):
+    """:return: The records as a frame, with its length."""
+    out = bytearray()
+    write_varint(out, len(records))
+    out += records
+    return bytes(out)
+
+
+class Encoder(object):
+    """
+    Encodes the events of a game as records, a frame at a time.
+    """
+    def __init__(self, engine, keyframe_interval=KEYFRAME_INTERVAL):
+        """
+        :param engine: The GameEngine to encode.
+        :param keyframe_interval: Tetrominoes between keyframes.
+        """
+        self.engine = engine
+        self.keyframe_interval = keyframe_interval
+        self.records = bytearray()
+        self.keyframe_due = False
+        self.cached = None
+        # where the tetrominoe in play was, moves are sent as the distance from there.
+        self.x = engine.shape.x if engine.shape else 0
+        self.y = engine.shape.y if engine.shape else 0
+        engine.subscribe(self.engine_event)
+
+    def close(self):
+        self.engine.unsubscribe(self.engine_event)
+
+    def engine_event(self, event, *args):
+        if event == RESTORE:
+            self.keyframe_due = True
+            self.cached = None
+            return
+        if event not in CODES:
+            return
+        self.cached = None
+        out = self.records
+        code = CODES[event]
+        if event == MOVE:
+            shape = args[0]
+            out.append(code | shape.rotation << 4)
+            write_varint(out, zigzag(shape.x - self.x))
+            write_varint(out, zigzag(shape.y - self.y))
+            self.x, self.y = shape.x, shape.y
+            return
+
+        out.append(code)
+        engine = self.engine
+        if event == SPAWN:
+            shape = args[0]
+            for value in (SHAPES.index(type(shape)), zigzag(shape.x), zigzag(shape.y), shape.rotation):
+                write_varint(out, value)
+            self.x, self.y = shape.x, shape.y
+            if engine.pieces % self.keyframe_interval == 0:
+                self.keyframe_due = True
+        elif event == PREVIEW:
+            write_varint(out, SHAPES.index(args[0]))
+        elif event == CLEAR:
+            write_varint(out, len(args[0]))
+            for y in args[0]:
+                write_varint(out, y)
+        elif event == SCORE:
+            write_varint(out, args[0])
+        elif event == LEVEL:
+            write_varint(out, args[0])
+            write_varint(out, zigzag(engine.delay))
+        elif event == STATE:
+            write_varint(out, STATES.index(args[0]))
+        elif event == GARBAGE:
+            write_varint(out, args[0])
+            write_varint(out, args[1])
+        elif event == RESET:
+            # the new game's seed and mode, as a keyframe has them
+            write_varint(out, 1 if engine.seed is not None else 0)
+            write_varint(out, zigzag(engine.seed or 0))
+            write_varint(out, MODES.index(engine.mode))
+
+    def keyframe(self):
+        """:return: A frame of the whole state of the game, as it is now."""
+        if self.cached is None:
+            engine = self.engine
+            board = engine.board
+            shape = engine.shape
+            out = bytearray([CODES[KEYFRAME]])
+            for value in (board.max_x, board.max_y, engine.pieces, engine.score, engine.level,
+                          zigzag(engine.delay), STATES.index(engine.state),
+                          SHAPES.index(type(shape)) + 1 if shape else 0,
+                          zigzag(shape.x) if shape else 0, zigzag(shape.y) if shape else 0,
+                          shape.rotation if shape else 0,
+                          SHAPES.index(engine.next_shape) + 1 if engine.next_shape else 0,
+                          1 if engine.seed is not None else 0, zigzag(engine.seed or 0), MODES.index(engine.mode),
+                          len(board.rows)):
+                write_varint(out, value)
+            for row in board.rows:
+                write_varint(out, row)
+            self.cached = frame(out)
+        return self.cached
+
+    def flush(self):
+        """
+        :return: A frame of the records since the last one, or a keyframe if
+                 one is due, or None if nothing has happened.
+        """
+        if self.keyframe_due:
+            self.keyframe_due = False
+            del self.records[:]
+            return self.keyframe()
+        if not self.records:
+            return None
+        data = frame(self.records)
+        del self.records[:]
+        return data
+
+
+class Decoder(object):
+    """
+    Rebuilds a game from its stream.
+    """
+    def __init__(self, engine=None):
+        """
+        :param engine: The GameEngine to put the game in, e.g. a
+                       GameController's, or None for a new one. Its
+                       subscribers get the events of the game.
+        """
+        self.engine = engine or GameEngine()
+        self.buffer = b""
+
+    def feed(self, data):
+        """
+        Apply the frames in data, which can end part way through a frame,
+        the rest of it is expected in the next data.
+        """
+        data = self.buffer + data
+        offset = 0
+        while offset < len(data):
+            try:
+                length, start = read_varint(data, offset)
+            except IndexError:
+                break
+            if start + length > len(data):
+                break
+            self.apply(data, start, start + length)
+            offset = start + length
+        self.buffer = data[offset:]
+
+    def apply(self, data, offset, end):
+        """Apply the records of a frame."""
+        engine = self.engine
+        board = engine.board
+        while offset < end:
+            byte = byte_at(data, offset)
+            offset += 1
+            record = RECORDS[byte & 0x0f]
+            if record == MOVE:
+                dx, offset = read_varint(data, offset)
+                dy, offset = read_varint(data, offset)
+                shape = engine.shape
+                old_coords = shape.coords
+                shape.x += unzigzag(dx)
+                shape.y += unzigzag(dy)
+                shape.rotation = byte >> 4
+                engine.emit(MOVE, shape, old_coords)
+            elif record == SPAWN:
+                values, offset = self.read(data, offset, 4)
+                shape = engine.shape = SHAPES[values[0]](board)
+                shape.x = unzigzag(values[1])
+                shape.y = unzigzag(values[2])
+                shape.rotation = values[3]
+                engine.pieces += 1
+                engine.emit(SPAWN, shape)
+            elif record == LAND:
+                engine.emit(LAND, engine.shape)
+                board.check_for_complete_row(engine.shape.coords)
+                engine.shape = None
+            elif record == CLEAR:
+                values, offset = self.read(data, offset, 1)
+                rows, offset = self.read(data, offset, values[0])
+                if rows != board.cleared:
+                    raise ValueError("the rows cleared are not those of the stream")
+                engine.emit(CLEAR, rows)
+            elif record == PREVIEW:
+                values, offset = self.read(data, offset, 1)
+                engine.next_shape = SHAPES[values[0]]
+                engine.emit(PREVIEW, engine.next_shape)
+            elif record == SCORE:
+                engine.score, offset = read_varint(data, offset)
+                engine.emit(SCORE, engine.score)
+            elif record == LEVEL:
+                values, offset = self.read(data, offset, 2)
+                engine.level = values[0]
+                engine.delay = unzigzag(values[1])
+                engine.emit(LEVEL, engine.level)
+            elif record == STATE:
+                values, offset = self.read(data, offset, 1)
+                engine.set_state(STATES[values[0]])
+            elif record == GARBAGE:
+                values, offset = self.read(data, offset, 2)
+                board.add_garbage(*values)
+                engine.emit(GARBAGE, *values)
+            elif record == RESET:
+                values, offset = self.read(data, offset, 3)
+                engine.seed = unzigzag(values[1]) if values[0] else None
+                engine.mode = MODES[values[2]]
+                engine.sequence = PieceSequence(engine.seed, engine.mode) if engine.seed is not None else None
+                board.reset()
+                engine.shape = None
+                engine.pieces = 0
+                engine.emit(RESET)
+            else:
+                offset = self.keyframe(data, offset)
+                board = engine.board
+
+    @staticmethod
+    def read(data, offset, count):
+        """:return: (list of count varints, offset after them)"""
+        values = []
+        for _ in range(count):
+            value, offset = read_varint(data, offset)
+            values.append(value)
+        return values, offset
+
+    def keyframe(self, data, offset):
+        engine = self.engine
+        values, offset = self.read(data, offset, 16)
+        (max_x, max_y, pieces, score, level, delay, state, shape, x, y, rotation, next_shape,
+         has_seed, seed, mode, count) = values
+        rows, offset = self.read(data, offset, count)
+        if (engine.board.max_x, engine.board.max_y) != (max_x, max_y):
+            engine.board = BitBoard(max_x, max_y, features=engine.board.features is not None)
+        engine.restore(Snapshot(
+            tuple(rows), SHAPES[shape - 1] if shape else None, unzigzag(x), unzigzag(y), rotation,
+            SHAPES[next_shape - 1] if next_shape else None, score, level, unzigzag(delay), STATES[state],
+            pieces, unzigzag(seed) if has_seed else None, MODES[mode]
+        ))
+        return offset
+
+
+class Subscriber(object):
+    """
+    One of the subscribers of a Broadcast, and the frames it hasn't taken yet.
+    """
+    def __init__(self, broadcast, write):
+        self.broadcast = broadcast
+        self.write = write
+        self.pending = deque()
+        self.pending_bytes = 0
+        self.ready = True
+
+    def send(self, data):
+        if self.ready and not self.pending:
+            self.write(data)
+            return
+        self.pending.append(data)
+        self.pending_bytes += len(data)
+        if self.pending_bytes > self.broadcast.max_pending:
+            # too far behind, skip to the game as it is now
+            self.pending.clear()
+            keyframe = self.broadcast.encoder.keyframe()
+            self.pending.append(keyframe)
+            self.pending_bytes = len(keyframe)
+
+    def pause(self):
+        """Queue the frames, until resume()."""
+        self.ready = False
+
+    def resume(self):
+        self.ready = True
+        while self.pending and self.ready:
+            data = self.pending.popleft()
+            self.pending_bytes -= len(data)
+            self.write(data)
+
+    def close(self):
+        self.broadcast.unsubscribe(self)
+
+
+class Broadcast(object):
+    """
+    The frames of a game, sent to every subscriber.
+    """
+    def __init__(self, encoder, max_pending=MAX_PENDING):
+        """
+        :param encoder: The Encoder of the game.
+        :param max_pending: Bytes a subscriber can fall behind before it is
+                            sent a keyframe instead.
+        """
+        self.encoder = encoder
+        self.max_pending = max_pending
+        self.subscribers = []
+
+    def subscribe(self, write):
+        """
+        :param write: Function that sends bytes to the subscriber, e.g. a
+                      transport's write().
+        :return: The Subscriber, to pause(), resume() and close().
+        """
+        self.publish()
+        subscriber = Subscriber(self, write)
+        self.subscribers.append(subscriber)
+        subscriber.send(self.encoder.keyframe())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.remove(subscriber)
+
+    def publish(self):
+        """Send a frame of whatever has happened since the last one."""
+        data = self.encoder.flush()
+        if data:
+            for subscriber in self.subscribers:
+                subscriber.send(data)
+
+    def close(self):
+        self.encoder.close()
+        del self.subscribers[:]
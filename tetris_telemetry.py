@@ -0,0 +1,311 @@
+"""Tetris Telemetry - a log of the metrics of every game played.
+
+GameTelemetry subscribes to a GameEngine, interactive or headless, and adds
+up the metrics of each game from its events: the tetrominoes landed, and how
+fast, the rows cleared by the size of the clear (single, double, triple and
+tetris), the time spent on each level, the peak height of the stack and the
+final score. When a game is over, or is left for a new one, its metrics are
+appended to a TelemetryLog.
+
+A game put back to a snapshot, e.g. by undo in the GUI, carries on in the
+same record, which counts the restores, and the tetrominoes landed go back
+to those of the snapshot. The rows cleared, and the time, are what was
+played. A snapshot of another game, or one restored after the game was
+logged, starts a new record, from the snapshot.
+
+The log only puts the record in a queue, so the game never waits for it.
+A background thread writes the queue, every interval seconds or when
+max_pending records are waiting, as either:
+
+    jsonl       a line of JSON per game
+    columns     blocks of columns, for reading many games at once, see
+                read_columns(). The file starts with "TTKT", version (B),
+                the number of columns (H) and the name of each, as a
+                length (B) and ASCII. Each block is the number of games in
+                it (I), then each column's values as float64s, all little
+                endian.
+
+    log = TelemetryLog("games.jsonl")
+    telemetry = GameTelemetry(engine, log)
+    ...
+    log.close()
+"""
+from __future__ import print_function, division
+
+import io
+import struct
+import threading
+import time
+from collections import deque
+
+from tetris_engine import (
+    NO_OF_LEVELS, RESET, LAND, CLEAR, SCORE, LEVEL, STATE, RESTORE, GAME_OVER, PAUSED, PLAYING, MODES
+)
+
+FORMATS = ("jsonl", "columns")
+INTERVAL = 1.0          # seconds between writes
+MAX_PENDING = 1024      # records waiting before a write, whatever the interval
+
+# Rows cleared by one tetrominoe, at most.
+CLEAR_SIZES = 4
+
+MAGIC = b"TTKT"
+VERSION = 1
+COLUMNS = (
+    ["time", "seed", "mode", "over", "seconds", "pieces", "pieces_per_second", "score", "level", "peak_height",
+     "restores"] +
+    ["lines_{0}".format(size + 1) for size in range(CLEAR_SIZES)] +
+    ["level_seconds_{0}".format(level) for level in range(NO_OF_LEVELS + 1)]
+)
+
+
+class GameTelemetry(object):
+    """
+    The metrics of the games played by an engine.
+    """
+    def __init__(self, engine, log, clock=time.time):
+        """
+        :param engine: The GameEngine to follow.
+        :param log: TelemetryLog, or anything with append(record), to add
+                    the metrics of each game to.
+        :param clock: Function returning the time in seconds.
+        """
+        self.engine = engine
+        self.log = log
+        self.clock = clock
+        self.playing = False
+        self.paused = None
+        engine.subscribe(self.engine_event)
+
+    def close(self):
+        """Log the game in play, if there is one, and stop following the engine."""
+        self.finish(over=False)
+        self.engine.unsubscribe(self.engine_event)
+
+    def engine_event(self, event, *args):
+        # the most common events first, these are called for every step
+        if event == LAND:
+            if self.playing:
+                self.pieces += 1
+                board = self.engine.board
+                top = min([min(board.tops) - board.HIDDEN] + [y for x, y in args[0].coords])
+                # a tetrominoe landing in the hidden rows ends the game, the
+                # stack is no higher than the board
+                height = min(board.max_y - top, board.max_y)
+                if height > self.peak_height:
+                    self.peak_height = height
+        elif event == CLEAR:
+            if self.playing:
+                self.lines[min(len(args[0]), CLEAR_SIZES) - 1] += 1
+        elif event == SCORE:
+            self.score = args[0]
+        elif event == LEVEL:
+            if self.playing:
+                self.change_level(args[0])
+        elif event == STATE:
+            if args[0] == GAME_OVER:
+                self.finish(over=True)
+            elif args[0] == PAUSED and self.playing:
+                self.paused = self.clock()
+            elif args[0] == PLAYING and self.playing and self.paused is not None:
+                # the time paused doesn't count
+                paused = self.clock() - self.paused
+                self.start += paused
+                self.level_start += paused
+                self.paused = None
+        elif event == RESET:
+            self.finish(over=False)
+            self.begin()
+        elif event == RESTORE:
+            snapshot = args[0]
+            if self.playing and snapshot.seed != self.seed:
+                self.finish(over=False)
+            if not self.playing:
+                if snapshot.state == GAME_OVER:
+                    return
+                self.begin()
+            self.restores += 1
+            # the tetrominoe in play hasn't landed
+            self.pieces = snapshot.pieces - (1 if snapshot.shape else 0)
+
+    def begin(self):
+        # the engine has moved on to the next game by the time a game is
+        # left for it, so what is logged is kept here
+        engine = self.engine
+        self.playing = True
+        self.seed = engine.seed
+        self.mode = engine.mode
+        self.score = engine.score
+        self.time = time.time()
+        self.start = self.level_start = self.clock()
+        self.paused = None
+        self.pieces = 0
+        self.lines = [0] * CLEAR_SIZES
+        self.level = engine.level
+        self.level_seconds = [0.0] * (NO_OF_LEVELS + 1)
+        self.peak_height = 0
+        self.restores = 0
+
+    def change_level(self, level):
+        now = self.clock()
+        self.level_seconds[self.level] += now - self.level_start
+        self.level = level
+        self.level_start = now
+
+    def finish(self, over):
+        """Append the metrics of the game in play to the log."""
+        if not self.playing:
+            return
+        self.playing = False
+        if self.paused is not None:
+            paused = self.clock() - self.paused
+            self.start += paused
+            self.level_start += paused
+        self.change_level(self.level)
+        seconds = self.clock() - self.start
+        self.log.append({
+            "time": self.time,
+            "seed": self.seed,
+            "mode": self.mode,
+            "over": over,
+            "seconds": seconds,
+            "pieces": self.pieces,
+            "pieces_per_second": self.pieces / seconds if seconds > 0 else 0.0,
+            "score": self.score,
+            "level": self.level,
+            "peak_height": self.peak_height,
+            "restores": self.restores,
+            "lines": self.lines,
+            "level_seconds": self.level_seconds,
+        })
+
+
+class TelemetryLog(object):
+    """
+    Appends game records to a file, from a background thread.
+    """
+    def __init__(self, path, format="jsonl", interval=INTERVAL, max_pending=MAX_PENDING):
+        """
+        :param path: File to append to.
+        :param format: One of FORMATS.
+        :param interval: Seconds between writes.
+        :param max_pending: Records waiting that start a write straight away.
+        """
+        if format not in FORMATS:
+            raise ValueError("format must be one of {0}, not {1}".format(", ".join(FORMATS), format))
+        self.format = format
+        self.interval = interval
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.closed = False
+        self.records = 0
+
+        self.file = io.open(path, "ab")
+        if format == "columns" and self.file.tell() == 0:
+            header = [MAGIC, struct.pack("<BH", VERSION, len(COLUMNS))]
+            for name in COLUMNS:
+                header.append(struct.pack("<B", len(name)) + name.encode("ascii"))
+            self.file.write(b"".join(header))
+
+        self.thread = threading.Thread(target=self.run, name="telemetry")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def append(self, record):
+        """Queue a game's record to be written. deque.append is thread safe."""
+        self.pending.append(record)
+        if len(self.pending) >= self.max_pending:
+            self.wake.set()
+
+    def run(self):
+        while not self.closed:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write the records waiting."""
+        with self.lock:
+            records = []
+            while self.pending:
+                records.append(self.pending.popleft())
+            if records:
+                if self.format == "jsonl":
+                    self.write_jsonl(records)
+                else:
+                    self.write_columns(records)
+                self.file.flush()
+                self.records += len(records)
+
+    def write_jsonl(self, records):
+        import json
+
+        self.file.write(b"".join(
+            json.dumps(record, sort_keys=True, separators=(",", ":")).encode("utf-8") + b"\n"
+            for record in records
+        ))
+
+    def write_columns(self, records):
+        count = len(records)
+        values = dict((name, []) for name in COLUMNS)
+        for record in records:
+            for name, value in flatten(record):
+                values[name].append(value)
+        column = struct.Struct("<{0}d".format(count))
+        self.file.write(struct.pack("<I", count) + b"".join(column.pack(*values[name]) for name in COLUMNS))
+
+    def close(self):
+        """Write the records still waiting, and close the file."""
+        if self.closed:
+            return
+        self.closed = True
+        self.wake.set()
+        self.thread.join()
+        self.flush()
+        self.file.close()
+
+
+def flatten(record):
+    """:return: (column, value) of a record, a number for each of COLUMNS."""
+    for name in COLUMNS[:11]:
+        value = record[name]
+        if name == "mode":
+            value = MODES.index(value)
+        elif name == "seed" and value is None:
+            value = -1
+        yield name, float(value)
+    for size, lines in enumerate(record["lines"]):
+        yield "lines_{0}".format(size + 1), float(lines)
+    for level, seconds in enumerate(record["level_seconds"]):
+        yield "level_seconds_{0}".format(level), seconds
+
+
+def read_columns(path):
+    """
+    Read a log in the columns format.
+    :return: dict of the name of each column and a list of its values.
+    """
+    with io.open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != MAGIC:
+        raise ValueError("{0} is not a Tetris Tk telemetry log".format(path))
+    version, count = struct.unpack_from("<BH", data, 4)
+    if version != VERSION:
+        raise ValueError("{0} is a telemetry log from another version of Tetris Tk".format(path))
+    offset = 7
+    names = []
+    for _ in range(count):
+        length = struct.unpack_from("<B", data, offset)[0]
+        names.append(data[offset + 1:offset + 1 + length].decode("ascii"))
+        offset += 1 + length
+
+    columns = dict((name, []) for name in names)
+    while offset + 4 <= len(data):
+        games = struct.unpack_from("<I", data, offset)[0]
+        offset += 4
+        for name in names:
+            columns[name].extend(struct.unpack_from("<{0}d".format(games), data, offset))
+            offset += 8 * games
+    return columns
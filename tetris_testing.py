@@ -0,0 +1,46 @@
+"""Tetris Testing - helpers shared by the tests, to play games and compare them."""
+from tetris_engine import LEFT, RIGHT, DOWN, TICK, DROP, CLOCKWISE, ANTICLOCKWISE, PLAYING
+from tetris_ai import AIPlayer
+
+# Random moves, with two ticks so the tetrominoes come down.
+MOVES = (LEFT, RIGHT, DOWN, TICK, TICK, DROP, CLOCKWISE, ANTICLOCKWISE)
+
+# Random moves of a tetrominoe before the bot places it.
+NUDGES = (LEFT, RIGHT, DOWN, TICK, CLOCKWISE, ANTICLOCKWISE)
+
+
+class Clock(object):
+    """A clock for the tests to set, in place of time.time()."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def state(engine):
+    """:return: Everything about the game played by an engine, to compare it with another."""
+    board = engine.board
+    shape = engine.shape
+    position = (type(shape), shape.x, shape.y, shape.rotation) if shape else None
+    return (tuple(board.rows), tuple(board.tops), tuple(board.counts), engine.score, engine.level, engine.delay,
+            engine.state, engine.pieces, position, engine.next_shape, engine.seed, engine.mode)
+
+
+def play(engine, rng, pieces):
+    """
+    Up to three random moves of each tetrominoe, then the bot places it, so
+    the game lasts.
+    :return: The state after each step.
+    """
+    player = AIPlayer(engine, lookahead=False)
+    states = []
+    for _ in range(pieces):
+        if engine.state != PLAYING:
+            break
+        for _ in range(rng.randint(0, 3)):
+            engine.step(rng.choice(NUDGES))
+            states.append(state(engine))
+        player.play_piece()
+        states.append(state(engine))
+    return states
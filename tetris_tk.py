@@ -1,10 +1,7 @@
 #!/usr/bin/env python
 # TODO: COORD CLASS WITH ADD SUBTRACT EQUALS (possibly)
-# TODO: Walk kick on rotation
 # TODO: TBoard that centres the shape exactly
-# TODO: Bug - Doesn't clear to the top line.
 # TODO: Traditional scoring.
-# TODO: Model View Controller
 
 """Tetris Tk - A Tetris clone written in Python using the Tkinter GUI library.
 
@@ -33,6 +30,9 @@ Controls:
     'a'             Rotate anti-clockwise (to the left)
     'b'             Rotate clockwise (to the right)
     'p'             Pause the game.
+    'u'             Undo, back to the start of the last Tetrominoe.
+    F5              Quick save.
+    F9              Quick load.
 """
 from __future__ import print_function
 
@@ -40,636 +40,84 @@ __version__ = "2.0"
 __author__ = "simon.peveret@gmail.com"
 __all__ = ['__version__', '__author__']
 
-import sys
-if sys.version_info[0] > 2:
-    import tkinter.font as tkFont
-    from tkinter import *
-else:
-    import tkFont
-    from Tkinter import *
-from random import randint
-from collections import namedtuple
+import os
+from collections import deque
 
-SCALE = 20
-OFFSET = 3
-MAXX = 10
-MAXY = 22
+# The engine's names are still here too, as they were before the engine
+# was split out, shapes included.
+from tetris_engine import (
+    MAXX, MAXY, NO_OF_LEVELS, LEFT, RIGHT, DOWN, TICK, DROP, CLOCKWISE, ANTICLOCKWISE, PAUSE,
+    READY, GAME_OVER, PAUSED, PLAYING, UNIFORM, BAG, Coord, level_thresholds, direction_d, BitBoard, GameEngine,
+    Shape, LimitedRotateShape, SquareShape, TShape, LShape, JShape, ZShape, SShape, IShape, SHAPES
+)
+from tetris_replay import Recorder
+from tetris_scheduler import TickScheduler
+from tetris_input import InputQueue, DAS, ARR
+from tetris_stats import Stats
+from tetris_telemetry import FORMATS as TELEMETRY_FORMATS, GameTelemetry, TelemetryLog
 
-NO_OF_LEVELS = 10
+# The Tk widgets, and Tk itself, which are only imported from tetris_gui
+# when a window is built, but can still be imported from here.
+GUI_NAMES = ("Tk", "TclError", "TBoard", "TetrisBoard", "InfoPanel", "SCALE", "OFFSET")
 
-LEFT = "left"
-RIGHT = "right"
-DOWN = "down"
 
-direction_d = {"left": (-1, 0), "right": (1, 0), "down": (0, 1)}
+def __getattr__(name):
+    if name in GUI_NAMES:
+        import tetris_gui
+        return getattr(tetris_gui, name)
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
 
-# Game States
-READY = "READY"
-GAME_OVER = "GAME OVER"
-PAUSED = "PAUSED"
-PLAYING = "PLAYING"
 
-Coord = namedtuple("Coord", ['x', 'y'])
-
-
-def level_thresholds(first_level, no_of_levels):
-    """
-    Calculates the score at which the level will change, for n levels.
-    """
-    thresholds = []
-    for x in range(no_of_levels):
-        multiplier = 2**x
-        thresholds.append(first_level * multiplier)
-    
-    return thresholds
-
-
-class TBoard(Frame):
-    """
-    A Frame containing a Canvas, on which blocks can be displayed, moved and deleted, at will. A block is just a Canvas
-    rectangle. Tetrominoes are made up of blocks.
-
-    This is simplifying the Canvas object so that the blocks can be placed and manipulated by coordinated in an
-    X, Y Grid, and this class will scale them appropriately.
-    """
-    def __init__(self, parent, scale, max_x, max_y, offset):
-        """
-        Created the TBoard. It is up to the creator to Pack/Grid this.
-        :param parent: The parent TKinter object
-        :param scale: Scale e.g. scale an x by y 'block' by 'scale' pixels.
-        :param max_x: max X coordinate
-        :param max_y: max Y coordinate
-        :param offset: Offset from top left for block creation.
-        """
-        Frame.__init__(self, parent)
-        self.parent = parent
-        self.scale = scale
-        self.max_x = max_x
-        self.max_y = max_y
-        self.offset = offset
-
-        self.canvas = Canvas(
-            self,
-            height=(max_y * scale) + offset,
-            width=(max_x * scale) + offset,
-            bg="black"
-            )
-
-        self.canvas.pack()
-
-    def add_block(self, coord, colour):
-            """
-            Add a block (rectangle of size (1 * SCALE)**2)
-            :param self: instance
-            :param coord: X, Y Coordinate point
-            :param colour: Block colour
-            :return: The Tkinter ID of the block (rectangle) on the canvas.
-            """
-            rx = (coord.x * self.scale) + self.offset
-            ry = (coord.y * self.scale) + self.offset
-
-            return self.canvas.create_rectangle(rx, ry, rx + self.scale, ry + self.scale, fill=colour)
-
-    def move_block(self, id, coord):
-            """
-            Move a block by relative x, y coordinate distance.
-            :param self: instance
-            :param id: Canvas id of the block (rectangle)
-            :param coord: X, Y Coordinate to move to, relative to the current block position.
-            """
-            self.canvas.move(id, coord.x * self.scale, coord.y * self.scale)
-
-    def delete_block(self, id):
-            """
-            Delete the identified block
-            :param self: instance
-            :param id: Canvas id of the block (rectangle) to delete.
-            :return:
-            """
-            self.canvas.delete(id)
-
-
-class TetrisBoard(TBoard):
-    """
-    The board represents the tetris playing area. A grid of x by y blocks.
-    """
-    def __init__(self, parent, scale=20, max_x=10, max_y=20, offset=3):
-        """
-        Init and config the tetris board, default configuration:
-        Scale (block size in pixels) = 20
-        max X (in blocks) = 10
-        max Y (in blocks) = 20
-        offset (in pixels) = 3
-        """
-        TBoard.__init__(self, parent, scale, max_x, max_y, offset)
-        self.landed = {}
-
-    def reset(self):
-        """
-        Reset the board by clearing all the blocks from a previous game.
-        :return:
-        """
-        for coord in self.landed.keys():
-            block = self.landed.pop(coord)
-            self.delete_block(block)
-            del block
-
-    def game_over_animation(self):
-        """
-        Something cool to show the game is over. Start by deleting blocks, but slowly until all gone.
-        :return: True if Block popped, otherwise False.
-        """
-        try:
-            coord, block = self.landed.popitem()
-            self.delete_block(block)
-            del block
-            return True
-        except KeyError:
-            return False
-
-    def is_game_over(self):
-        """
-        Check row -1, if there are any blocks then that means that no new
-        tetrominos can be generated and the game is over.
-        :return: True if blocks are found and game is over, otherwise False.
-        """
-        y = -1
-        for x in range(self.max_x):
-            if self.landed.get(Coord(x, y), None):
-                # Found a block, so return True, game over
-                return True
-        return False
-
-    def check_for_complete_row(self, blocks):
-        """
-        Look for a complete row of blocks, from the bottom up until the top row
-        or until an empty row is reached.
-        """
-        rows_deleted = 0
-
-        # TO DO - This is not atomic and could be improved.
-        # Add the blocks to those in the grid that have already 'landed'
-        for block in blocks:
-            self.landed[block.coord] = block.id
-        
-        empty_row = 0
-
-        # find the first empty row
-        for y in range(self.max_y - 1, -1, -1):
-            row_is_empty = True
-            for x in range(self.max_x):
-                if self.landed.get(Coord(x, y), None):
-                    row_is_empty = False
-                    break
-            if row_is_empty:
-                empty_row = y
-                break
-
-        # Now scan up and until a complete row is found. 
-        y = self.max_y - 1
-        while y > empty_row:
- 
-            complete_row = True
-            for x in range(self.max_x):
-                if self.landed.get(Coord(x, y), None) is None:
-                    complete_row = False
-                    break
-
-            if complete_row:
-                rows_deleted += 1
-                
-                # delete the completed row
-                for x in range(self.max_x):
-                    block = self.landed.pop(Coord(x, y))
-                    self.delete_block(block)
-                    del block
-
-                # move all the rows above it down
-                for ay in range(y-1, empty_row, -1):
-                    for x in range(self.max_x):
-                        block = self.landed.get(Coord(x, ay), None)
-                        if block:
-                            block = self.landed.pop(Coord(x, ay))
-                            dx, dy = direction_d[DOWN]
-
-                            tx, ty = direction_d[DOWN]   # FIX THIS
-                            self.move_block(block, Coord(tx, ty))
-                            self.landed[Coord(x+dx, ay+dy)] = block
-
-                # move the empty row down index down too
-                empty_row += 1
-                # y stays same as row above has moved down.
-                
-            else:
-                y -= 1
-                
-        # self.output() # non-gui diagnostic
-        # return the score, calculated by the number of rows deleted.
-        return (100 * rows_deleted) * rows_deleted
-
-    def output(self):
-        for y in range(self.max_y):
-            line = []
-            for x in range(self.max_x):
-                if self.landed.get(Coord(x, y), None):
-                    line.append("X")
-                else:
-                    line.append(".")
-            print("".join(line))
-
-    def check_block(self, coord):
-        """
-        Check if the x, y coordinate can have a block placed there.
-        That is; if there is a 'landed' block there or it is outside the
-        board boundary, then return False, otherwise return true.
-        """
-        if coord.x < 0 or coord.x >= self.max_x or coord.y >= self.max_y:
-            return False
-        elif coord in self.landed:
-            return False
-        else:
-            return True
-
-
-class Block(object):
-    # This could be replaced with a named tuple
-    def __init__(self, id, coord):
-        self.id = id
-        self.coord = coord
-
-
-class Shape(object):
-    """
-    Shape is the  Base class for the game pieces e.g. square, T, S, Z, L,
-    reverse L and I. Shapes are constructed of blocks. 
-    """
-    def __init__(self, board, coords, colour, offset=None):
-        """
-        Initialise the shape base.
-        """
-        self.board = board
-        self.blocks = []
-
-        if offset is not None:
-            coords = map(lambda c: Coord(c.x+offset.x, c.y+offset.y), coords)
-        
-        for coord in coords:
-            block = Block(self.board.add_block(coord, colour), coord)
-            
-            self.blocks.append(block)
-            
-    def move(self, direction):
-        """
-        Move the blocks in the direction indicated by adding (dx, dy) to the
-        current block coordinates
-        """
-        d_x, d_y = direction_d[direction]
-        
-        for block in self.blocks:
-
-            x = block.coord.x + d_x
-            y = block.coord.y + d_y
-            
-            if not self.board.check_block(Coord(x, y)):
-                return False
-            
-        for block in self.blocks:
-            
-            x = block.coord.x + d_x
-            y = block.coord.y + d_y
-            
-            self.board.move_block(block.id, Coord(d_x, d_y))
-
-            block.coord = Coord(x, y)
-
-        return True
-            
-    def rotate(self, clockwise=True):
-        """
-        Rotate the blocks around the 'middle' block, 90-degrees. The
-        middle block is always the index 0 block in the list of blocks
-        that make up a shape.
-        """
-        # TO DO: Refactor for DRY
-        middle = self.blocks[0].coord
-        rel_blocks = []
-        for block in self.blocks:
-            rel_blocks.append(Coord(block.coord.x-middle.x, block.coord.y-middle.y))
-            
-        # to rotate 90-degrees (x,y) = (-y, x)
-        # First check that the there are no collisions or out of bounds moves.
-        for rel in rel_blocks:
-            if clockwise:
-                x = middle.x+rel.y
-                y = middle.y-rel.x
-            else:
-                x = middle.x-rel.y
-                y = middle.y+rel.x
-            
-            if not self.board.check_block(Coord(x, y)):
-                return False
-            
-        for rel, act in zip(rel_blocks, self.blocks):
-            if clockwise:
-                x = middle.x+rel.y
-                y = middle.y-rel.x
-            else:
-                x = middle.x-rel.y
-                y = middle.y+rel.x
-
-            diff_x = x - act.coord.x
-            diff_y = y - act.coord.y
-            
-            self.board.move_block(act.id, Coord(diff_x, diff_y))
-            
-            act.coord = Coord(x, y)
-
-        return True
-
-    # def __del__(self):
-    #     for block in self.blocks:
-    #         self.board.delete_block(block.id)
-
-
-class LimitedRotateShape(Shape):
-    """
-    This is a base class for the shapes like the S, Z and I that don't fully
-    rotate (which would result in the shape moving *up* one block on a 180).
-    Instead they toggle between 90 degrees clockwise and then back 90 degrees
-    anti-clockwise.
-    """
-    def __init__(self, board, coords, colour, offset):
-        self.clockwise = True
-        super(LimitedRotateShape, self).__init__(board, coords, colour, offset)
-    
-    def rotate(self, clockwise=True):
-        """
-        Clockwise, is used to indicate if the shape should rotate clockwise
-        or back again anti-clockwise. It is toggled.
-        """
-        super(LimitedRotateShape, self).rotate(clockwise=self.clockwise)
-        if self.clockwise:
-            self.clockwise = False
-        else:
-            self.clockwise = True
-
-
-class SquareShape(Shape):
-    """
-      0 1 2 .
-    0 X X
-    1 X X
-    2
-    .
-    """
-    def __init__(self, board, offset=None):
-        """
-        :param board: A TBoard canvas object that the shape is drawn on.
-        :param offset: Offset (x, y) to where the shape is initially drawn
-        """
-        coords = [Coord(0, 0), Coord(0, 1), Coord(1, 0), Coord(1, 1)]
-        super(SquareShape, self).__init__(board, coords, "red", offset)
-
-    HEIGHT = 2
-    WIDTH = 2
-
-    def rotate(self, clockwise=True):
-        """
-        Override the rotate method for the square shape to do exactly nothing!
-        """
-        pass
-
-
-class TShape(Shape):
-    """
-      0 1 2 .
-    0 X X X
-    1   X
-    2
-    .
-    """
-    def __init__(self, board, offset=None):
-        """
-        :param board: A TBoard canvas object that the shape is drawn on.
-        :param offset: Offset (x, y) to where the shape is initially drawn
-        """
-        coords = [Coord(1, 0), Coord(0, 0),  Coord(2, 0), Coord(1, 1)]
-        super(TShape, self).__init__(board, coords, "yellow", offset)
-
-    HEIGHT = 2
-    WIDTH = 3
-
-
-class LShape(Shape):
-    """
-      0 1 2 .
-    0 X
-    1 X
-    2 X X
-    .
-    """
-    def __init__(self, board, offset=None):
-        """
-        Create this shape
-        :param board: A TBoard canvas object that the shape is drawn on.
-        :param offset: Offset (x, y) to where the shape is initially drawn
-        """
-        coords = [Coord(0, 1), Coord(0, 0),  Coord(0, 2), Coord(1, 2)]
-        super(LShape, self).__init__(board, coords, "orange", offset)
-
-    HEIGHT = 3
-    WIDTH = 2
-
-
-class JShape(Shape):
-    """
-      0 1 2 .
-    0   X
-    1   X
-    2 X X
-    .
-    """
-    def __init__(self, board, offset=None):
-        """
-        :param board: A TBoard canvas object that the shape is drawn on.
-        :param offset: Offset (x, y) to where the shape is initially drawn
-        """
-        coords = [Coord(1, 1), Coord(1, 0),   Coord(0, 2), Coord(1, 2)]
-        super(JShape, self).__init__(board, coords, "green", offset)
-
-    HEIGHT = 3
-    WIDTH = 2
-
-
-class ZShape(LimitedRotateShape):
-    """
-      0 1 2 3 .
-    0   X
-    1 X X
-    2 X
-    .
-    """
-    def __init__(self, board, offset=None):
-        """
-        :param board: A TBoard canvas object that the shape is drawn on.
-        :param offset: Offset (x, y) to where the shape is initially drawn
-        """
-        coords = [Coord(0, 1), Coord(1, 0), Coord(1, 1), Coord(0, 2)]
-        super(ZShape, self).__init__(board, coords, "purple", offset)
-
-    HEIGHT = 3
-    WIDTH = 2
-
-
-class SShape(LimitedRotateShape):
+class GameController(object):
     """
-      0 1 2 3 .
-    0 X
-    1 X X
-    2   X
-    .
+    Receives GUI callback events for keypresses etc... and passes them on to
+    the game engine, then draws the events the engine sends back.
     """
-    def __init__(self, board, offset=None):
-        """
-        :param board: A TBoard canvas object that the shape is drawn on.
-        :param offset: Offset (x, y) to where the shape is initially drawn
-        """
-        coords = [Coord(0, 1), Coord(0, 0), Coord(1, 1), Coord(1, 2)]
-        super(SShape, self).__init__(board, coords, "cyan", offset)
-
-    HEIGHT = 3
-    WIDTH = 2
-
+    # Keys, and their actions, applied by poll_input() once a frame.
+    KEYS = (("Left", LEFT), ("Right", RIGHT), ("Down", DOWN), ("Up", DROP), ("a", CLOCKWISE), ("s", ANTICLOCKWISE))
+    FRAME = 16              # ms
+    UNDO_LEVELS = 100
+    RESTORED_COLOUR = "grey"
+    GARBAGE_COLOUR = "grey"
+    CALLBACKS = ("poll_input", "p_callback", "undo_callback", "save_callback", "load_callback", "new_game_fn")
+    STATS_INTERVAL = 1000   # ms
 
-class IShape(LimitedRotateShape):
-    """
-       0 1 .
-     0 X
-     1 X
-     2 X
-     3 X
-     .
-     """
-    def __init__(self, board, offset=None):
-        """
-        :param board: A TBoard canvas object that the shape is drawn on.
-        :param offset: Offset (x, y) to where the shape is initially drawn
+    def __init__(self, parent, record_dir=None, stats=None, das=DAS, arr=ARR, mode=UNIFORM, telemetry=None):
         """
-        coords = [Coord(0, 1), Coord(0, 0),   Coord(0, 2), Coord(0, 3)]
-        super(IShape, self).__init__(board, coords, "blue", offset)
-
-    HEIGHT = 4
-    WIDTH = 1
-
-
-class InfoPanel(Frame):
-    """The info panel has a grid layout manager and displays the following game info:
-    * The score
-    * The level
-    * Preview panel - next Tetrominoe.
-    * keyboard controls
-    * Quit button
-    * New game button
-    * Status e.g. if the game is Paused"""
-
-    def __init__(self, parent, new_game_fn, quit_fn):
-        """Init the info panel e.g. do all the setup for it."""
-        Frame.__init__(self, parent, bg="grey")
-
+        Intialise the game...
+        :param record_dir: Directory to record a replay of every game in, or None.
+        :param stats: tetris_stats.Stats to time the game with, and show in
+                      the info panel, or None.
+        :param telemetry: tetris_telemetry.TelemetryLog to log the metrics
+                          of every game to, or None.
+        :param das: Milliseconds a move key is held before it repeats.
+        :param arr: Milliseconds between the repeats of a held move key.
+        :param mode: How the tetrominoes are chosen, UNIFORM or BAG.
+        """
+        from tetris_gui import SCALE, OFFSET, TetrisBoard, InfoPanel
         self.parent = parent
-        self.score_var = StringVar()
-        self.level_var = StringVar()
-        self.state_var = StringVar()
-        self.update_score(0)
-        self.update_level(0)
-
-        my_font = tkFont.Font(root=self.parent, family="Times New Roman", size=16, weight="normal")
-        Label(self, text="Tetris TK", justify=CENTER, font=my_font, pady=5).pack(side=TOP, fill=X)
-
-        slf = LabelFrame(self, padx=5, pady=5)
-        slf.pack(side=TOP, fill=X)
-        Label(slf, text="Score:", anchor=W, justify=LEFT, width=10).grid(column=0, row=0)
-        score_lbl = Label(slf, bd=5, relief=SUNKEN, anchor=E, textvariable=self.score_var, width=10)
-        score_lbl.grid(column=1, row=0)
-
-        Label(slf, text="Level:", anchor=W, justify=LEFT, width=10).grid(column=0, row=1)
-        level_lbl = Label(slf, bd=5, relief=SUNKEN, anchor=E, textvariable=self.level_var, width=10)
-        level_lbl.grid(column=1, row=1)
-
-        self.preview = TBoard(self, scale=SCALE, max_x=4, max_y=4, offset=OFFSET)
-        self.preview.pack()
-
-        ctrl_frame = LabelFrame(self, text="Controls", padx=5, pady=5)
-        ctrl_frame.pack(side=TOP, fill=X)
-
-        Label(ctrl_frame, text="Pause:", anchor=W, justify=LEFT, width=8).grid(column=0, row=0, columnspan=2)
-        Label(ctrl_frame, text="P", width=5, relief=GROOVE).grid(column=2, row=0)
 
-        Label(ctrl_frame, text="   ").grid(column=2, row=1)  # blank line
-
-        Label(ctrl_frame, text="Drop:", anchor=W, justify=LEFT, width=8).grid(column=0, row=2, columnspan=2)
-        Label(ctrl_frame, text="^", width=5, relief=GROOVE).grid(column=3, row=2)
-
-        Label(ctrl_frame, text="Move:", anchor=W, justify=LEFT, width=8).grid(column=0, row=3, columnspan=2)
-        Label(ctrl_frame, text="<", width=5, relief=GROOVE).grid(column=2, row=3)
-        Label(ctrl_frame, text="v", width=5, relief=GROOVE).grid(column=3, row=3)
-        Label(ctrl_frame, text=">", width=5, relief=GROOVE).grid(column=4, row=3)
-
-        Label(ctrl_frame, text="Left").grid(column=2, row=4)
-        Label(ctrl_frame, text="Down").grid(column=3, row=4)
-        Label(ctrl_frame, text="Right").grid(column=4, row=4)
-
-        Label(ctrl_frame, text="Rotate:", anchor=W, justify=LEFT, width=8).grid(column=0, row=5, columnspan=2)
-        Label(ctrl_frame, text="A", width=5, relief=GROOVE).grid(column=2, row=5)
-        Label(ctrl_frame, text="S", width=5, relief=GROOVE).grid(column=4, row=5)
-
-        state_frame = LabelFrame(self, text="State", padx=5, pady=5)
-        state_frame.pack(side=TOP, fill=X)
-        Label(state_frame, textvariable=self.state_var, justify=CENTER, font=my_font).pack(side=TOP, fill=X)
-
-        btn_frame = LabelFrame(self, padx=5, pady=5)
-        btn_frame.pack(side=BOTTOM, fill=X)
-        self.new_game_bttn = Button(btn_frame, text="New Game", padx=5, pady=5, command=new_game_fn)
-        self.new_game_bttn.pack(side=BOTTOM, fill=X)
-        self.quit_bttn = Button(btn_frame, text="Quit", padx=5, pady=5, command=quit_fn)
-        self.quit_bttn.pack(side=TOP, fill=X)
-
-    def update_score(self, score):
-        self.score_var.set("{:>010d}".format(score))
-
-    def update_level(self, level):
-        self.level_var.set("{:>10d}".format(level))
+        self.engine = GameEngine(max_x=MAXX, max_y=MAXY, mode=mode)
+        self.engine.subscribe(self.engine_event)
+        self.scheduler = TickScheduler(lambda: self.engine.delay)
+        self.input = InputQueue(das, arr)
+        self.input_id = None
+
+        self.recorder = None
+        if record_dir:
+            self.recorder = Recorder(
+                self.engine,
+                lambda seed: os.path.join(record_dir, "tetris-{0}.ttr".format(seed))
+            )
 
-    def update_state(self, state):
-        self.state_var.set(state)
-        if state not in PLAYING:
-            self.new_game_bttn.config(state=NORMAL)
-        else:
-            self.new_game_bttn.config(state=DISABLED)
+        self.telemetry = None
+        if telemetry:
+            self.telemetry = GameTelemetry(self.engine, telemetry)
 
+        self.stats = stats
+        if stats:
+            self.instrument(stats)
 
-class GameController(object):
-    """
-    Main game loop and receives GUI callback events for keypresses etc...
-    """
-    def __init__(self, parent):
-        """
-        Intialise the game...
-        """
-        self.parent = parent
-        self.delay = 1000    # ms
-        
-        # lookup table
-        self.shapes = [SquareShape,
-                       TShape,
-                       LShape,
-                       JShape,
-                       ZShape,
-                       SShape,
-                       IShape]
-        
-        self.thresholds = level_thresholds(500, NO_OF_LEVELS)
-        
         self.board = TetrisBoard(
             parent,
             scale=SCALE,
@@ -678,151 +126,288 @@ class GameController(object):
             offset=OFFSET
             )
 
-        self.score = 0
-        self.level = 0
-
         self.info_panel = InfoPanel(parent, self.new_game_fn, self.quit_fn)
 
-        self.board.pack(side=LEFT, fill=Y)
-        self.info_panel.pack(side=LEFT, fill=Y)
+        self.board.pack(side="left", fill="y")
+        self.info_panel.pack(side="left", fill="y")
 
-        self.parent.bind("<Left>", self.left_callback)
-        self.parent.bind("<Right>", self.right_callback)
-        self.parent.bind("<Up>", self.up_callback)
-        self.parent.bind("<Down>", self.down_callback)
-        self.parent.bind("a", self.a_callback)
-        self.parent.bind("s", self.s_callback)
+        for key, action in self.KEYS:
+            self.parent.bind("<KeyPress-%s>" % key, lambda event, action=action: self.input.press(action, event.time))
+            self.parent.bind("<KeyRelease-%s>" % key,
+                             lambda event, action=action: self.input.release(action, event.time))
+        self.parent.bind("<FocusOut>", lambda event: self.input.clear())
         self.parent.bind("p", self.p_callback)
+        self.parent.bind("u", self.undo_callback)
+        self.parent.bind("<F5>", self.save_callback)
+        self.parent.bind("<F9>", self.load_callback)
 
-        self.state = READY
-        self.info_panel.update_state(self.state)
+        self.info_panel.update_state(self.engine.state)
         # must press 'New Game' to start.
-        # self.board.output()
         self.after_id = None
-        self.next_shape = None
-        self.preview_shape = None
-        self.shape = None
+        self.preview_ids = []
+        self.shape_ids = []
+        # Snapshots of the game at the start of each of the last tetrominoes.
+        self.history = deque(maxlen=self.UNDO_LEVELS)
+        self.saved = None
+
+        if stats:
+            self.parent.after(self.STATS_INTERVAL, self.show_stats)
+
+    def instrument(self, stats):
+        """
+        Time each tick and frame of key presses, and the undo, quick save
+        and quick load keys, up to the canvas being updated, and the checks
+        for complete rows. This has to be done before the callbacks are
+        bound.
+        """
+        update = self.parent.update_idletasks
+        stats.instrument(self, "move_my_shape", "tick", after=update)
+        for name in self.CALLBACKS:
+            stats.instrument(self, name, after=update)
+        stats.instrument(self.engine.board, "check_for_complete_row")
+
+    def show_stats(self):
+        self.stats.add("canvas_items", len(self.board.canvas.find_all()))
+        self.info_panel.show_stats(self.stats.report() + "\n\n" + self.stats.histograms())
+        self.parent.after(self.STATS_INTERVAL, self.show_stats)
+
+    @property
+    def state(self):
+        return self.engine.state
+
+    @property
+    def delay(self):
+        return self.engine.delay
+
+    def engine_event(self, event, *args):
+        """Draw an event from the game engine, by calling on_<event>(), if there is one"""
+        handler = getattr(self, "on_" + event, None)
+        if handler:
+            handler(*args)
+
+    def on_action(self, action):
+        if not self.history or self.history[-1].pieces != self.engine.pieces:
+            self.history.append(self.engine.snapshot())
+
+    def on_reset(self):
+        self.board.reset()
+        for block in self.shape_ids:
+            self.board.delete_block(block)
+        self.shape_ids = []
+        self.history.clear()
 
-    def new_game_fn(self):
-        self.delay = 1000    # ms
+    def on_restore(self, snapshot):
+        """Draw the restored board, the rest is drawn by the events that follow."""
         self.board.reset()
+        for block in self.shape_ids:
+            self.board.delete_block(block)
+        self.shape_ids = []
+        self.board.add_rows(snapshot.rows, self.RESTORED_COLOUR)
+
+    def on_preview(self, shape_cls):
+        for block in self.preview_ids:
+            self.info_panel.preview.delete_block(block)
+        preview_shape = shape_cls(
+            None,
+            offset=Coord(2-shape_cls.WIDTH/2.0, 2-shape_cls.HEIGHT/2.0)
+        )
+        self.preview_ids = self.info_panel.preview.add_shape(preview_shape.coords, shape_cls.COLOUR)
+
+    def on_spawn(self, shape):
+        self.shape_ids = self.board.add_shape(shape.coords, shape.COLOUR)
+        self.show_ghost(shape)
+
+    def on_move(self, shape, old_coords):
+        for block, old, new in zip(self.shape_ids, old_coords, shape.coords):
+            self.board.move_block(block, Coord(new.x - old.x, new.y - old.y))
+        self.show_ghost(shape)
+
+    def show_ghost(self, shape):
+        """Show where the tetrominoe would land if it was dropped."""
+        distance = shape.drop_distance()
+        self.board.show_ghost([Coord(c.x, c.y + distance) for c in shape.coords], shape.COLOUR)
+
+    def on_land(self, shape):
+        self.board.land_blocks(self.shape_ids, shape.coords)
+        self.shape_ids = []
+
+    def on_clear(self, rows):
+        self.board.delete_rows(rows)
+
+    def on_garbage(self, lines, gap):
+        self.board.add_garbage(lines, gap, self.GARBAGE_COLOUR)
+
+    def on_score(self, score):
+        self.info_panel.update_score(score)
+
+    def on_level(self, level):
+        self.info_panel.update_level(level)
 
-        # TODO: DRY
-        if self.preview_shape:
-            for block in self.preview_shape.blocks:
-                self.info_panel.preview.delete_block(block.id)
+    def on_state(self, state):
+        if state == GAME_OVER:
+            self.board.hide_ghost()
+            if self.after_id:
+                self.parent.after_cancel(self.after_id)
+                self.after_id = None
+            self.board.game_over_animation()
+        self.info_panel.update_state(state)
 
-        self.state = PLAYING
-        self.info_panel.update_state(self.state)
-        self.score = 0
-        self.level = 0
-        self.get_preview_shape()
-        self.shape = self.get_next_shape()
-        self.after_id = self.parent.after(self.delay, self.move_my_shape)
+    def new_game_fn(self):
+        if self.after_id:
+            self.parent.after_cancel(self.after_id)
+            self.after_id = None
+        self.engine.new_game()
+        self.scheduler.start()
+        self.schedule_tick()
+        self.start_input()
+
+    def schedule_tick(self):
+        self.after_id = self.parent.after(self.scheduler.wait_ms(), self.move_my_shape)
 
     def handle_move(self, direction):
-        # if you can't move then you've hit something
-        if not self.shape.move(direction):
-            # if your heading down then the shape has 'landed'
-            if direction == DOWN:
-                self.score += self.board.check_for_complete_row(
-                    self.shape.blocks
-                    )
-                self.info_panel.update_score(self.score)
-                del self.shape
-                self.shape = self.get_next_shape()
-
-                # If there is no more room, the game is over
-                if self.board.is_game_over():
-                    self.parent.after_cancel(self.after_id)
-                    self.state = GAME_OVER
-                    self.info_panel.update_state(self.state)
-                # or do we go up a level!
-                elif self.level < NO_OF_LEVELS and self.score >= self.thresholds[self.level]:
-                    self.level += 1
-                    self.info_panel.update_level(self.level)
-                    self.delay -= 100
-                    
-                # Signal that the shape has 'landed'
-                return False
-        return True
+        return self.engine.step(direction)
 
     def left_callback(self, event):
-        if self.state in PLAYING and self.shape:
-            self.handle_move(LEFT)
-        
+        self.engine.step(LEFT)
+
     def right_callback(self, event):
-        if self.state in PLAYING and self.shape:
-            self.handle_move(RIGHT)
+        self.engine.step(RIGHT)
 
     def up_callback(self, event):
-        if self.state in PLAYING and self.shape:
-            # drop the tetrominoe to the bottom
-            while self.handle_move(DOWN):
-                pass
+        # drop the tetrominoe to the bottom
+        self.engine.step(DROP)
 
     def down_callback(self, event):
-        if self.state in PLAYING and self.shape:
-            self.handle_move(DOWN)
-            
+        self.engine.step(DOWN)
+
     def a_callback(self, event):
-        if self.state in PLAYING and self.shape:
-            self.shape.rotate(clockwise=True)
-            
+        self.engine.step(CLOCKWISE)
+
     def s_callback(self, event):
-        if self.state in PLAYING and self.shape:
-            self.shape.rotate(clockwise=False)
-        
+        self.engine.step(ANTICLOCKWISE)
+
     def p_callback(self, event):
         """Pause play"""
         if self.state in PLAYING:
             self.parent.after_cancel(self.after_id)
-            self.state = PAUSED
-            self.info_panel.update_state(self.state)
+            self.scheduler.pause()
+            self.engine.step(PAUSE)
         elif self.state in PAUSED:
-            self.state = PLAYING
-            self.info_panel.update_state(self.state)
-            self.after_id = self.parent.after(self.delay, self.move_my_shape)
+            self.engine.step(PAUSE)
+            self.scheduler.resume()
+            self.schedule_tick()
+            self.start_input()
+
+    def undo_callback(self, event):
+        """Go back to the start of the last tetrominoe to land."""
+        if self.history and self.history[-1].pieces == self.engine.pieces:
+            self.history.pop()
+        if self.history:
+            self.restore(self.history[-1])
+
+    def save_callback(self, event):
+        if self.state in (PLAYING, PAUSED):
+            self.saved = self.engine.snapshot()
+
+    def load_callback(self, event):
+        if self.saved:
+            self.history.clear()
+            self.restore(self.saved)
+
+    def restore(self, snapshot):
+        """Restore a snapshot of the game, and carry on playing it."""
+        if self.after_id:
+            self.parent.after_cancel(self.after_id)
+            self.after_id = None
+        self.engine.restore(snapshot)
+        self.scheduler.start()
+        if self.state == PLAYING:
+            self.schedule_tick()
+            self.start_input()
+        elif self.state == PAUSED:
+            self.scheduler.pause()
+
+    def start_input(self):
+        """Forget any keys pressed while not playing, and poll for new ones."""
+        if self.input_id:
+            self.parent.after_cancel(self.input_id)
+        self.input.clear()
+        self.input_id = self.parent.after(self.FRAME, self.poll_input)
+
+    def poll_input(self):
+        """
+        Apply the key presses since the last frame, and the repeats of held
+        keys, which are all drawn together when Tk is next idle. Once a
+        repeated move fails, e.g. at the wall, the rest are skipped.
+
+        With stats, the time from each key press being queued to it being
+        drawn is added as key_latency.
+        """
+        self.input_id = None
+        if self.state != PLAYING:
+            return
+        failed = None
+        for action in self.input.poll():
+            if action != failed:
+                failed = None if self.engine.step(action) else action
+        if self.stats and self.input.pressed_at:
+            self.parent.update_idletasks()
+            now = self.input.clock()
+            for queued in self.input.pressed_at:
+                self.stats.add("key_latency", now - queued)
+        if self.state == PLAYING:
+            self.input_id = self.parent.after(self.FRAME, self.poll_input)
 
     def move_my_shape(self):
-        if self.state in PLAYING and self.shape:
-            self.handle_move(DOWN)
-            if self.state == PLAYING:
-                self.after_id = self.parent.after(self.delay, self.move_my_shape)
-            elif self.state == GAME_OVER:
-                self.after_id = self.parent.after(100, self.do_animation)
-
-    def do_animation(self):
-        if self.board.game_over_animation():
-            self.after_id = self.parent.after(50, self.do_animation)
-
-    def get_preview_shape(self):
-        """Randomly select a tetrominoe and put it in the preview window"""
-        self.next_shape = self.shapes[randint(0, len(self.shapes)-1)]
-        self.preview_shape = self.next_shape(
-            self.info_panel.preview,
-            offset=Coord(2-self.next_shape.WIDTH/2, 2-self.next_shape.HEIGHT/2)
-        )
-
-    def get_next_shape(self):
         """
-        Draw the next shape on the game board so it is in play and return its ref.
-        Delete the previous preview shape and get a new one, display it in the preview box.
+        Step the game for every tick that is due, which is more than one if
+        this was called late, then wait for the next one.
         """
-        this_shape = self.next_shape(self.board, offset=Coord(4, 0-self.next_shape.HEIGHT))
-        for block in self.preview_shape.blocks:
-            self.info_panel.preview.delete_block(block.id)
-        del self.preview_shape
-        self.get_preview_shape()
-        return this_shape
+        if self.state in PLAYING:
+            for _ in range(self.scheduler.due()):
+                self.engine.step(TICK)
+                if self.state != PLAYING:
+                    return
+            self.schedule_tick()
 
     def quit_fn(self):
+        if self.recorder:
+            self.recorder.close()
+        if self.telemetry:
+            self.telemetry.close()
         self.parent.quit()
 
 
-if __name__ == "__main__":
+def main():
+    import argparse
+    from tetris_gui import Tk
+
+    parser = argparse.ArgumentParser(description="Tetris Tk")
+    parser.add_argument("--record", metavar="DIR", default=None, help="record a replay of every game in DIR")
+    parser.add_argument("--bag", action="store_true", help="deal the tetrominoes from a shuffled bag of seven")
+    parser.add_argument("--das", type=int, default=DAS, help="ms a move key is held before it repeats")
+    parser.add_argument("--arr", type=int, default=ARR, help="ms between repeats of a held move key, 0 for instant")
+    parser.add_argument("--stats", action="store_true", help="time the game, and show the timings")
+    parser.add_argument("--stats-file", metavar="FILE", default=None, help="write the timings to FILE on quit")
+    parser.add_argument("--telemetry", metavar="FILE", default=None, help="append the metrics of every game to FILE")
+    parser.add_argument("--telemetry-format", choices=TELEMETRY_FORMATS, default="jsonl",
+                        help="format of the telemetry file")
+    args = parser.parse_args()
+
+    stats = Stats() if args.stats or args.stats_file else None
+    telemetry = TelemetryLog(args.telemetry, args.telemetry_format) if args.telemetry else None
+
     root = Tk()
     root.title("Tetris Tk")
-    theGame = GameController(root)
-    
+    theGame = GameController(root, record_dir=args.record, stats=stats, das=args.das, arr=args.arr,
+                             mode=BAG if args.bag else UNIFORM, telemetry=telemetry)
+
     root.mainloop()
+    if telemetry:
+        telemetry.close()
+    if stats and args.stats_file:
+        stats.dump(args.stats_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""Tetris Tournament - play the bot against itself, on every core.
+
+Games are headless GameEngine games, played by tetris_ai.AIPlayer, so they
+follow the same rules as the GUI: the level thresholds, the score for
+complete rows and the faster drop at each level. Each game has its own seed,
+game n of a tournament is seeded with seed + n, so a tournament can be
+played again with the same tetrominoes.
+
+The games are shared out to a pool of worker processes in chunks, so that
+sending the games and results between processes doesn't take longer than
+short games do, and the results are added to the summary as they come back
+instead of being kept.
+
+    python tetris_tournament.py --games 1000 --seed 1
+    python tetris_tournament.py --evaluator my_module:my_evaluator
+"""
+from __future__ import print_function, division
+
+import importlib
+import math
+import multiprocessing
+import time
+from collections import namedtuple
+
+from tetris_engine import MAXX, MAXY, UNIFORM, BAG, GameEngine
+from tetris_ai import AIPlayer, weighted_evaluator
+
+GameResult = namedtuple("GameResult", ['seed', 'score', 'level', 'pieces', 'delay'])
+
+# The player of each worker process, made once by init_worker().
+_player = None
+
+
+def load_evaluator(name):
+    """
+    :param name: 'module:function', or None for the default evaluator.
+    """
+    if not name:
+        return weighted_evaluator
+    module, function = name.split(":")
+    return getattr(importlib.import_module(module), function)
+
+
+def init_worker(evaluator, lookahead, max_x, max_y, mode=UNIFORM):
+    """Make the player for the games played by this worker process."""
+    global _player
+    engine = GameEngine(max_x, max_y, mode=mode)
+    _player = AIPlayer(engine, evaluator=load_evaluator(evaluator), lookahead=lookahead)
+
+
+def play_game(args):
+    """
+    Play one game in a worker process.
+    :param args: (seed, max_pieces)
+    :return: GameResult
+    """
+    seed, max_pieces = args
+    engine = _player.engine
+    _player.play_game(max_pieces, seed)
+    return GameResult(seed, engine.score, engine.level, engine.pieces, engine.delay)
+
+
+class Summary(object):
+    """
+    Summary of the results of the games, added one at a time.
+    """
+    def __init__(self):
+        self.games = 0
+        self.pieces = 0
+        self.min_score = None
+        self.max_score = None
+        self.mean_score = 0.0
+        self.m2 = 0.0
+        self.levels = {}
+
+    def add(self, result):
+        self.games += 1
+        self.pieces += result.pieces
+        if self.min_score is None or result.score < self.min_score:
+            self.min_score = result.score
+        if self.max_score is None or result.score > self.max_score:
+            self.max_score = result.score
+        # Welford's running mean and variance.
+        delta = result.score - self.mean_score
+        self.mean_score += delta / self.games
+        self.m2 += delta * (result.score - self.mean_score)
+        self.levels[result.level] = self.levels.get(result.level, 0) + 1
+
+    @property
+    def stdev_score(self):
+        if self.games < 2:
+            return 0.0
+        return math.sqrt(self.m2 / (self.games - 1))
+
+    def as_dict(self):
+        return {
+            "games": self.games,
+            "pieces": self.pieces,
+            "min_score": self.min_score,
+            "max_score": self.max_score,
+            "mean_score": self.mean_score,
+            "stdev_score": self.stdev_score,
+            "levels": dict((str(level), count) for level, count in sorted(self.levels.items())),
+        }
+
+
+def run(games, seed=0, workers=None, chunksize=None, evaluator=None, lookahead=True,
+        max_pieces=None, max_x=MAXX, max_y=MAXY, mode=UNIFORM, progress=None):
+    """
+    Play a tournament.
+    :param games: Number of games.
+    :param seed: Game n is seeded with seed + n.
+    :param workers: Number of worker processes, default one per CPU.
+    :param chunksize: Games sent to a worker at a time, default about four
+                      chunks per worker.
+    :param evaluator: 'module:function' of the evaluator, or None.
+    :param mode: How the tetrominoes are chosen, UNIFORM or BAG.
+    :param progress: Called as progress(summary, result) after each game.
+    :return: Summary
+    """
+    workers = workers or multiprocessing.cpu_count()
+    chunksize = chunksize or max(1, games // (workers * 4))
+
+    summary = Summary()
+    tasks = ((seed + n, max_pieces) for n in range(games))
+    pool = multiprocessing.Pool(workers, init_worker, (evaluator, lookahead, max_x, max_y, mode))
+    try:
+        for result in pool.imap_unordered(play_game, tasks, chunksize):
+            summary.add(result)
+            if progress:
+                progress(summary, result)
+    finally:
+        pool.close()
+        pool.join()
+    return summary
+
+
+def main():
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Play a tournament of headless Tetris Tk games.")
+    parser.add_argument("--games", type=int, default=100, help="number of games to play")
+    parser.add_argument("--seed", type=int, default=0, help="game n is seeded with seed + n")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, default one per CPU")
+    parser.add_argument("--chunksize", type=int, default=None, help="games sent to a worker at a time")
+    parser.add_argument("--evaluator", default=None, help="evaluator to use, as module:function")
+    parser.add_argument("--no-lookahead", action="store_true", help="don't search the next tetrominoe")
+    parser.add_argument("--max-pieces", type=int, default=None, help="stop a game after this many tetrominoes")
+    parser.add_argument("--bag", action="store_true", help="deal the tetrominoes from a shuffled bag of seven")
+    parser.add_argument("--verbose", action="store_true", help="print the result of every game")
+    args = parser.parse_args()
+
+    def progress(summary, result):
+        print("seed {0}: score {1}, level {2}, pieces {3}".format(
+            result.seed, result.score, result.level, result.pieces))
+
+    start = time.time()
+    summary = run(
+        args.games,
+        seed=args.seed,
+        workers=args.workers,
+        chunksize=args.chunksize,
+        evaluator=args.evaluator,
+        lookahead=not args.no_lookahead,
+        max_pieces=args.max_pieces,
+        mode=BAG if args.bag else UNIFORM,
+        progress=progress if args.verbose else None
+    )
+    elapsed = time.time() - start
+
+    result = summary.as_dict()
+    result["seconds"] = elapsed
+    result["pieces_per_second"] = summary.pieces / max(elapsed, 1e-9)
+    print(json.dumps(result, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()